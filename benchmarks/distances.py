@@ -0,0 +1,94 @@
+""" distances
+
+Benchmark of team travel distances on a synthetic full game history,
+comparing per-game geopy great_circle calls with the vectorized
+location.game_distances, in float64 and float32, and with reads from a
+travel.DistanceMatrix in a temporary directory. Distances must be within
+1 mile of geopy.
+
+Run from the project root:
+    python -m benchmarks.distances
+
+"""
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from geopy.distance import great_circle
+from src.features import location
+from src.features import travel
+
+N_GAMES = 200000
+N_TEAMS = 370
+N_VENUES = 2000
+
+
+def make_games(n_games=N_GAMES, n_teams=N_TEAMS, n_venues=N_VENUES, seed=0):
+    """Return team coordinate map and games at random US venues."""
+    rng = np.random.RandomState(seed)
+    team_ids = np.arange(1101, 1101 + n_teams)
+    team_map = {int(x): (rng.uniform(25, 49), rng.uniform(-124, -67))
+                for x in team_ids}
+
+    teams = rng.choice(team_ids, size=(n_games, 2))
+    df = pd.DataFrame({'t1_team_id': teams.min(axis=1),
+                       't2_team_id': teams.max(axis=1)})
+    venues = list(zip(rng.uniform(19, 61, n_venues),
+                      rng.uniform(-158, -67, n_venues)))
+    df['game_loc'] = [venues[i] for i in rng.randint(0, n_venues, n_games)]
+    return team_map, df
+
+
+def geopy_distances(df, team_map):
+    """Return games with distances from one great_circle call per team."""
+    def miles(game_loc, team_id):
+        return int(great_circle(game_loc, team_map[team_id]).miles)
+
+    df['t1_dist'] = [miles(x, t) for x, t in zip(df['game_loc'].values,
+                                                df['t1_team_id'].values)]
+    df['t2_dist'] = [miles(x, t) for x, t in zip(df['game_loc'].values,
+                                                df['t2_team_id'].values)]
+    return df
+
+
+def check(label, actual, expected, seconds, geopy_time):
+    """Return timing and largest difference from geopy distances."""
+    diff = np.abs(np.concatenate([
+        actual['t1_dist'].values - expected['t1_dist'].values,
+        actual['t2_dist'].values - expected['t2_dist'].values]))
+    return {'method': label,
+            'games': len(actual),
+            'geopy_sec': round(geopy_time, 3),
+            'numpy_sec': round(seconds, 4),
+            'speedup': round(geopy_time / max(seconds, 1e-9)),
+            'max_diff_miles': int(diff.max()),
+            'within_1_mile': bool(diff.max() <= 1)}
+
+
+def timed(func, *args, **kwargs):
+    """Return result of func and seconds taken."""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    team_map, games = make_games()
+    expected, geopy_time = timed(geopy_distances, games.copy(), team_map)
+
+    results = []
+    for dtype in [np.float64, np.float32]:
+        actual, seconds = timed(location.game_distances, games.copy(),
+                                team_map, dtype=dtype)
+        label = "haversine {}".format(np.dtype(dtype).name)
+        results.append(check(label, actual, expected, seconds, geopy_time))
+
+    with tempfile.TemporaryDirectory() as matrix_dir:
+        matrix = travel.DistanceMatrix(matrix_dir)
+        for label in ['matrix build', 'matrix read']:
+            actual, seconds = timed(location.game_distances, games.copy(),
+                                    team_map, matrix=matrix)
+            results.append(check(label, actual, expected, seconds,
+                                 geopy_time))
+
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,106 @@
+""" game_ids
+
+Benchmark of game date and identifier construction on synthetic games,
+comparing the row-by-row datetime implementation with the vectorized
+clean.date_from_daynum and clean.make_game_id. Both must return identical
+'date' and 'game_id' columns.
+
+Also compares a merge and isin filter on str 'game_id' with the same
+operations on int 'game_key', as used in features.location.
+
+Run from the project root:
+    python -m benchmarks.game_ids
+
+"""
+import datetime
+import time
+import numpy as np
+import pandas as pd
+from src.data import clean
+
+N_GAMES = 1000000
+
+
+def make_games(n_games=N_GAMES, seed=0):
+    """Return seasons data and random games with ordered team ids."""
+    seasons = pd.DataFrame({'season': np.arange(1985, 2020)})
+    seasons['dayzero'] = ["10/{}/{}".format(d, s - 1) for d, s in
+                          zip(np.arange(len(seasons)) % 28 + 1,
+                              seasons['season'])]
+
+    rng = np.random.RandomState(seed)
+    teams = rng.randint(1101, 1470, size=(n_games, 2))
+    df = pd.DataFrame({'season': rng.choice(seasons['season'], n_games),
+                       'daynum': rng.randint(0, 155, n_games),
+                       't1_team_id': teams.min(axis=1),
+                       't2_team_id': teams.max(axis=1)})
+    return seasons, df
+
+
+def rowwise_game_ids(df, seasons):
+    """Return games with date and game_id built one row at a time."""
+    dt_zero = map(lambda x: datetime.datetime.strptime(x, '%m/%d/%Y'),
+                  seasons['dayzero'])
+    season_map = {k: v for k, v in zip(seasons['season'].values, dt_zero)}
+
+    def compute_date(season, daynum):
+        dt_date = season_map[season] + datetime.timedelta(days=int(daynum))
+        return dt_date.strftime("%Y/%m/%d")
+
+    df['date'] = [compute_date(s, d) for s, d in
+                  zip(df['season'].values, df['daynum'].values)]
+
+    date_under = df['date'].str.replace('/', '_')
+    id_lower = df['t1_team_id'].astype(int).astype(str)
+    id_upper = df['t2_team_id'].astype(int).astype(str)
+    df['game_id'] = date_under + '_' + id_lower + '_' + id_upper
+    return df
+
+
+def vectorized_game_ids(df, seasons):
+    """Return games with date, game_id and game_key from clean."""
+    df = clean.date_from_daynum(df, seasons)
+    df = clean.make_game_id(df)
+    return df
+
+
+def join_timings(df, column, n_rounds=3):
+    """Return seconds for a merge and isin on one identifier column."""
+    right = df[[column]].sample(frac=0.5, random_state=0)
+    right['neutral'] = 1
+    select = right[column].values[::2]
+
+    start = time.time()
+    for i in range(n_rounds):
+        pd.merge(df[[column]], right, on=column, how='left')
+        df[column].isin(select)
+    seconds = (time.time() - start) / n_rounds
+
+    return {'column': column, 'join_isin_sec': round(seconds, 3),
+            'mbytes': round(df[column].memory_usage(deep=True) / 1e6, 1)}
+
+
+if __name__ == '__main__':
+    seasons, games = make_games()
+
+    start = time.time()
+    rowwise = rowwise_game_ids(games.copy(), seasons)
+    rowwise_time = time.time() - start
+
+    start = time.time()
+    vectorized = vectorized_game_ids(games.copy(), seasons)
+    vectorized_time = time.time() - start
+
+    same = (rowwise['date'].equals(vectorized['date']) and
+            rowwise['game_id'].equals(vectorized['game_id']))
+    result = {'games': len(games),
+              'rowwise_sec': round(rowwise_time, 3),
+              'vectorized_sec': round(vectorized_time, 3),
+              'speedup': round(rowwise_time / max(vectorized_time, 1e-9), 1),
+              'distinct_keys': vectorized['game_key'].nunique(),
+              'distinct_ids': vectorized['game_id'].nunique(),
+              'identical': same}
+    print(pd.DataFrame([result]).to_string(index=False))
+
+    joins = [join_timings(vectorized, x) for x in ['game_id', 'game_key']]
+    print(pd.DataFrame(joins).to_string(index=False))
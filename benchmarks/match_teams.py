@@ -0,0 +1,57 @@
+""" match_teams
+
+Benchmark of team name matching for the team_kp and team_ss sources,
+comparing TeamSource.match_team (full fuzzy scan per name) with the indexed
+NameMatcher. Both must return identical team ids.
+
+Run from the project root with database and S3 access:
+    python -m benchmarks.match_teams
+
+"""
+import time
+import pandas as pd
+from src.data import match
+from src.data.transfer import DBAssist
+from src.constants import SOURCE_ID_YEARS
+
+
+def id_data():
+    """Return master id data prepared as in match.run."""
+    with DBAssist.session() as dba:
+        names = dba.return_data('team_spellings')
+        teams = dba.return_data('teams')
+
+    id = pd.merge(names, teams, how='inner', on='team_id')
+    id['name_spelling'] = id['name_spelling'].str.replace(' ', '-')
+    id['name_spelling'] = id['name_spelling'].str.replace('.', '')
+    id = id.drop_duplicates()
+    return id
+
+
+def compare(source, id, cutoff=85):
+    """Return timings and count of differences for one source."""
+    id_map = source.create_id_map(id, SOURCE_ID_YEARS[source.label])
+
+    start = time.time()
+    scan = [source.match_team(x, id_map, cutoff=cutoff) for x in source.clean]
+    scan_time = time.time() - start
+
+    start = time.time()
+    matcher = match.NameMatcher(id_map)
+    indexed = matcher.match_many(source.clean, cutoff=cutoff)
+    indexed_time = time.time() - start
+
+    indexed = [team_id for team_id, score, method in indexed]
+    differ = sum([a != b for a, b in zip(scan, indexed)])
+
+    return {'source': source.label, 'names': len(source.clean),
+            'scan_sec': round(scan_time, 3),
+            'indexed_sec': round(indexed_time, 3),
+            'speedup': round(scan_time / max(indexed_time, 1e-9), 1),
+            'differ': differ}
+
+
+if __name__ == '__main__':
+    id = id_data()
+    results = [compare(source, id) for source in match.make_sources()]
+    print(pd.DataFrame(results).to_string(index=False))
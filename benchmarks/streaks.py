@@ -0,0 +1,94 @@
+""" streaks
+
+Benchmark of streak and recent form summaries on a synthetic league of
+350 teams playing 30 games in each of 40 seasons. Compares the groupby
+apply versions previously used in features.team, and pandas ewm, with the
+NumPy kernels in features.kernels. Outputs must match.
+
+Run from the project root:
+    python -m benchmarks.streaks
+
+"""
+import time
+import numpy as np
+import pandas as pd
+from src.features import kernels
+
+N_TEAMS = 350
+N_GAMES = 30
+N_SEASONS = 40
+ALPHA = 0.2
+
+
+def make_league(n_teams=N_TEAMS, n_games=N_GAMES, n_seasons=N_SEASONS,
+                seed=0):
+    """Return win indicators sorted by season, team and game number."""
+    rng = np.random.RandomState(seed)
+    season = np.repeat(np.arange(n_seasons), n_teams * n_games)
+    team_id = np.tile(np.repeat(np.arange(n_teams), n_games), n_seasons)
+    wins = rng.randint(0, 2, len(season))
+    return pd.DataFrame({'season': season, 'team_id': team_id,
+                         'team_win': wins})
+
+
+def streak(y):
+    """Compute number of consecutive events, as in features.team."""
+    streak = y * (y.groupby((y != y.shift()).cumsum()).cumcount() + 1)
+    return int(streak.iloc[-1])
+
+
+def longest(y):
+    """Compute longest number of consecutive events."""
+    streak = y * (y.groupby((y != y.shift()).cumsum()).cumcount() + 1)
+    return int(streak.max())
+
+
+def pct_last(group, n=5):
+    """Compute win percentage in last n games, as in features.team."""
+    wins = group.iloc[-n:].sum()
+    return wins / float(n)
+
+
+# groupby apply version of each summary, called with the grouped wins
+APPLY = {'current_streak': lambda gb: gb.apply(streak),
+         'longest_streak': lambda gb: gb.apply(longest),
+         'last_n_pct': lambda gb: gb.apply(lambda x: pct_last(x, n=10)),
+         'ewm_form': lambda gb: gb.apply(lambda x: x.ewm(alpha=ALPHA)
+                                         .mean().iloc[-1])}
+
+# kernel version of each summary, called with wins and group bounds
+KERNELS = {'current_streak': kernels.current_streak,
+           'longest_streak': kernels.longest_streak,
+           'last_n_pct': lambda y, s, e: kernels.last_n_pct(y, s, e, n=10),
+           'ewm_form': lambda y, s, e: kernels.ewm_form(y, s, e,
+                                                        alpha=ALPHA)}
+
+
+def compare(df):
+    """Return timings and agreement of each kernel with its apply version."""
+    results = []
+    for name in APPLY:
+        start = time.time()
+        gb = df.groupby(['season', 'team_id'])['team_win']
+        expected = APPLY[name](gb).values
+        apply_time = time.time() - start
+
+        start = time.time()
+        starts, ends = kernels.group_bounds(df['season'].values,
+                                            df['team_id'].values)
+        actual = KERNELS[name](df['team_win'].values, starts, ends)
+        kernel_time = time.time() - start
+
+        results.append({'kernel': name,
+                        'apply_sec': round(apply_time, 3),
+                        'kernel_sec': round(kernel_time, 4),
+                        'speedup': round(apply_time / max(kernel_time, 1e-9)),
+                        'match': np.allclose(expected, actual)})
+    return results
+
+
+if __name__ == '__main__':
+    league = make_league()
+    print("{} rows, {} team seasons".format(len(league),
+                                            N_TEAMS * N_SEASONS))
+    print(pd.DataFrame(compare(league)).to_string(index=False))
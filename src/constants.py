@@ -21,6 +21,16 @@ CONFIG_FILE= os.path.join(PATH_HERE, CONFIG)
 SCHEMA = 'data/table_schema.json'
 SCHEMA_FILE = os.path.join(PATH_HERE, SCHEMA)
 
+# local directory for cached copies of database tables and other data
+CACHE = '../.cache'
+CACHE_DIR = os.path.join(PATH_HERE, CACHE)
+
+# set environment variable UPSET_CACHE=0 to read from database only
+CACHE_ENABLED = os.environ.get('UPSET_CACHE', '1') != '0'
+
+# max total size of cached table files before oldest are removed
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
 SOURCE_ID_YEARS = {'team_ss': 1993,
                    'team_kp': 2002,
                    'team_pt': 2003,
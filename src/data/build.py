@@ -1,4 +1,3 @@
-import pandas as pd
 from src.data import transfer
 from src.data import clean
 from src.data import match
@@ -6,6 +5,7 @@ from src.data import players
 from src.features import roster
 from src.features import team
 from src.features import ratings
+from src.constants import MIN_YEAR
 import table_map
 
 dba = transfer.DBAssist()
@@ -13,7 +13,6 @@ dba = transfer.DBAssist()
 
 for table in table_map.KEY:
     file_name = '{}.csv'.format(table)
-    df = clean.s3_data(file_name)
     df = clean.convert_raw_file(file_name)
     table_name = table_map.KEY[table]['new_name']
 
@@ -22,14 +21,14 @@ for table in table_map.KEY:
     except:
         dba.create_from_data(table_name, df)
 
-    dba.insert_rows(table_name, df)
+    dba.replace_rows(table_name, df, infile=True)
 
 dba.create_from_schema('tourney_success')
 df = team.tourney_performance()
 dba.insert_rows('tourney_success', df)
 ratings = ratings.compile()
 dba.create_from_data('ratings', ratings)
-dba.insert_rows('ratings', ratings)
+dba.replace_rows('ratings', ratings, infile=True)
 
 
 team_key = match.run()
@@ -43,17 +42,18 @@ team_games = team.split_games_to_teams(games)
 
 # write to new table
 dba.create_from_data('team_game_stats', team_games)
-dba.insert_rows('team_game_stats', team_games)
+dba.replace_rows('team_game_stats', team_games, infile=True)
 
 
 dba.create_from_schema('team_season_stats')
 
-season_data = dba.return_data('seasons', modifier="WHERE season >= 2003")
-seasons = list(pd.unique(season_data['season']))
-seasons.sort()
+# summarize all seasons in one pass
+team_games = dba.return_data('team_game_stats',
+                             filters={'season__gte': MIN_YEAR})
+season_stats = team.summary_by_season(team_games)
+dba.insert_rows('team_season_stats', season_stats)
 
-for season in [2018]:
-    where_clause = "WHERE season = {}".format(season)
-    team_games = dba.return_data('team_game_stats', modifier=where_clause)
-    season_stats = team.summary_by_season(team_games)
-    dba.insert_rows('team_season_stats', season_stats)
+# running state used by team.update_season_stats for new games
+dba.create_from_schema('team_season_state')
+season_state = team.season_state(team_games)
+dba.insert_rows('team_season_state', season_state, batch_size=1000)
@@ -0,0 +1,237 @@
+""" cache
+
+A module for keeping local Parquet copies of data returned from the MySQL
+database, so unchanged tables are not transferred again on every run.
+
+Classes
+-------
+TableCache
+    A size-limited local store of dataframes keyed by query.
+
+Functions
+---------
+cache_key
+    Return a str key identifying a table query.
+
+"""
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from src.constants import CACHE_DIR
+from src.constants import CACHE_MAX_BYTES
+
+
+class TableCache():
+    """
+    A size-limited local store of dataframes keyed by query.
+
+    Each entry is a Parquet file saved with the signature of the source
+    table at the time it was read. An entry is only returned if the caller
+    supplies the same signature, so any change to the table invalidates it.
+    Once total size of all files exceeds max_bytes, the least recently used
+    entries are removed.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory where Parquet files and the index file are stored.
+    max_bytes : int
+        Maximum total size of all cached files.
+    index_file : str
+        Path of json file recording the entries in the cache.
+    hits : int
+        Count of requests returned from the cache.
+    misses : int
+        Count of requests not found or no longer valid.
+
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        """Initialize TableCache instance."""
+        self.cache_dir = os.path.join(cache_dir, 'tables')
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(self.cache_dir, 'index.json')
+        self.hits = 0
+        self.misses = 0
+
+    def read_index(self):
+        """Return dict of cache entries from the index file."""
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            index = {}
+        return index
+
+    def write_index(self, index):
+        """Replace the index file with the given dict of entries."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = "{}.{}".format(self.index_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_file, self.index_file)
+
+    def get(self, key, signature):
+        """
+        Return cached data for a key if the signature still matches.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query, from cache_key.
+        signature : str
+            Current signature of the source table.
+
+        Returns
+        -------
+        df : pandas DataFrame or None
+            Cached data, or None if there is no valid entry.
+
+        """
+        index = self.read_index()
+        entry = index.get(key)
+        if entry is None or entry['signature'] != signature:
+            self.misses += 1
+            return None
+
+        path = os.path.join(self.cache_dir, entry['file'])
+        try:
+            df = pd.read_parquet(path)
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+
+        entry['used'] = time.time()
+        self.write_index(index)
+        self.hits += 1
+
+        return df
+
+    def put(self, key, signature, table_name, df, sources=None):
+        """
+        Save data for a key and remove old entries if over the size limit.
+
+        Data that can't be written as Parquet is not cached.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query, from cache_key.
+        signature : str
+            Current signature of the source table.
+        table_name : str
+            Name of the source table.
+        df : pandas DataFrame
+            Data returned by the query.
+        sources : list of str, default None, optional
+            Names of other tables the query reads, such as in subqueries.
+
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_name = "{}_{}.parquet".format(table_name, key[:16])
+        path = os.path.join(self.cache_dir, file_name)
+        try:
+            df.to_parquet(path, index=False)
+        except (ImportError, TypeError, ValueError) as e:
+            print("not caching {}: {}".format(table_name, e))
+            return
+
+        index = self.read_index()
+        index[key] = {'file': file_name,
+                      'table': table_name,
+                      'sources': sources or [],
+                      'signature': signature,
+                      'bytes': os.path.getsize(path),
+                      'used': time.time()}
+        index = self.evict(index)
+        self.write_index(index)
+
+    def evict(self, index):
+        """
+        Return index after removing least recently used entries over limit.
+
+        Parameters
+        ----------
+        index : dict
+            Cache entries keyed by query key.
+
+        Returns
+        -------
+        index : dict
+            Remaining cache entries.
+
+        """
+        total = sum([entry['bytes'] for entry in index.values()])
+        by_use = sorted(index.items(), key=lambda x: x[1]['used'])
+
+        for key, entry in by_use:
+            if total <= self.max_bytes:
+                break
+            path = os.path.join(self.cache_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            total -= entry['bytes']
+            del index[key]
+
+        return index
+
+    def clear(self, table_name=None):
+        """
+        Remove cached entries.
+
+        Parameters
+        ----------
+        table_name : str, default None, optional
+            Remove only entries reading this table, directly or in a
+            subquery. If None, remove all.
+
+        """
+        index = self.read_index()
+        for key, entry in list(index.items()):
+            tables = [entry['table']] + entry.get('sources', [])
+            if table_name is None or table_name in tables:
+                path = os.path.join(self.cache_dir, entry['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+                del index[key]
+        self.write_index(index)
+
+
+def cache_key(table_name, subset=None, filters=None, categorize=False):
+    """
+    Return a str key identifying a table query.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of table in database.
+    subset : str or list of str, default None, optional
+        Name of table column or list of columns returned.
+    filters : dict, default None, optional
+        Conditions used to select rows.
+    categorize : bool, default False, optional
+        VARCHAR columns with few unique values returned as category.
+
+    Returns
+    -------
+    key : str
+        Hex digest unique to the combination of query parameters.
+
+    """
+    if filters is None:
+        filters = {}
+
+    # arrays and other iterables of values as lists for stable text
+    filter_items = []
+    for name in sorted(filters.keys()):
+        value = filters[name]
+        if hasattr(value, '__iter__') and not isinstance(value, str):
+            value = [str(x) for x in value]
+        else:
+            value = str(value)
+        filter_items.append([name, value])
+
+    text = json.dumps([table_name, subset, filter_items, categorize])
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return key
@@ -11,24 +11,71 @@ date_after_interval
 check_date
 season_of_date
 make_game_id
+make_game_key
+game_id_strings
+encode_game_key
+decode_game_key
+game_key_strings
+game_key_from_id
 date_from_daynum
+date_strings
+date_days
 order_team_ids
 team_scores
 map_teams
 team_score_map
 team_site_map
 has_columns
+s3_client
+s3_data
+s3_object_data
+s3_data_chunks
+read_s3_csv
+raw_dtypes
+read_options
+s3_objects_data
+s3_folder_data
+s3_folder_files
+s3_folder_objects
 
 """
 import os
+import json
+import hashlib
 import datetime
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 import boto3
-import io
+from botocore.exceptions import BotoCoreError
+from botocore.exceptions import ClientError
+import numpy as np
 import pandas as pd
 from fuzzywuzzy import process
 from fuzzywuzzy import fuzz
 from src.data import table_map
+from src.data.mirror import S3Mirror
 from src.constants import S3_BUCKET
+from src.constants import CACHE_ENABLED
+
+# bits used for each team id in integer game keys
+GAME_KEY_TEAM_BITS = 20
+
+# max number of S3 objects downloaded at the same time
+S3_WORKERS = 8
+
+# attempts and initial delay in seconds for failed S3 downloads
+S3_RETRIES = 4
+S3_BACKOFF = 0.5
+
+# default number of rows in each dataframe from s3_data_chunks
+S3_CHUNK_ROWS = 100000
+
+# options passed to read_csv for every S3 csv object
+S3_READ_OPTIONS = {'encoding': 'utf-8', 'encoding_errors': 'ignore'}
+
+# local copy of decoded S3 objects, revalidated by ETag
+MIRROR = S3Mirror() if CACHE_ENABLED else None
 
 
 def fuzzy_match(target, options, cutoff=85, with_score=False):
@@ -189,10 +236,16 @@ def date_from_daynum(df, seasons):
     """
     Return dataframe with string date computed from 'daynum' column.
 
+    Dates are computed as arrays of datetime64 days, adding 'daynum' to the 
+    'dayzero' of each row's season.
+
     Parameters
     ----------
     df: pandas dataframe
         Must contain 'season' and 'daynum' columns.
+    seasons: pandas dataframe
+        Must contain 'season' and 'dayzero' columns, with 'dayzero' as 
+        string date formatted as month/day/year.
 
     Returns
     -------
@@ -203,59 +256,275 @@ def date_from_daynum(df, seasons):
     # test if df contains required columns
     has_columns(df, ['daynum', 'season'])
 
-    # season dayzero to datetime to compute deltas
-    dt_zero = map(lambda x: datetime.datetime.strptime(x, '%m/%d/%Y'),
-                  seasons['dayzero'])
-    season_map = {k: v for k, v in zip(seasons['season'].values, dt_zero)}
-    
-    season_day = zip(df['season'].values, df['daynum'].values)
+    # season dayzero to datetime64 days to compute deltas
+    dt_zero = pd.to_datetime(seasons['dayzero'], format='%m/%d/%Y')
+    dt_zero = dt_zero.values.astype('datetime64[D]')
 
-    def compute_date(season_daynum, season_map):
-        dt_zero = season_map[season_daynum[0]]
-        dt_date = dt_zero + datetime.timedelta(days=season_daynum[1])
-        date = dt_date.strftime("%Y/%m/%d")
-        return date
+    # position of each row's season in seasons data
+    season_index = pd.Index(seasons['season'].values)
+    position = season_index.get_indexer(df['season'].values)
+    if (position < 0).any():
+        missing = pd.unique(df['season'].values[position < 0])
+        raise KeyError("seasons missing from seasons data: {}".format(missing))
 
-    df['date'] = map(lambda x: compute_date(x, season_map), season_day)
+    days = df['daynum'].values.astype(np.int64).astype('timedelta64[D]')
+    df['date'] = date_strings(dt_zero[position] + days)
 
     return df
 
 
+def date_strings(dates, date_format='%Y/%m/%d'):
+    """
+    Return array of str dates in project format from datetime64 dates.
+
+    Each distinct day is formatted once with strftime and shared by all
+    rows on that day.
+
+    Parameters
+    ----------
+    dates: numpy array of datetime64
+        Dates to format.
+    date_format: str, default '%Y/%m/%d'
+        Format passed to strftime.
+
+    Returns
+    -------
+    date_text: numpy array of str
+        Dates formatted as year/month/day, None where missing.
+
+    """
+    codes, uniques = pd.factorize(np.asarray(dates).astype('datetime64[D]'))
+    text = pd.DatetimeIndex(uniques).strftime(date_format)
+
+    # missing dates have code -1, which takes the trailing None
+    text = np.append(np.asarray(text, dtype=object), None)
+    date_text = text[codes]
+    return date_text
+
+
+def date_days(date_text):
+    """
+    Return array of datetime64 days from str dates in project format.
+
+    Each distinct string is parsed once.
+
+    Parameters
+    ----------
+    date_text: array of str
+        Dates formatted as year/month/day.
+
+    Returns
+    -------
+    dates: numpy array of datetime64
+        Parsed dates.
+
+    """
+    codes, uniques = pd.factorize(date_text)
+    parsed = pd.to_datetime(uniques, format='%Y/%m/%d').values
+    dates = parsed.astype('datetime64[D]')[codes]
+    return dates
+
+
 def make_game_id(df):
     """
     Return dataframe with a distinct game identifier column constructed from
     team numeric identifers and date of game.
 
+    Adds string identifier 'game_id' formatted as 'YYYY_MM_DD_t1_t2' for
+    display and storage, and integer identifier 'game_key' for joins.
+
     Parameters
     ----------
     df: pandas dataframe
         Must contain two numeric team identifer columns and a date column.
-        
+
+    Returns
+    -------
+    df: pandas dataframe
+        Dataframe with distinct game identifers in 'game_id' and
+        'game_key' columns.
+
+    """
+    df = make_game_key(df)
+
+    dates, id_lower, id_upper = decode_game_key(df['game_key'].values)
+    df['game_id'] = game_id_strings(dates, id_lower, id_upper)
+
+    return df
+
+
+def make_game_key(df):
+    """
+    Return dataframe with distinct integer game identifier 'game_key'
+    constructed from team numeric identifers and date of game.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        Must contain two numeric team identifer columns and a date column.
+
     Returns
     -------
     df: pandas dataframe
-        Dataframe with distinct game identifer in 'game_id' column.
+        Dataframe with distinct game identifers in 'game_key' column.
 
     """
     # ensure data has ordered numeric team identifiers
     need = ['t1_team_id', 't2_team_id', 'date']
     has_all = all(elem in df.columns for elem in need)
     assert(has_all is True), "df must contain {}".format(", ".join(need))
-    
-    # reformat date to use underscore separator
-    date_under = df['date'].str.replace('/', '_')
-    
-    # need team numeric identifier ints as strings
-    id_lower = df['t1_team_id'].astype(int).astype(str)
-    id_upper = df['t2_team_id'].astype(int).astype(str)
-    
-    # game_id is date combined with both teams
-    df['game_id'] = date_under + '_' + id_lower + '_' + id_upper
-    
-    # return data with new index
+
+    dates = date_days(df['date'].values)
+    id_lower = df['t1_team_id'].values.astype(np.int64)
+    id_upper = df['t2_team_id'].values.astype(np.int64)
+    df['game_key'] = encode_game_key(dates, id_lower, id_upper)
+
     return df
 
 
+def game_id_strings(dates, id_lower, id_upper):
+    """
+    Return array of str game identifiers from dates and team ids.
+
+    Parameters
+    ----------
+    dates: numpy array of datetime64
+        Date of each game.
+    id_lower: numpy array of int
+        Numerically lower team id of each game.
+    id_upper: numpy array of int
+        Numerically higher team id of each game.
+
+    Returns
+    -------
+    game_id: numpy array of str
+        Identifiers formatted as year_month_day_lower_upper.
+
+    """
+    # each distinct date and team id is formatted once
+    parts = [pd.Series(date_strings(dates, date_format='%Y_%m_%d'))]
+    for ids in [id_lower, id_upper]:
+        codes, uniques = pd.factorize(np.asarray(ids))
+        text = np.asarray(pd.Index(uniques).astype(str), dtype=object)
+        parts.append(pd.Series(text[codes]))
+
+    game_id = parts[0] + '_' + parts[1] + '_' + parts[2]
+    return game_id.values.astype(object)
+
+
+def encode_game_key(dates, id_lower, id_upper):
+    """
+    Return int64 game keys packed from game date and both team ids.
+
+    Bits 40 and up hold days since 1970-01-01, bits 20-39 hold the lower
+    team id and bits 0-19 the upper team id.
+
+    Parameters
+    ----------
+    dates: numpy array of datetime64
+        Date of each game.
+    id_lower: numpy array of int
+        Numerically lower team id of each game.
+    id_upper: numpy array of int
+        Numerically higher team id of each game.
+
+    Returns
+    -------
+    game_key: numpy array of int64
+        Distinct integer identifier of each game.
+
+    """
+    days = np.asarray(dates).astype('datetime64[D]').astype(np.int64)
+    id_lower = np.asarray(id_lower, dtype=np.int64)
+    id_upper = np.asarray(id_upper, dtype=np.int64)
+
+    limit = 1 << GAME_KEY_TEAM_BITS
+    if ((id_lower < 0) | (id_lower >= limit) |
+            (id_upper < 0) | (id_upper >= limit)).any():
+        raise ValueError("team ids must be in range 0 to {}".format(limit))
+
+    game_key = ((days << (2 * GAME_KEY_TEAM_BITS)) |
+                (id_lower << GAME_KEY_TEAM_BITS) | id_upper)
+    return game_key
+
+
+def decode_game_key(game_key):
+    """
+    Return game date and both team ids unpacked from int64 game keys.
+
+    Parameters
+    ----------
+    game_key: array of int
+        Game keys from encode_game_key.
+
+    Returns
+    -------
+    dates: numpy array of datetime64
+        Date of each game.
+    id_lower: numpy array of int64
+        Numerically lower team id of each game.
+    id_upper: numpy array of int64
+        Numerically higher team id of each game.
+
+    """
+    game_key = np.asarray(game_key, dtype=np.int64)
+    mask = (1 << GAME_KEY_TEAM_BITS) - 1
+
+    days = game_key >> (2 * GAME_KEY_TEAM_BITS)
+    dates = days.astype('datetime64[D]')
+    id_lower = (game_key >> GAME_KEY_TEAM_BITS) & mask
+    id_upper = game_key & mask
+
+    return dates, id_lower, id_upper
+
+
+def game_key_strings(game_key):
+    """
+    Return array of str game identifiers for display from int64 game keys.
+
+    Parameters
+    ----------
+    game_key: array of int
+        Game keys from encode_game_key.
+
+    Returns
+    -------
+    game_id: numpy array of str
+        Identifiers formatted as year_month_day_lower_upper.
+
+    """
+    dates, id_lower, id_upper = decode_game_key(game_key)
+    game_id = game_id_strings(dates, id_lower, id_upper)
+    return game_id
+
+
+def game_key_from_id(game_id):
+    """
+    Return array of int64 game keys parsed from str game identifiers.
+
+    Parameters
+    ----------
+    game_id: array of str
+        Identifiers formatted as year_month_day_lower_upper.
+
+    Returns
+    -------
+    game_key: numpy array of int64
+        Game keys as returned from encode_game_key.
+
+    """
+    game_id = pd.Series(game_id, dtype=object)
+    if len(game_id) == 0:
+        return np.array([], dtype=np.int64)
+
+    dates = pd.to_datetime(game_id.str.slice(0, 10), format='%Y_%m_%d')
+    ids = game_id.str.slice(11).str.split('_', expand=True)
+    game_key = encode_game_key(dates.values, ids[0].astype(np.int64).values,
+                               ids[1].astype(np.int64).values)
+
+    return game_key
+
+
 def order_team_ids(df, id_cols):
     """
     Return dataframe with ordered numeric team identifiers.
@@ -374,39 +643,291 @@ def has_columns(df, columns):
     assert(has_all is True), "df must contain {}".format(", ".join(columns))
 
 
+@functools.lru_cache(maxsize=None)
+def s3_client():
+    """
+    Return S3 client shared by all threads in the process.
+
+    Set environment variable S3_ENDPOINT_URL to use a local S3-compatible
+    server in place of AWS.
+
+    """
+    endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+    return boto3.client('s3', endpoint_url=endpoint_url)
+
+
 def s3_data(file_name):
-    s3_resource = boto3.resource('s3')    
-    s3_object = s3_resource.Object(bucket_name=S3_BUCKET, key=file_name)
-    response = s3_object.get()
-    data_string = response['Body'].read().decode('utf-8', 'ignore')
-    data = pd.read_csv(io.StringIO(data_string))
+    """Return dataframe from csv file stored in project S3 bucket."""
+    return s3_object_data(file_name)
+
+
+def s3_object_data(key, parse=None, etag=None, retries=S3_RETRIES,
+                   backoff=S3_BACKOFF):
+    """
+    Return dataframe from csv object in S3 bucket, retrying failed requests.
+
+    If the object is in the local mirror, the request is conditional on the
+    mirrored ETag and the body is only downloaded if the object changed.
+    Server errors and connection errors are retried with exponentially
+    increasing delay. Client errors such as a missing key are raised.
+
+    Parameters
+    ----------
+    key : str
+        Key of the object in the project S3 bucket.
+    parse : function, optional
+        Applied to the dataframe and key after reading the csv data.
+    etag : str, optional
+        Current ETag of the object if already known, such as from a folder
+        listing. If it matches the mirrored copy no request is made.
+    retries : int, default S3_RETRIES
+        Maximum number of attempts.
+    backoff : float, default S3_BACKOFF
+        Seconds to wait after the first failed attempt, doubled after each
+        following failure.
+
+    Returns
+    -------
+    data : pandas DataFrame
+        Contents of the csv object.
+
+    """
+    data = None
+    request = {'Bucket': S3_BUCKET, 'Key': key}
+    options = read_options(key)
+
+    if MIRROR is not None:
+        if etag is not None:
+            data = MIRROR.load(key, etag, options=options)
+        mirror_etag = MIRROR.etag(key, options)
+        if mirror_etag is not None:
+            request['IfNoneMatch'] = mirror_etag
+
+    for attempt in range(retries):
+        if data is not None:
+            break
+        try:
+            response = s3_client().get_object(**request)
+            data = read_s3_csv(response['Body'], key)
+            if MIRROR is not None:
+                MIRROR.save(key, response['ETag'], data, options=options)
+            break
+        except ClientError as e:
+            metadata = e.response.get('ResponseMetadata', {})
+            status = metadata.get('HTTPStatusCode', 0)
+            if status == 304:
+                # object not modified, use mirrored copy
+                data = MIRROR.load(key, options=options)
+                if data is None:
+                    request.pop('IfNoneMatch', None)
+                continue
+            if status < 500 or attempt == retries - 1:
+                raise
+        except BotoCoreError:
+            if attempt == retries - 1:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+    if data is None:
+        msg = "no data for {} after {} attempts".format(key, retries)
+        raise IOError(msg)
+
+    if parse is not None:
+        data = parse(data, key)
+
+    return data
+
+
+def s3_data_chunks(file_name, chunksize=S3_CHUNK_ROWS):
+    """
+    Yield dataframes with rows of a csv file in project S3 bucket.
+
+    The object body is parsed as it is downloaded, so memory use depends on
+    chunksize rather than size of the file. Chunks are read directly from
+    S3 and are not saved to the local mirror.
+
+    Parameters
+    ----------
+    file_name : str
+        Key of the object in the project S3 bucket.
+    chunksize : int, default S3_CHUNK_ROWS
+        Maximum number of rows in each dataframe.
+
+    Yields
+    ------
+    data : pandas DataFrame
+        Next chunk of rows from the file.
+
+    """
+    response = s3_client().get_object(Bucket=S3_BUCKET, Key=file_name)
+    reader = read_s3_csv(response['Body'], file_name, chunksize=chunksize)
+    for data in reader:
+        yield data
+
+
+def read_s3_csv(body, key, chunksize=None):
+    """
+    Return dataframe parsed from the body of an S3 csv object as a stream.
+
+    Parameters
+    ----------
+    body : botocore.response.StreamingBody
+        Body of the object from a get_object response.
+    key : str
+        Key of the object, used to find column types for raw files.
+    chunksize : int, optional
+        If given, return an iterator of dataframes with this many rows.
+
+    Returns
+    -------
+    data : pandas DataFrame or pandas TextFileReader
+        Contents of the object.
+
+    """
+    data = pd.read_csv(body, dtype=raw_dtypes(key), chunksize=chunksize,
+                       **S3_READ_OPTIONS)
     return data
 
 
-def s3_folder_data(folder_name):
-    folder_files = s3_folder_files(folder_name)
-    s3_resource = boto3.resource('s3')
-    df_list = []
-    for file in folder_files:
-        s3_object = s3_resource.Object(bucket_name=S3_BUCKET, key=file)
-        response = s3_object.get()
-        data_string = response['Body'].read().decode('utf-8', 'ignore')
-        file_data = pd.read_csv(io.StringIO(data_string))
-        file_data['file'] = file
-        df_list.append(file_data)
+def read_options(key):
+    """
+    Return str identifying the read options and column types of an object.
+
+    Parameters
+    ----------
+    key : str
+        Key of the object in S3 bucket.
+
+    Returns
+    -------
+    options : str
+        Hex digest of S3_READ_OPTIONS and the raw_dtypes of the object.
+
+    """
+    text = json.dumps([S3_READ_OPTIONS, raw_dtypes(key)], sort_keys=True,
+                      default=str)
+    options = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return options
+
+
+def raw_dtypes(key, key_map=table_map.KEY):
+    """
+    Return dict of column types for a raw file, or None if not specified.
+
+    Parameters
+    ----------
+    key : str
+        Key of the object in S3 bucket, such as 'MTeams.csv'.
+    key_map : dict, default table_map.KEY
+        Contains settings for each raw file, with raw file name as key.
+
+    Returns
+    -------
+    dtypes : dict or None
+        Raw column names as keys and types as values.
+
+    """
+    raw_name = os.path.basename(key).replace('.csv', '')
+    dtypes = key_map.get(raw_name, {}).get('dtypes')
+    return dtypes
+
+
+def s3_objects_data(keys, parse=None, etags=None, max_workers=S3_WORKERS):
+    """
+    Return list of dataframes from csv objects downloaded concurrently.
+
+    Parameters
+    ----------
+    keys : list of str
+        Keys of the objects in the project S3 bucket.
+    parse : function, optional
+        Applied to each dataframe and key in the worker thread.
+    etags : list of str, optional
+        Current ETag of each object, in the same order as keys.
+    max_workers : int, default S3_WORKERS
+        Maximum number of objects downloaded at the same time.
+
+    Returns
+    -------
+    df_list : list of pandas DataFrame
+        Contents of each object, in the same order as keys.
+
+    """
+    if etags is None:
+        etags = [None] * len(keys)
+    def get_data(key, etag):
+        return s3_object_data(key, parse=parse, etag=etag)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        df_list = list(executor.map(get_data, keys, etags))
+    return df_list
+
+
+def s3_folder_data(folder_name, max_workers=S3_WORKERS):
+    """
+    Return dataframe combining all csv files in a folder of S3 bucket.
+
+    Parameters
+    ----------
+    folder_name : str
+        Name of the folder in the project S3 bucket.
+    max_workers : int, default S3_WORKERS
+        Maximum number of files downloaded at the same time.
+
+    Returns
+    -------
+    df : pandas DataFrame
+        Rows of all files, with the key of the source file in 'file' column.
+
+    """
+    folder_files, etags = s3_folder_objects(folder_name)
+    df_list = s3_objects_data(folder_files, parse=label_file, etags=etags,
+                              max_workers=max_workers)
     df = pd.concat(df_list)
     return df
 
 
+def label_file(df, key):
+    """Return dataframe with source file key added in 'file' column."""
+    df['file'] = key
+    return df
+
+
 def s3_folder_files(folder_name):
-    s3_resource = boto3.resource('s3')
-    s3_bucket = s3_resource.Bucket(S3_BUCKET)
-    file_prefix = "{}/".format(folder_name)
-    files = [obj.key for obj in s3_bucket.objects.filter(Prefix=file_prefix)]
-    files.remove(file_prefix)
+    """Return list of keys for all files in a folder of S3 bucket."""
+    files, etags = s3_folder_objects(folder_name)
     return files
 
 
+def s3_folder_objects(folder_name):
+    """
+    Return keys and ETags for all files in a folder of S3 bucket.
+
+    Parameters
+    ----------
+    folder_name : str
+        Name of the folder in the project S3 bucket.
+
+    Returns
+    -------
+    files : list of str
+        Keys of the files in the folder.
+    etags : list of str
+        ETag of each file, in the same order as files.
+
+    """
+    file_prefix = "{}/".format(folder_name)
+    paginator = s3_client().get_paginator('list_objects_v2')
+    objects = []
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=file_prefix):
+        objects.extend(page.get('Contents', []))
+    # folder itself is listed as an object
+    objects = [x for x in objects if x['Key'] != file_prefix]
+    files = [x['Key'] for x in objects]
+    etags = [x['ETag'] for x in objects]
+    return files, etags
+
+
 def convert_raw_file(file_name, key=table_map.KEY):
     df = s3_data(file_name)
     raw_name = file_name.replace('.csv', '')
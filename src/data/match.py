@@ -7,19 +7,37 @@ Classes
 -------
 TeamSource
     A container for a unique source of team name data. 
+NameMatcher
+    An index of team name versions for fast exact and fuzzy matching.
+MatchStore
+    A persisted record of past team name matches.
 
 Functions
 ---------
 run
     Return df with numeric ids and team names from each unique source.
+resolve_ids
+    Assign numeric ids to names from all sources using worker processes.
     
 """
 import re
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from rapidfuzz.distance import Indel
+from rapidfuzz.process import cdist
 from src.data import clean
-from transfer import DBAssist
+from src.data.transfer import DBAssist
 from src.constants import SOURCE_ID_YEARS
 
+# number of names matched in each task sent to a worker process
+SHARD_SIZE = 250
+
+# NameMatcher instances by source label, set in each worker process
+WORKER_MATCHERS = {}
+
 class TeamSource():
     """
     A container for a unique source of team name data.
@@ -91,7 +109,7 @@ class TeamSource():
         if teams is None:
             teams = self.unique
         
-        self.clean = map(lambda name: self.format_school(name), teams)
+        self.clean = [self.format_school(name) for name in teams]
 
         return self
 
@@ -120,7 +138,7 @@ class TeamSource():
         
         return name_clean
 
-    def find_ids(self, id_data, cutoff=85):
+    def find_ids(self, id_data, cutoff=85, store=None):
         """
         Return instance with team_id attribute containing the corresponding
         numeric team id for source teams.
@@ -130,6 +148,9 @@ class TeamSource():
         id_data: pandas DataFrame
             Master id data containing 'name_spelling', 'team_id', and
             'lastd1season' columns.
+        store: MatchStore, optional
+            Record of past matches. If given, only names that are new or 
+            whose candidate name versions changed are matched again.
 
         Returns
         -------
@@ -139,8 +160,13 @@ class TeamSource():
         """
         min_year = SOURCE_ID_YEARS[self.label]
         id_map = self.create_id_map(id_data, min_year=min_year)
-        self.team_id = map(lambda x: self.match_team(x, id_map, cutoff=cutoff),
-                           self.clean)
+        matcher = NameMatcher(id_map)
+        if store is None:
+            matches = matcher.match_many(self.clean, cutoff=cutoff)
+        else:
+            matches = store.match(self.label, matcher, self.clean,
+                                  cutoff=cutoff)
+        self.team_id = [team_id for team_id, score, method in matches]
         return self
 
     def create_id_map(self, df, min_year):
@@ -213,6 +239,382 @@ class TeamSource():
         return self
 
 
+class NameMatcher():
+    """
+    An index of team name versions for fast exact and fuzzy matching.
+
+    Returns the same results as TeamSource.match_team, which uses
+    clean.fuzzy_match: names are processed as in fuzzywuzzy's default
+    processor and scored with the Levenshtein ratio (with substitutions
+    counted as a deletion and an insertion), rounded to an int. Ties go to 
+    the first name in id_map.
+    
+    Candidates are pruned by length, since a name can't reach the cutoff 
+    against a name of very different length, and the remaining candidates
+    for all names of the same length are scored together in one
+    rapidfuzz cdist call.
+
+    Attributes
+    ----------
+    id_map: dict
+        Dict mapping unique team name versions to numeric identifiers.
+    names: list of str
+        Team name versions in id_map order.
+    team_ids: numpy array
+        Numeric identifier for each name.
+    processed: numpy array of str
+        Names processed for fuzzy scoring, sorted by length.
+    lengths: numpy array of int
+        Length of each processed name, sorted.
+    order: numpy array of int
+        Position in names of each processed name.
+    workers: int
+        Threads used by each cdist call, -1 for all cores. Set to 1 in
+        worker processes, which already use all cores together.
+
+    """
+    def __init__(self, id_map, workers=-1):
+        """Initialize NameMatcher instance."""
+        self.id_map = id_map
+        self.workers = workers
+        self.names = list(id_map.keys())
+        self.team_ids = np.array(list(id_map.values()), dtype=object)
+
+        processed = [self.process(name) for name in self.names]
+        lengths = np.array([len(name) for name in processed], dtype=np.int64)
+        self.order = np.argsort(lengths, kind='stable')
+        self.lengths = lengths[self.order]
+        self.processed = np.array(processed, dtype=object)[self.order]
+
+    def process(self, name):
+        """Return name processed as in fuzzywuzzy's full_process."""
+        name = re.sub(r'(?ui)\W', ' ', str(name))
+        return name.lower().strip()
+
+    def match(self, team, cutoff=85):
+        """
+        Return team numeric identifier from exact or fuzzy string match.
+
+        Parameters
+        ----------
+        team: str
+            Team name from data source reformatted for optimal matching.
+        cutoff: int, optional, min 1, max 100
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        result: tuple of (team_id, score, method)
+            Team numeric identifer, or None if no match meets the cutoff,
+            with the similarity score and method 'exact', 'fuzzy' or 'none'.
+
+        """
+        return self.match_many([team], cutoff=cutoff)[0]
+
+    def match_many(self, teams, cutoff=85):
+        """
+        Return team numeric identifiers for a list of team names.
+
+        Parameters
+        ----------
+        teams: list of str
+            Team names from data source reformatted for optimal matching.
+        cutoff: int, optional, min 1, max 100
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        results: list of tuple of (team_id, score, method)
+            Result for each team, in the same order as teams.
+
+        """
+        results = [None] * len(teams)
+        fuzzy = []
+
+        for i, team in enumerate(teams):
+            if team in self.id_map:
+                results[i] = (self.id_map[team], 100, 'exact')
+            else:
+                fuzzy.append(i)
+
+        queries = [self.process(teams[i]) for i in fuzzy]
+        query_lengths = np.array([len(q) for q in queries], dtype=np.int64)
+
+        for length in np.unique(query_lengths):
+            positions = np.flatnonzero(query_lengths == length)
+            batch = [queries[p] for p in positions]
+            scores, best = self.score_batch(batch, length, cutoff)
+
+            for p, score, index in zip(positions, scores, best):
+                i = fuzzy[p]
+                if index < 0 or score < cutoff:
+                    results[i] = (None, int(score), 'none')
+                else:
+                    results[i] = (self.team_ids[index], int(score), 'fuzzy')
+
+        return results
+
+    def versions(self, teams, cutoff=85):
+        """
+        Return str identifying the candidate name versions for each team.
+
+        A team's result can only change if a name version with a length in
+        its candidate range is added, removed, or assigned a new id, so the
+        version is a hash of those candidates in id_map order.
+
+        Parameters
+        ----------
+        teams: list of str
+            Team names from data source reformatted for optimal matching.
+        cutoff: int, optional, min 1, max 100
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        versions: list of str
+            Hex digest for each team, shared by teams of the same length.
+
+        """
+        by_length = {}
+        versions = []
+        for team in teams:
+            length = len(self.process(team))
+            if length not in by_length:
+                keep = self.candidates(length, cutoff)
+                positions = np.sort(self.order[keep])
+                items = ["{}\t{}".format(self.names[i], self.team_ids[i])
+                         for i in positions]
+                text = "{}\n{}".format(cutoff, "\n".join(items))
+                digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                by_length[length] = digest
+            versions.append(by_length[length])
+        return versions
+
+    def candidates(self, length, cutoff):
+        """
+        Return positions in sorted arrays of names that could reach cutoff.
+
+        Parameters
+        ----------
+        length: int
+            Length of the processed name to match.
+        cutoff: int
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        keep: numpy array of int
+            Positions of candidates in processed and lengths attributes.
+
+        """
+        # upper bound of ratio is 2 * min(len) / (sum of len)
+        lensum = self.lengths + length
+        upper = np.round(100 * (2.0 * np.minimum(self.lengths, length)) /
+                         np.maximum(lensum, 1))
+        upper[lensum == 0] = 100
+        keep = np.flatnonzero(upper >= cutoff)
+        return keep
+
+    def score_batch(self, queries, length, cutoff):
+        """
+        Return best score and name position for processed names of a length.
+
+        Parameters
+        ----------
+        queries: list of str
+            Processed names, all with the same length.
+        length: int
+            Length of each name in queries.
+        cutoff: int
+            Minimum similarity score, used to prune candidates by length.
+
+        Returns
+        -------
+        best_score: numpy array of int
+            Highest score for each query.
+        best_index: numpy array of int
+            Position in names of the first name with the highest score, or 
+            -1 if no candidates remain after pruning.
+
+        """
+        keep = self.candidates(length, cutoff)
+        lensum = self.lengths + length
+
+        n = len(queries)
+        if len(keep) == 0:
+            return np.zeros(n, dtype=np.int64), np.full(n, -1)
+
+        choices = list(self.processed[keep])
+        distance = cdist(queries, choices, scorer=Indel.distance,
+                         dtype=np.int64, workers=self.workers)
+        lensum = lensum[keep][np.newaxis, :]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = (lensum - distance) / lensum.astype(np.float64)
+        ratio[:, lensum[0] == 0] = 1.0
+        scores = np.round(100 * ratio).astype(np.int64)
+
+        # on ties keep first name in original order, as max() would
+        best_score = scores.max(axis=1)
+        positions = np.where(scores == best_score[:, np.newaxis],
+                             self.order[keep][np.newaxis, :], len(self.names))
+        best_index = positions.min(axis=1)
+
+        return best_score, best_index
+
+
+class MatchStore():
+    """
+    A persisted record of past team name matches.
+
+    Matches are stored in a database table keyed by source label, the
+    reformatted team name, and the version of candidate name versions from
+    NameMatcher.versions. A stored match is reused while the version is 
+    unchanged.
+
+    Attributes
+    ----------
+    table_name: str
+        Name of the database table holding stored matches.
+    hits: int
+        Count of names with a stored match reused.
+    misses: int
+        Count of names matched again.
+
+    """
+    def __init__(self, table_name='match_store'):
+        """Initialize MatchStore instance."""
+        self.table_name = table_name
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, label):
+        """
+        Return dict of stored matches for a source.
+
+        Parameters
+        ----------
+        label: str
+            Label of the team name source.
+
+        Returns
+        -------
+        stored: dict
+            Keys are tuples (name, version), values are tuples
+            (team_id, score, method).
+
+        """
+        with DBAssist.session() as dba:
+            if not dba.table_exists(self.table_name):
+                dba.create_from_schema(self.table_name)
+            df = dba.return_data(self.table_name, filters={'label': label})
+
+        stored = {}
+        columns = ['name', 'version', 'team_id', 'score', 'method']
+        for name, version, team_id, score, method in df[columns].values:
+            if pd.isnull(team_id):
+                team_id = None
+            stored[(name, version)] = (team_id, score, method)
+
+        return stored
+
+    def save(self, label, names, versions, results):
+        """
+        Replace stored matches for the given names of a source.
+
+        Parameters
+        ----------
+        label: str
+            Label of the team name source.
+        names: list of str
+            Reformatted team names that were matched.
+        versions: list of str
+            Candidate version for each name.
+        results: list of tuple of (team_id, score, method)
+            Match result for each name.
+
+        """
+        if len(names) == 0:
+            return
+
+        rows = [[label, name, version, team_id, score, method]
+                for name, version, (team_id, score, method)
+                in zip(names, versions, results)]
+        columns = ['label', 'name', 'version', 'team_id', 'score', 'method']
+        df = pd.DataFrame(rows, columns=columns)
+
+        with DBAssist.session() as dba:
+            filters = {'label': label, 'name__in': names}
+            dba.delete_rows(self.table_name, filters=filters)
+            dba.insert_rows(self.table_name, df, batch_size=1000)
+
+    def match(self, label, matcher, teams, cutoff=85):
+        """
+        Return team numeric identifiers, reusing stored matches if valid.
+
+        Parameters
+        ----------
+        label: str
+            Label of the team name source.
+        matcher: NameMatcher
+            Index of team name versions used for new matches.
+        teams: list of str
+            Team names from data source reformatted for optimal matching.
+        cutoff: int, optional, min 1, max 100
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        results: list of tuple of (team_id, score, method)
+            Result for each team, in the same order as teams.
+
+        """
+        results, versions = self.lookup(label, matcher, teams, cutoff=cutoff)
+        redo = [i for i, result in enumerate(results) if result is None]
+
+        redo_teams = [teams[i] for i in redo]
+        redo_versions = [versions[i] for i in redo]
+        new_results = matcher.match_many(redo_teams, cutoff=cutoff)
+        for i, result in zip(redo, new_results):
+            results[i] = result
+
+        self.save(label, redo_teams, redo_versions, new_results)
+
+        return results
+
+    def lookup(self, label, matcher, teams, cutoff=85):
+        """
+        Return stored matches that are still valid for a list of teams.
+
+        Parameters
+        ----------
+        label: str
+            Label of the team name source.
+        matcher: NameMatcher
+            Index of current team name versions.
+        teams: list of str
+            Team names from data source reformatted for optimal matching.
+        cutoff: int, optional, min 1, max 100
+            Minimum similarity score required for a fuzzy match.
+
+        Returns
+        -------
+        results: list of tuple or None
+            Stored result for each team, or None if it must be matched.
+        versions: list of str
+            Candidate version for each team.
+
+        """
+        stored = self.load(label)
+        versions = matcher.versions(teams, cutoff=cutoff)
+
+        results = [stored.get(key) for key in zip(teams, versions)]
+        n_redo = sum([result is None for result in results])
+        self.hits += len(teams) - n_redo
+        self.misses += n_redo
+
+        return results, versions
+
+
 def run():
     """
     Top-level function to create a key with numeric team ids and team names
@@ -225,10 +627,9 @@ def run():
         containing the corresponding team name for each team name source.
 
     """
-    dba = DBAssist()
-    names = dba.return_data('team_spellings')
-    teams = dba.return_data('teams')
-    dba.close()
+    with DBAssist.session() as dba:
+        names = dba.return_data('team_spellings')
+        teams = dba.return_data('teams')
 
     id = pd.merge(names, teams, how='inner', left_on='team_id',
                   right_on='team_id')
@@ -243,7 +644,10 @@ def run():
     # initialize TeamSource instance for each of the sources
     sources = make_sources()
     # for each source find the numeric id for each team
-    sources = [source.find_ids(id) for source in sources]
+    # reuse stored matches for names with unchanged candidates
+    store = MatchStore()
+    sources = resolve_ids(sources, id, store=store)
+    print("match store: {} hits, {} misses".format(store.hits, store.misses))
     # make a df key for each source containing team names and numeric ids
     sources = [source.make_key() for source in sources]
     # combine all source keys into one 
@@ -252,6 +656,114 @@ def run():
     return key
 
 
+def resolve_ids(sources, id_data, cutoff=85, store=None, max_workers=None):
+    """
+    Return sources with team_id attributes set, matching names in parallel.
+
+    Names still needing a match from all sources are split into shards and
+    matched in a pool of worker processes. Each worker receives the 
+    NameMatcher for every source once, when it starts. Shard results are
+    collected in submission order, so results are identical to matching
+    each source with TeamSource.find_ids.
+
+    Parameters
+    ----------
+    sources: list of TeamSource instances
+        Sources with clean attributes set.
+    id_data: pandas DataFrame
+        Master id data containing 'name_spelling', 'team_id', and
+        'lastd1season' columns.
+    cutoff: int, optional, min 1, max 100
+        Minimum similarity score required for a fuzzy match.
+    store: MatchStore, optional
+        Record of past matches. If given, only names that are new or 
+        whose candidate name versions changed are matched again.
+    max_workers: int, optional
+        Number of worker processes. Default is the number of CPUs. If 1,
+        names are matched in the current process.
+
+    Returns
+    -------
+    sources: list of TeamSource instances
+        Sources with team_id attributes set.
+
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    matchers = {}
+    results = {}
+    versions = {}
+    tasks = []
+
+    for source in sources:
+        label = source.label
+        id_map = source.create_id_map(id_data, SOURCE_ID_YEARS[label])
+        matchers[label] = NameMatcher(id_map)
+
+        if store is None:
+            results[label] = [None] * len(source.clean)
+        else:
+            results[label], versions[label] = store.lookup(label,
+                                                           matchers[label],
+                                                           source.clean,
+                                                           cutoff=cutoff)
+
+        # split positions of names needing a match into shards
+        redo = [i for i, x in enumerate(results[label]) if x is None]
+        for start in range(0, len(redo), SHARD_SIZE):
+            tasks.append((label, redo[start:start + SHARD_SIZE]))
+
+    source_map = {source.label: source for source in sources}
+    shard_names = [[source_map[label].clean[i] for i in positions]
+                   for label, positions in tasks]
+    shard_labels = [label for label, positions in tasks]
+    cutoffs = [cutoff] * len(tasks)
+
+    if max_workers == 1 or len(tasks) <= 1:
+        init_worker(matchers, workers=-1)
+        shard_results = list(map(match_shard, shard_labels, shard_names,
+                                 cutoffs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=init_worker,
+                                 initargs=(matchers, 1)) as executor:
+            shard_results = list(executor.map(match_shard, shard_labels,
+                                              shard_names, cutoffs))
+
+    # merge shard results back to source positions
+    new = {label: ([], [], []) for label in matchers}
+    for (label, positions), names, shard in zip(tasks, shard_names,
+                                                shard_results):
+        for i, name, result in zip(positions, names, shard):
+            results[label][i] = result
+            new[label][0].append(name)
+            new[label][1].append(versions[label][i] if store else None)
+            new[label][2].append(result)
+
+    for source in sources:
+        label = source.label
+        if store is not None:
+            store.save(label, *new[label])
+        source.team_id = [team_id for team_id, score, method
+                          in results[label]]
+
+    return sources
+
+
+def init_worker(matchers, workers=1):
+    """Set the NameMatcher for each source label in a worker process."""
+    for matcher in matchers.values():
+        matcher.workers = workers
+    WORKER_MATCHERS.clear()
+    WORKER_MATCHERS.update(matchers)
+
+
+def match_shard(label, names, cutoff):
+    """Return match results for a shard of names from one source."""
+    return WORKER_MATCHERS[label].match_many(names, cutoff=cutoff)
+
+
 def make_sources():
     """
     Returns list of TeamSource instances prepared for finding team numeric
@@ -262,8 +774,6 @@ def make_sources():
     sources: list of TeamSource instances
 
     """ 
-    dba = DBAssist()
-
     # kenpom team ratings
     raw = clean.s3_folder_data('team_ratings')
     source_kp = TeamSource('team_kp', raw, ['TeamName'])
@@ -276,41 +786,94 @@ def make_sources():
     sources = [source_kp, source_cbb]
     sources = [source.clean_teams() for source in sources]
 
-    dba.close()
-
     return sources
 
 
-def master_key(sources):
+def master_key(sources, lookup=False):
     """
     Return a master team key dataframe from combining all team name sources.
 
+    Names from all sources are collected into one long table of (team_id,
+    source, name) and pivoted once. When a team has several names in a
+    source, the names fill successive rows for the team, so the number of
+    rows for a team is its largest count of names in any one source rather
+    than the product across sources.
+
     Parameters
     ----------
     sources: list of TeamSource instances
         Team sources with team_id attributes assigned from team names.
+    lookup: bool, default False
+        Also return dict mapping (source label, name) to team id.
 
     Returns
     -------
     key: pandas DataFrame
         Contains a team numeric identifer and name, and a column
         containing the corresponding team name for each team name source.
+    name_ids: dict, optional
+        Keys are tuples (source label, name), values are team ids. Only
+        returned if lookup is True.
 
     """
     # read in master id file
-    dba = DBAssist()
-    key = dba.return_data('teams')
-    dba.close()
-
-    key = key[['team_id', 'team_name']]
-
-    # create merged key containing all unique sources
-    for source in sources:
-        key = pd.merge(key, source.key, on='team_id', how='left')
+    with DBAssist.session() as dba:
+        key = dba.return_data('teams', subset=['team_id', 'team_name'])
+
+    labels = [source.label for source in sources]
+    long = key_long(sources)
+    long['team_id'] = long['team_id'].astype(key['team_id'].dtype)
+
+    # number names within team and source to place each in its own row
+    long = long.sort_values(['team_id', 'source', 'name'])
+    team_source = long.groupby(['team_id', 'source'], observed=True)
+    long['rank'] = team_source.cumcount()
+    wide = long.pivot(index=['team_id', 'rank'], columns='source',
+                      values='name')
+    wide = wide.reindex(columns=labels).reset_index()
+    wide.columns = list(wide.columns)
+
+    key = pd.merge(key, wide, on='team_id', how='left')
+    key = key.drop(columns=['rank'])
+    key = key.reindex(columns=['team_id', 'team_name'] + labels)
 
     # assign empty strings to keep string data type consistent
     key = key.fillna('')
-    key = key.drop_duplicates()
-    key = key.sort_values('team_id')
+    key = key.sort_values('team_id', kind='stable')
+    key = key.reset_index(drop=True)
+
+    if lookup is True:
+        name_ids = dict(zip(zip(long['source'], long['name']),
+                            long['team_id']))
+        return key, name_ids
 
     return key
+
+
+def key_long(sources):
+    """
+    Return long dataframe with one row per team name from all sources.
+
+    Parameters
+    ----------
+    sources: list of TeamSource instances
+        Team sources with key attributes set.
+
+    Returns
+    -------
+    long: pandas DataFrame
+        Contains 'team_id', 'source' (category of source labels), and
+        'name' columns.
+
+    """
+    labels = [source.label for source in sources]
+    frames = []
+    for source in sources:
+        df = source.key.rename(columns={source.label: 'name'})
+        df = df[['team_id', 'name']].drop_duplicates()
+        df['source'] = source.label
+        frames.append(df)
+
+    long = pd.concat(frames, ignore_index=True)
+    long['source'] = pd.Categorical(long['source'], categories=labels)
+    return long
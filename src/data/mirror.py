@@ -0,0 +1,154 @@
+""" mirror
+
+A module for keeping a local copy of data files from the project S3 bucket.
+Files are stored as Parquet under a name derived from the object key, ETag
+and the options used to read it, so a file is only downloaded again when the
+object or the way it is parsed changes.
+
+Classes
+-------
+S3Mirror
+    A local on-disk mirror of decoded S3 csv objects.
+
+"""
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+from src.constants import CACHE_DIR
+
+
+class S3Mirror():
+    """
+    A local on-disk mirror of decoded S3 csv objects.
+
+    Attributes
+    ----------
+    mirror_dir : str
+        Directory where Parquet files and the index file are stored.
+    index_file : str
+        Path of json file mapping object keys to ETag, read options and file
+        name.
+    index : dict
+        Entries of the mirror, read from index_file when first needed.
+    hits : int
+        Count of objects returned without downloading the body.
+    misses : int
+        Count of objects that had to be downloaded.
+
+    """
+    def __init__(self, mirror_dir=os.path.join(CACHE_DIR, 's3')):
+        """Initialize S3Mirror instance."""
+        self.mirror_dir = mirror_dir
+        self.index_file = os.path.join(mirror_dir, 'index.json')
+        self.index = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def read_index(self):
+        """Return dict of mirror entries, reading the index file once."""
+        if self.index is None:
+            try:
+                with open(self.index_file, 'r') as f:
+                    self.index = json.load(f)
+            except (IOError, ValueError):
+                self.index = {}
+        return self.index
+
+    def write_index(self):
+        """Save the current entries to the index file."""
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        temp_file = "{}.{}".format(self.index_file, threading.get_ident())
+        with open(temp_file, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_file, self.index_file)
+
+    def etag(self, key, options=''):
+        """Return ETag of a copy read with the same options, or None."""
+        with self.lock:
+            entry = self.read_index().get(key)
+        if entry is None or entry.get('options', '') != options:
+            return None
+        return entry['etag']
+
+    def file_path(self, key, etag, options=''):
+        """Return path of the Parquet file for an object, ETag and options."""
+        text = "{}|{}|{}".format(key, etag, options)
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        return os.path.join(self.mirror_dir, "{}.parquet".format(digest))
+
+    def load(self, key, etag=None, options=''):
+        """
+        Return mirrored data for an object if the copy is current.
+
+        Parameters
+        ----------
+        key : str
+            Key of the object in the S3 bucket.
+        etag : str, default None, optional
+            Current ETag of the object. If None, the mirrored copy is
+            returned without checking, as after a not-modified response.
+        options : str, default ''
+            Identifies the options and column types used to read the object.
+            Copies read with other options are not returned.
+
+        Returns
+        -------
+        df : pandas DataFrame or None
+            Mirrored data, or None if no current copy exists.
+
+        """
+        have = self.etag(key, options)
+        if have is None or (etag is not None and etag != have):
+            return None
+
+        try:
+            df = pd.read_parquet(self.file_path(key, have, options))
+        except (IOError, ValueError):
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return df
+
+    def save(self, key, etag, df, options=''):
+        """
+        Save decoded data for an object and remove any older copy.
+
+        Data that can't be written as Parquet is not mirrored.
+
+        Parameters
+        ----------
+        key : str
+            Key of the object in the S3 bucket.
+        etag : str
+            ETag of the downloaded object.
+        df : pandas DataFrame
+            Data decoded from the object body.
+        options : str, default ''
+            Identifies the options and column types used to read the object.
+
+        """
+        with self.lock:
+            self.misses += 1
+
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        path = self.file_path(key, etag, options)
+        try:
+            df.to_parquet(path, index=False)
+        except (ImportError, TypeError, ValueError) as e:
+            print("not mirroring {}: {}".format(key, e))
+            return
+
+        with self.lock:
+            index = self.read_index()
+            old = index.get(key)
+            if old is not None:
+                old_path = os.path.join(self.mirror_dir, old['file'])
+                if old_path != path and os.path.exists(old_path):
+                    os.remove(old_path)
+            index[key] = {'etag': etag, 'options': options,
+                          'file': os.path.basename(path)}
+            self.write_index()
@@ -3,14 +3,10 @@ import numpy as np
 from src.data.transfer import DBAssist
 
 def clean_roster(min_season=2002):
-    dba = DBAssist()
-
     # read roster info and player per game stats
-    tr = dba.return_data('team_roster')
-    pg = dba.return_data('player_pergame')
-
-    # connection no longer needed
-    dba.close()
+    with DBAssist.session() as dba:
+        tr = dba.return_data('team_roster')
+        pg = dba.return_data('player_pergame')
 
     # merge rows for season, team, and player
     merge_on = ['season', 'team', 'name']
@@ -50,10 +46,9 @@ def split_and_fill(df):
     has = df[df['min_pg'].notnull()].copy()
     tf = df[df['min_pg'].isnull()].copy()
     
-    dba = DBAssist()
     # import data from espn per_game table
-    ep = dba.return_data('espn_pergame')
-    dba.close()
+    with DBAssist.session() as dba:
+        ep = dba.return_data('espn_pergame')
 
     # create dict to look up by (season, team)
     ref_dict = {}
@@ -1,64 +1,109 @@
+# box score stats for winning ('W') and losing ('L') teams in detailed results
+BOX_STATS = ['FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast',
+             'TO', 'Stl', 'Blk', 'PF']
+
+# column types shared by compact and detailed game results
+RESULT_TYPES = {'Season': 'int32', 'DayNum': 'int32', 'WTeamID': 'int32',
+                'WScore': 'int32', 'LTeamID': 'int32', 'LScore': 'int32',
+                'WLoc': 'category', 'NumOT': 'int32'}
+
+DETAILED_TYPES = dict(RESULT_TYPES)
+DETAILED_TYPES.update({w_l + stat: 'int16' for w_l in 'WL'
+                       for stat in BOX_STATS})
+
 # create empty dict to fill
 KEY = {}
 
 # each dict element has the raw file name as key
-# value is a dict with 2 keys, 'new_name' and 'column'
+# value is a dict with keys 'new_name', 'column', and optional 'dtypes'
 # 'new_name' value is string for new file name
 # 'columns' value is another dict with key:value pairs of strings
 # key is raw column name and value is string to rename column
+# 'dtypes' value is dict with raw column names as keys and types as values
+# used when reading the raw file
 KEY['MTeamCoaches'] = {'new_name': 'coaches',
                        'columns': {'TeamID': 'team_id',
                                    'FirstDayNum': 'first_day',
                                    'LastDayNum': 'last_day',
                                    'CoachName': 'coach_name'
-                                   }
+                                   },
+                       'dtypes': {'Season': 'int32',
+                                  'TeamID': 'int32',
+                                  'FirstDayNum': 'int32',
+                                  'LastDayNum': 'int32',
+                                  'CoachName': 'str'}
                        }
 
 KEY['MNCAATourneyCompactResults'] = {'new_name': 'ncaa_results',
                                      'columns': {'WTeamID': 'Wteam',
-                                                 'LTeamID': 'Lteam'}
+                                                 'LTeamID': 'Lteam'},
+                                     'dtypes': RESULT_TYPES
                                      }
 
 KEY['MNCAATourneyDetailedResults'] = {'new_name': 'ncaa_results_dtl',
                                       'columns': {'WTeamID': 'Wteam',
-                                                  'LTeamID': 'Lteam'}
+                                                  'LTeamID': 'Lteam'},
+                                      'dtypes': DETAILED_TYPES
                                       }
 
 KEY['MTeams'] = {'new_name': 'teams',
                  'columns': {'TeamID': 'team_id',
-                             'TeamName': 'team_name'}
+                             'TeamName': 'team_name'},
+                 'dtypes': {'TeamID': 'int32',
+                            'TeamName': 'str',
+                            'FirstD1Season': 'int32',
+                            'LastD1Season': 'int32'}
                  }
 
 KEY['MTeamSpellings'] = {'new_name': 'team_spellings',
                          'columns': {'TeamID': 'team_id',
-                                     'TeamNameSpelling': 'name_spelling'}
+                                     'TeamNameSpelling': 'name_spelling'},
+                         'dtypes': {'TeamID': 'int32',
+                                    'TeamNameSpelling': 'str'}
                          }
 
 KEY['MRegularSeasonCompactResults'] = {'new_name': 'reg_results',
                                        'columns': {'WTeamID': 'Wteam',
-                                                   'LTeamID': 'Lteam'}
+                                                   'LTeamID': 'Lteam'},
+                                       'dtypes': RESULT_TYPES
                                        }
 
 KEY['MRegularSeasonDetailedResults'] = {'new_name': 'reg_results_dtl',
                                         'columns': {'WTeamID': 'Wteam',
-                                                    'LTeamID': 'Lteam'}
+                                                    'LTeamID': 'Lteam'},
+                                        'dtypes': DETAILED_TYPES
                                         }
 
 KEY['MNCAATourneySeeds'] = {'new_name': 'seeds',
-                            'columns': {'TeamID': 'team_id'}
+                            'columns': {'TeamID': 'team_id'},
+                            'dtypes': {'Season': 'int32',
+                                       'Seed': 'str',
+                                       'TeamID': 'int32'}
                             }
 
-KEY['MSeasons'] = {'new_name': 'seasons'}
+KEY['MSeasons'] = {'new_name': 'seasons',
+                   'dtypes': {'Season': 'int32',
+                              'DayZero': 'str'}
+                   }
 
 KEY['MGameCities'] = {'new_name': 'game_cities',
                       'columns': {'WTeamID': 'WTeam',
                                   'LTeamID': 'LTeam',
                                   'CRType': 'game_cat',
-                                  'CityID': 'city_id'}
-                               }
+                                  'CityID': 'city_id'},
+                      'dtypes': {'Season': 'int32',
+                                 'DayNum': 'int32',
+                                 'WTeamID': 'int32',
+                                 'LTeamID': 'int32',
+                                 'CRType': 'category',
+                                 'CityID': 'int32'}
+                      }
 
 KEY['Cities'] = {'new_name': 'cities',
-                 'columns': { 'CityID': 'city_id'}
+                 'columns': { 'CityID': 'city_id'},
+                 'dtypes': {'CityID': 'int32',
+                            'City': 'str',
+                            'State': 'str'}
                  }
 
 KEY['TeamGeog'] = {'new_name': 'team_geog',
@@ -10,15 +10,54 @@ DBTable
     A container of data for a MySQL table.
 DBAssist
     A tool for creating MySQL objects and extracting data from database.
+ConnectionPool
+    A process-wide pool of reusable connections with MySQL database.
+Subquery
+    A single column selected from a table, used as values of an 'in' filter.
 
 """
 
 import configparser
 import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import pymysql
+from pymysql.constants import FIELD_TYPE
 from src.constants import SCHEMA_FILE
 from src.constants import CONFIG_FILE
+from src.constants import CACHE_ENABLED
+from src.data.cache import TableCache
+from src.data.cache import cache_key
+
+# default number of rows sent to the database in each batched insert
+BATCH_SIZE = 5000
+
+# default number of rows read from the database in each fetch
+FETCH_SIZE = 10000
+
+# max ratio of unique to total values for VARCHAR columns to use category
+CATEGORY_RATIO = 0.5
+
+# MySQL column types grouped by the dtype used for returned data
+FLOAT_TYPES = [FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.FLOAT,
+               FIELD_TYPE.DOUBLE]
+INT_TYPES = [FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG,
+             FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24, FIELD_TYPE.YEAR]
+STR_TYPES = [FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING]
+
+# comparison operators available as column name suffixes in filters
+FILTER_OPERATORS = {'eq': '=', 'ne': '<>', 'gt': '>', 'gte': '>=', 'lt': '<',
+                    'lte': '<=', 'in': 'IN'}
+
+# valid MySQL table or column name
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
 
 class DBAssist():
     """
@@ -32,13 +71,78 @@ class DBAssist():
         A pymysql connection with MySQL database.
     cursor : pymysql.cursors.Cursor
         A pymysql cursor called from the conn attribute.
+    pooled : bool
+        Connection was taken from and is returned to the shared pool.
+    use_cache : bool
+        Return unchanged tables from local cache files in return_data.
+    in_transaction : bool
+        Writes are committed together when the open transaction block exits.
 
     """
-    def __init__(self):
+    def __init__(self, pooled=False, use_cache=CACHE_ENABLED):
         """Initialize DBAssist instance."""
-        self.conn = self.connect()
+        self.pooled = pooled
+        self.use_cache = use_cache
+        self.in_transaction = False
+        if pooled is True:
+            self.conn = POOL.acquire()
+        else:
+            self.conn = self.connect()
         self.cursor = self.conn.cursor()
 
+    @classmethod
+    @contextmanager
+    def session(cls, use_cache=CACHE_ENABLED):
+        """
+        Return context manager for a DBAssist using a pooled connection.
+
+        The connection is returned to the pool when the block exits, so
+        consecutive sessions in the same process reuse one connection.
+
+        Parameters
+        ----------
+        use_cache : bool, default CACHE_ENABLED
+            Return unchanged tables from local cache files in return_data.
+
+        Example
+        -------
+        with DBAssist.session() as dba:
+            df = dba.return_data('teams')
+
+        """
+        dba = cls(pooled=True, use_cache=use_cache)
+        try:
+            yield dba
+        finally:
+            dba.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Return context manager committing all writes in the block at once.
+
+        Inside the block execute_commit does not commit, and errors are
+        raised instead of printed. When the block exits normally all
+        writes are committed, otherwise they are rolled back.
+
+        Example
+        -------
+        with DBAssist.session() as dba:
+            with dba.transaction():
+                dba.delete_rows('teams', filters={'team_id': 1101})
+                dba.insert_rows('teams', df)
+
+        """
+        self.in_transaction = True
+        try:
+            yield self
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
     def connect(self, config_file=CONFIG_FILE):
         """
         Establish connection with database.
@@ -62,20 +166,17 @@ class DBAssist():
             An open connection with MySQL database.
 
         """
-        parser = configparser.ConfigParser()
-        parser.readfp(open(config_file))
-        
-        conn = pymysql.connect(host='127.0.0.1',
-                               port=3306,
-                               user=parser.get('Local', 'user'),
-                               passwd=parser.get('Local', 'pwd'),
-                               db=parser.get('Local', 'db'))
+        settings = connection_settings(config_file)
+        conn = pymysql.connect(**settings)
         return conn
 
     def close(self):
-        """Close cursor and connection with database."""
+        """Close cursor and connection, or return connection to the pool."""
         self.cursor.close()
-        self.conn.close()
+        if self.pooled is True:
+            POOL.release(self.conn)
+        else:
+            self.conn.close()
 
     def create_from_data(self, table_name, data):
         """
@@ -147,7 +248,7 @@ class DBAssist():
         query_create = "CREATE TABLE {0} ({1});".format(table_name, col_part)
         return query_create
 
-    def execute_commit(self, query):
+    def execute_commit(self, query, params=None):
         """
         Execute a query and commit changes to database.
 
@@ -158,14 +259,19 @@ class DBAssist():
         ----------
         query : str
             Text of a MySQL query to execute.
+        params : tuple or list, default None, optional
+            Values to substitute for %s markers in the query.
         """
         try:
-            self.cursor.execute(query)
-            self.conn.commit()
+            self.cursor.execute(query, params)
+            if self.in_transaction is False:
+                self.conn.commit()
         except pymysql.err.DataError as e:
+            if self.in_transaction is True:
+                raise
             print(e)
 
-    def insert_rows(self, table_name, data, at_once=True):
+    def insert_rows(self, table_name, data, at_once=True, batch_size=None):
         """
         Insert new rows to database.
 
@@ -178,8 +284,15 @@ class DBAssist():
         at_once : bool
             Insert rows and commit changes as a single query. If False, insert
             each row and commit changes separately.
+        batch_size : int, default None, optional
+            If given, insert rows as parameterized batches of this size with
+            one commit per batch. Overrides at_once.
 
         """
+        if batch_size is not None:
+            self.insert_batches(table_name, data, batch_size=batch_size)
+            return
+
         table = DBTable(table_name, data)
 
         # insert full table at once
@@ -189,9 +302,68 @@ class DBAssist():
         # insert one row at a time
         else:
             query_list = table.query_insert(at_once=at_once)
-            map(lambda x: self.execute_commit(x), query_list)
+            for query in query_list:
+                self.execute_commit(query)
+
+        self.clear_cache(table_name)
+
+    def insert_batches(self, table_name, data, batch_size=BATCH_SIZE):
+        """
+        Insert new rows to database in parameterized batches.
 
-    def delete_rows(self, table_name):
+        Rows are sent in chunks of batch_size through cursor.executemany so
+        values are escaped by the driver rather than formatted into one large
+        query string. Each batch is committed separately, and a failed batch
+        is rolled back and reported without stopping the remaining batches.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table in database where rows are inserted.
+        data : list of list or pandas DataFrame
+            Data to insert as new rows.
+        batch_size : int, default BATCH_SIZE
+            Maximum number of rows to insert and commit at once.
+
+        Returns
+        -------
+        report : dict
+            Counts of rows inserted and failed, elapsed seconds, rows per
+            second, and a list of (batch number, error) for failed batches.
+
+        """
+        table = DBTable(table_name, data)
+        query = table.query_insert_params()
+
+        inserted = 0
+        failed_rows = 0
+        failures = []
+        start = time.time()
+
+        for number, batch in enumerate(table.param_batches(batch_size)):
+            try:
+                self.cursor.executemany(query, batch)
+                self.conn.commit()
+                inserted += len(batch)
+            except pymysql.err.MySQLError as e:
+                self.conn.rollback()
+                failed_rows += len(batch)
+                failures.append((number, e))
+                print("batch {} failed: {}".format(number, e))
+
+        self.clear_cache(table_name)
+
+        elapsed = time.time() - start
+        rate = inserted / elapsed if elapsed > 0 else float(inserted)
+        print("{}: inserted {} rows ({:.0f} rows/sec), {} batches failed".format(
+              table_name, inserted, rate, len(failures)))
+
+        report = {'inserted': inserted, 'failed': failed_rows,
+                  'seconds': elapsed, 'rows_per_sec': rate,
+                  'failures': failures}
+        return report
+
+    def delete_rows(self, table_name, filters=None):
         """
         Delete all rows in a table in database.
 
@@ -199,12 +371,16 @@ class DBAssist():
         ----------
         table_name : str
             Name of the table in database.
+        filters : dict, default None, optional
+            Delete only rows meeting these conditions. See compile_filters.
 
         """
-        query_delete = "DELETE from {}".format(table_name)
-        self.execute_commit(query_delete)
+        where, params = compile_filters(filters)
+        query_delete = "DELETE from {} {}".format(table_name, where)
+        self.execute_commit(query_delete, params=params)
+        self.clear_cache(table_name)
 
-    def replace_rows(self, table_name, data, at_once=True):
+    def replace_rows(self, table_name, data, at_once=True, infile=False):
         """
         Replace all rows in a table in database.
 
@@ -217,27 +393,140 @@ class DBAssist():
         at_once : bool
             Insert rows and commit changes as a single query. If False, insert
             each row and commit changes separately.
+        infile : bool, default False
+            Bulk load rows into a staging table and swap it in place of the
+            original table, so the table is never seen empty.
+
+        """
+        if infile is True:
+            self.load_infile(table_name, data)
+        else:
+            self.delete_rows(table_name)
+            self.insert_rows(table_name, data, at_once=at_once)
+
+        self.clear_cache(table_name)
+
+    def clear_cache(self, table_name):
+        """
+        Remove cached reads of a table after its rows are written.
+
+        The table signature can't tell apart writes made within the same
+        second, so every write path removes the table's cached entries.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of the table in database.
 
         """
-        self.delete_rows(table_name)
-        self.insert_rows(table_name, data, at_once=at_once)
+        TABLE_CACHE.clear(table_name)
 
-    def return_data(self, table_name, subset=None, modifier=""):
+    def load_infile(self, table_name, data):
+        """
+        Replace a full table with LOAD DATA LOCAL INFILE and a staging table.
+
+        Data is written to a temporary tab-separated file and loaded into a
+        staging table with the same definition as the target table. The 
+        staging table then replaces the target in a single RENAME TABLE
+        statement. If the target table does not exist, column types are 
+        extracted from the data as in create_from_data.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table in database to replace.
+        data : list of list or pandas DataFrame
+            Data to load as the full contents of the table.
+
+        """
+        table = DBTable(table_name, data)
+        stage_name = "{}_stage".format(table_name)
+        old_name = "{}_old".format(table_name)
+        exists = self.table_exists(table_name)
+
+        # staging table copies target definition to keep schema types
+        self.cursor.execute("DROP TABLE IF EXISTS {}".format(stage_name))
+        if exists is True:
+            query_create = "CREATE TABLE {} LIKE {}".format(stage_name,
+                                                            table_name)
+        else:
+            query_create = DBTable(stage_name, table.data).query_create()
+        self.cursor.execute(query_create)
+
+        handle, path = tempfile.mkstemp(suffix='.tsv')
+        try:
+            with os.fdopen(handle, 'w', newline='\n') as f:
+                for lines in table.infile_batches():
+                    f.write(lines)
+            
+            col_string = ", ".join([c.name for c in table.columns])
+            query_load = ("LOAD DATA LOCAL INFILE %s INTO TABLE {0} "
+                          "FIELDS TERMINATED BY '\\t' "
+                          "LINES TERMINATED BY '\\n' ({1})")
+            query_load = query_load.format(stage_name, col_string)
+            self.cursor.execute(query_load, (path,))
+            self.conn.commit()
+        except Exception:
+            # failed load leaves the target table untouched
+            self.conn.rollback()
+            self.cursor.execute("DROP TABLE IF EXISTS {}".format(stage_name))
+            raise
+        finally:
+            os.remove(path)
+
+        # old table left by an interrupted swap would block the rename
+        self.cursor.execute("DROP TABLE IF EXISTS {}".format(old_name))
+
+        # swap staging table in place of target in one atomic statement
+        if exists is True:
+            query_swap = "RENAME TABLE {0} TO {1}, {2} TO {0}"
+            self.cursor.execute(query_swap.format(table_name, old_name,
+                                                  stage_name))
+            self.cursor.execute("DROP TABLE {}".format(old_name))
+        else:
+            query_swap = "RENAME TABLE {} TO {}".format(stage_name, table_name)
+            self.cursor.execute(query_swap)
+
+        self.clear_cache(table_name)
+
+    def table_exists(self, table_name):
+        """Return True if the table exists in database."""
+        result = self.query_result("SHOW TABLES LIKE %s", as_dict=False,
+                                   params=(table_name,))
+        return len(result) > 0
+
+    def return_data(self, table_name, subset=None, filters=None,
+                    chunksize=None, categorize=False):
         """
         Return the data from table in database.
 
+        Column dtypes are set from the MySQL column types: DECIMAL and FLOAT
+        columns are float64, integer columns are int64 (Int64 if nullable).
+        If use_cache is True, results are read from and saved to the local
+        table cache, and the cached copy is used while the signatures of
+        the table and of any tables in Subquery filters are unchanged.
+
         Parameters
         ----------
         table_name : str
             Name of table in database for retreiving data.
         subset : str or list of str, default None, optional
             Name of table column or list of columns to return.
-        modifier : str, default "", optional
-            Text of MySQL WHERE statement used to select rows to return.
+        filters : dict, default None, optional
+            Conditions rows must meet to be returned, combined with AND. Keys
+            are column names with an optional operator suffix, such as
+            'season', 'season__gte', or 'team_id__in'. Values of 'in' may be
+            a Subquery. See compile_filters.
+        chunksize : int, default None, optional
+            If given, return an iterator yielding dataframes with at most
+            chunksize rows. The iterator must be consumed before other
+            queries are executed on the connection.
+        categorize : bool, default False, optional
+            Return VARCHAR columns with few unique values as category dtype.
 
         Returns
         -------
-        df : pandas DataFrame
+        df : pandas DataFrame or iterator of pandas DataFrame
             Contents of table returned as dataframe.
 
         """
@@ -245,23 +534,152 @@ class DBAssist():
         if subset is None:
             columns_to_get = '*'
         elif type(subset) is str:
-            columns_to_get = subset
+            columns_to_get = check_identifier(subset)
         elif type(subset) is list:
-            columns_to_get = ", ".join(subset)
+            columns_to_get = ", ".join([check_identifier(x) for x in subset])
         else:
             sub_type = type(subset)
             msg = 'Subset must be None, str, or list, not {}'.format(sub_type)
             raise Exception(msg)
 
-        # list of column indices where type is decimal
-        query = "SELECT {} FROM {} {};".format(columns_to_get, table_name,
-                                                  modifier)
-        result = self.query_result(query)
-        df = pd.DataFrame(result)
+        # WHERE clause with %s markers for values passed as parameters
+        where, params = compile_filters(filters)
+        query = "SELECT {} FROM {} {};".format(columns_to_get,
+                                               check_identifier(table_name),
+                                               where)
+        if chunksize is not None:
+            return self.query_frames(query, params=params,
+                                     chunksize=chunksize,
+                                     categorize=categorize)
+
+        if self.use_cache is True:
+            # tables read by subquery filters also invalidate the entry
+            sources = filter_tables(filters)
+            signatures = [self.table_signature(x)
+                          for x in [table_name] + sources]
+            signature = None
+            if None not in signatures:
+                signature = "|".join(signatures)
+            key = cache_key(table_name, subset, filters, categorize)
+            if signature is not None:
+                df = TABLE_CACHE.get(key, signature)
+                if df is not None:
+                    return df
+
+        df = self.query_frame(query, params=params, categorize=categorize)
+
+        if self.use_cache is True and signature is not None:
+            TABLE_CACHE.put(key, signature, table_name, df, sources=sources)
 
         return df
 
-    def query_result(self, query, as_dict=True):
+    def table_signature(self, table_name):
+        """
+        Return str that changes whenever the contents of a table change.
+
+        Combines the create and update times from information_schema, so
+        checking a cached entry costs one metadata query and never reads
+        the table. The update time is missing for InnoDB tables not
+        modified since the server started, which is still a valid
+        signature: any later change sets it. Update times have one second
+        resolution, so writes through DBAssist also remove the table's
+        cached entries, see clear_cache.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of table in database.
+
+        Returns
+        -------
+        signature : str or None
+            Signature of the table, or None if the table is not found.
+
+        """
+        query = ("SELECT CREATE_TIME, UPDATE_TIME FROM information_schema.TABLES"
+                 " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+        result = self.query_result(query, as_dict=False, params=(table_name,))
+        if len(result) == 0:
+            return None
+
+        created, updated = result[0]
+        signature = "{}|{}".format(created, updated)
+        return signature
+
+    def query_frame(self, query, params=None, categorize=False):
+        """
+        Return the results of a query as a dataframe with typed columns.
+
+        Rows are read as tuples from an unbuffered cursor in batches of 
+        FETCH_SIZE and collected by column, so no per-row dict is created.
+
+        Parameters
+        ----------
+        query : str
+            Text of a valid MySQL query.
+        params : tuple or list, default None, optional
+            Values to substitute for %s markers in the query.
+        categorize : bool, default False, optional
+            Return VARCHAR columns with few unique values as category dtype.
+
+        Returns
+        -------
+        df : pandas DataFrame
+            Result of the query.
+
+        """
+        cursor = self.conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query, params)
+            description = cursor.description
+            values = [[] for d in description]
+            rows = cursor.fetchmany(FETCH_SIZE)
+            while rows:
+                for column, column_values in zip(values, zip(*rows)):
+                    column.extend(column_values)
+                rows = cursor.fetchmany(FETCH_SIZE)
+        finally:
+            cursor.close()
+
+        df = frame_from_columns(values, description, categorize=categorize)
+        return df
+
+    def query_frames(self, query, params=None, chunksize=FETCH_SIZE,
+                     categorize=False):
+        """
+        Yield the results of a query as dataframes with typed columns.
+
+        Parameters
+        ----------
+        query : str
+            Text of a valid MySQL query.
+        params : tuple or list, default None, optional
+            Values to substitute for %s markers in the query.
+        chunksize : int, default FETCH_SIZE
+            Maximum number of rows in each dataframe.
+        categorize : bool, default False, optional
+            Return VARCHAR columns with few unique values as category dtype.
+
+        Yields
+        ------
+        df : pandas DataFrame
+            Next chunk of rows from the result of the query.
+
+        """
+        cursor = self.conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query, params)
+            description = cursor.description
+            rows = cursor.fetchmany(chunksize)
+            while rows:
+                values = [list(x) for x in zip(*rows)]
+                yield frame_from_columns(values, description,
+                                         categorize=categorize)
+                rows = cursor.fetchmany(chunksize)
+        finally:
+            cursor.close()
+
+    def query_result(self, query, as_dict=True, params=None):
         """
         Return the results of a query on database.
 
@@ -273,6 +691,8 @@ class DBAssist():
             Return list of dict with value labels as keys for each dict.
             If False, return tuple of tuples with tuple elements in order of
             elements in table.
+        params : tuple or list, default None, optional
+            Values to substitute for %s markers in the query.
 
         Returns
         -------
@@ -286,7 +706,7 @@ class DBAssist():
         else:
             cursor = self.conn.cursor()
         
-        cursor.execute(query)
+        cursor.execute(query, params)
         return cursor.fetchall()
 
     def table_columns(self, table_name):
@@ -310,6 +730,354 @@ class DBAssist():
         return column_names
 
 
+def compile_filters(filters):
+    """
+    Return parameterized WHERE clause and values from a dict of filters.
+
+    Keys are column names, optionally followed by a double underscore and
+    one of the operators in FILTER_OPERATORS. Without an operator the 
+    column must equal the value. A value of None with equality tests for
+    NULL. For 'in', the value is a list or array of allowed values, or a
+    Subquery selecting them in the database.
+
+    Example
+    -------
+    compile_filters({'season__gte': 2003, 'team_id__in': [1101, 1102]})
+    returns ('WHERE season >= %s AND team_id IN (%s, %s)',
+             [2003, 1101, 1102])
+
+    Parameters
+    ----------
+    filters : dict or None
+        Column conditions to combine with AND.
+
+    Returns
+    -------
+    where : str
+        Text of WHERE clause with %s markers, empty if no filters.
+    params : list
+        Values for the markers in the order they appear.
+
+    """
+    if not filters:
+        return "", []
+
+    conditions = []
+    params = []
+    for key, value in filters.items():
+        if '__' in key:
+            column, op_name = key.rsplit('__', 1)
+        else:
+            column, op_name = key, 'eq'
+        
+        if op_name not in FILTER_OPERATORS:
+            raise Exception('Unknown filter operator: {}'.format(op_name))
+        column = check_identifier(column)
+        operator = FILTER_OPERATORS[op_name]
+
+        if op_name == 'in' and isinstance(value, Subquery):
+            query, sub_params = value.compile()
+            conditions.append("{} IN ({})".format(column, query))
+            params.extend(sub_params)
+        elif op_name == 'in':
+            values = [x.item() if hasattr(x, 'item') else x for x in value]
+            if len(values) == 0:
+                # no allowed values, no rows can match
+                conditions.append("FALSE")
+                continue
+            markers = ", ".join(["%s"] * len(values))
+            conditions.append("{} IN ({})".format(column, markers))
+            params.extend(values)
+        elif value is None and op_name in ['eq', 'ne']:
+            null_test = 'IS NULL' if op_name == 'eq' else 'IS NOT NULL'
+            conditions.append("{} {}".format(column, null_test))
+        else:
+            if hasattr(value, 'item'):
+                value = value.item()
+            conditions.append("{} {} %s".format(column, operator))
+            params.append(value)
+
+    where = "WHERE {}".format(" AND ".join(conditions))
+    return where, params
+
+
+def check_identifier(name):
+    """Return name if valid as MySQL table or column name, else raise."""
+    if not isinstance(name, str) or IDENTIFIER.match(name) is None:
+        raise Exception('Invalid table or column name: {}'.format(name))
+    return name
+
+
+class Subquery():
+    """
+    A single column selected from a table, used as values of an 'in' filter.
+
+    Lets a filter select rows by the contents of another table without
+    sending a list of values with the query.
+
+    Example
+    -------
+    games = Subquery('game_info', 'game_id', filters={'season': 2019})
+    dba.return_data('team_home', filters={'game_id__in': games})
+
+    Attributes
+    ----------
+    table_name : str
+        Name of table in database the values are selected from.
+    column : str
+        Name of the selected column.
+    filters : dict or None
+        Conditions rows of the table must meet. See compile_filters.
+
+    """
+    def __init__(self, table_name, column, filters=None):
+        """Initialize Subquery instance."""
+        self.table_name = check_identifier(table_name)
+        self.column = check_identifier(column)
+        self.filters = filters
+
+    def __str__(self):
+        """Return text of the query and values, used in cache keys."""
+        query, params = self.compile()
+        return "{} {}".format(query, params)
+
+    def compile(self):
+        """
+        Return parameterized SELECT query and values of the subquery.
+
+        Returns
+        -------
+        query : str
+            Text of SELECT query with %s markers.
+        params : list
+            Values for the markers in the order they appear.
+
+        """
+        where, params = compile_filters(self.filters)
+        query = "SELECT {} FROM {} {}".format(self.column, self.table_name,
+                                              where)
+        return query.rstrip(), params
+
+    def tables(self):
+        """Return list of names of all tables read by the subquery."""
+        return [self.table_name] + filter_tables(self.filters)
+
+
+def filter_tables(filters):
+    """Return list of names of tables read by Subquery values of filters."""
+    if not filters:
+        return []
+
+    tables = []
+    for value in filters.values():
+        if isinstance(value, Subquery):
+            tables.extend(value.tables())
+    return tables
+
+
+class ConnectionPool():
+    """
+    A process-wide pool of reusable connections with MySQL database.
+
+    Attributes
+    ----------
+    config_file : str
+        Path to INI file with database access settings.
+    max_idle : int
+        Maximum number of idle connections kept open for reuse.
+    settings : dict
+        Connection arguments, read from config_file on first use.
+    idle : list of pymysql.connections.Connection
+        Open connections available for reuse.
+    created : int
+        Count of new connections opened by the pool.
+    reused : int
+        Count of connections handed out again from the idle list.
+
+    """
+    def __init__(self, config_file=CONFIG_FILE, max_idle=4):
+        """Initialize ConnectionPool instance."""
+        self.config_file = config_file
+        self.max_idle = max_idle
+        self.settings = None
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def acquire(self):
+        """
+        Return an open connection, reusing an idle one if available.
+        
+        Idle connections are validated with a ping and discarded if the
+        server closed them.
+
+        Returns
+        -------
+        conn : pymysql.connections.Connection
+            An open connection with MySQL database.
+
+        """
+        with self.lock:
+            # connections opened by a parent process can't be shared
+            if os.getpid() != self.pid:
+                self.idle = []
+                self.pid = os.getpid()
+            if self.settings is None:
+                self.settings = connection_settings(self.config_file)
+
+            while self.idle:
+                conn = self.idle.pop()
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.err.Error:
+                    continue
+                self.reused += 1
+                return conn
+
+            conn = pymysql.connect(**self.settings)
+            self.created += 1
+
+        return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, or close it if the pool is full.
+
+        Parameters
+        ----------
+        conn : pymysql.connections.Connection
+            A connection previously returned by acquire.
+
+        """
+        with self.lock:
+            keep = conn.open and len(self.idle) < self.max_idle
+            if keep and os.getpid() == self.pid:
+                # end any open transaction before the next user
+                conn.rollback()
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        """Close all idle connections."""
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+    def stats(self):
+        """Return dict with counts of connections created and reused."""
+        return {'created': self.created, 'reused': self.reused,
+                'idle': len(self.idle)}
+
+
+def connection_settings(config_file=CONFIG_FILE):
+    """
+    Return connection arguments read from INI-formatted configuration file.
+
+    Parameters
+    ----------
+    config_file : str
+        Path to file INI file with user name and password for database.
+
+    Returns
+    -------
+    settings : dict
+        Keyword arguments for pymysql.connect.
+
+    """
+    parser = configparser.ConfigParser()
+    with open(config_file) as f:
+        parser.read_file(f)
+
+    settings = {'host': '127.0.0.1',
+                'port': 3306,
+                'user': parser.get('Local', 'user'),
+                'passwd': parser.get('Local', 'pwd'),
+                'db': parser.get('Local', 'db'),
+                'local_infile': True}
+    return settings
+
+
+# shared by all DBAssist sessions in the process
+POOL = ConnectionPool()
+
+# local copies of table data shared by all DBAssist instances
+TABLE_CACHE = TableCache()
+
+
+def frame_from_columns(values, description, categorize=False):
+    """
+    Return dataframe built from lists of column values and cursor description.
+
+    Parameters
+    ----------
+    values : list of list
+        Values for each column in the query result.
+    description : tuple of tuple
+        The description attribute of the cursor that executed the query.
+    categorize : bool, default False, optional
+        Return VARCHAR columns with few unique values as category dtype.
+
+    Returns
+    -------
+    df : pandas DataFrame
+        Columns typed according to the MySQL column types.
+
+    """
+    names = [d[0] for d in description]
+    arrays = {}
+    for name, column_values, desc in zip(names, values, description):
+        arrays[name] = typed_column(column_values, desc[1], desc[6],
+                                    categorize=categorize)
+    df = pd.DataFrame(arrays, columns=names)
+    return df
+
+
+def typed_column(values, type_code, null_ok=True, categorize=False):
+    """
+    Return array of column values with dtype matching the MySQL column type.
+
+    Parameters
+    ----------
+    values : list
+        Values of the column as returned by the cursor.
+    type_code : int
+        MySQL field type of the column from pymysql.constants.FIELD_TYPE.
+    null_ok : bool, default True
+        Column allows null values. Integer columns that allow nulls use the
+        pandas nullable Int64 type.
+    categorize : bool, default False, optional
+        Return as category dtype if the ratio of unique values to total 
+        values is at most CATEGORY_RATIO.
+
+    Returns
+    -------
+    array : numpy array or pandas array
+        Column values with float64, int64, Int64, object, or category dtype.
+
+    """
+    if type_code in FLOAT_TYPES:
+        # None converts to nan and Decimal to float
+        array = np.array(values, dtype=np.float64)
+    elif type_code in INT_TYPES:
+        if null_ok:
+            array = pd.array(values, dtype='Int64')
+        else:
+            array = np.array(values, dtype=np.int64)
+    else:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        if categorize and type_code in STR_TYPES and len(values) > 0:
+            n_unique = len(set(values))
+            if n_unique / float(len(values)) <= CATEGORY_RATIO:
+                array = pd.Categorical(array)
+
+    return array
+
+
 class DBTable(object):
     """
     A container for tabular data for insertion to MySQL table.
@@ -412,6 +1180,58 @@ class DBTable(object):
         #rows_closed = ["({0})".format(row) for row in rows_joined]
         return rows_joined
 
+    def query_insert_params(self):
+        """Return parameterized query for inserting one row of the table."""
+        col_string = ", ".join(self.data[0])
+        markers = ", ".join(["%s"] * len(self.columns))
+        insert = "INSERT INTO {0} ({1}) VALUES ({2})".format(self.name,
+                                                            col_string,
+                                                            markers)
+        return insert
+
+    def param_batches(self, batch_size=BATCH_SIZE):
+        """
+        Yield row values converted for a parameterized insert query.
+
+        Parameters
+        ----------
+        batch_size : int, default BATCH_SIZE
+            Maximum number of rows in each yielded batch.
+
+        Yields
+        ------
+        batch : list of tuple
+            Row values typed to match each column's MySQL type.
+
+        """
+        n_rows = len(self.data) - 1
+        for start in range(0, n_rows, batch_size):
+            stop = min(start + batch_size, n_rows)
+            column_values = [c.param_column(start, stop) for c in self.columns]
+            yield list(zip(*column_values))
+
+    def infile_batches(self, batch_size=BATCH_SIZE):
+        """
+        Yield rows formatted as text for a LOAD DATA INFILE statement.
+
+        Parameters
+        ----------
+        batch_size : int, default BATCH_SIZE
+            Maximum number of rows in each yielded batch.
+
+        Yields
+        ------
+        lines : str
+            Tab-separated rows, each ending with a newline.
+
+        """
+        n_rows = len(self.data) - 1
+        for start in range(0, n_rows, batch_size):
+            stop = min(start + batch_size, n_rows)
+            column_values = [c.infile_column(start, stop) for c in self.columns]
+            rows = ["\t".join(row) for row in zip(*column_values)]
+            yield "".join([row + "\n" for row in rows])
+
 
 class DBColumn(object):
     """
@@ -496,3 +1316,88 @@ class DBColumn(object):
             new_value = """{}""".format(raw_value)
 
         return new_value
+
+    def param_column(self, start=0, stop=None):
+        """
+        Return slice of column values converted for a parameterized query.
+
+        Parameters
+        ----------
+        start : int, default 0
+            Position of the first value to convert.
+        stop : int, default None
+            Position after the last value to convert. If None, convert
+            through the end of the column.
+
+        Returns
+        -------
+        new_values : list
+            Values typed to match the column type, with missing values None.
+
+        """
+        return [self.param_element(x) for x in self.values[start:stop]]
+
+    def param_element(self, raw_value):
+        """
+        Return element typed for insertion with a parameterized query.
+
+        Missing values follow the same rules as convert_column and are
+        returned as None so the driver sends NULL.
+
+        Parameters
+        ----------
+        raw_value : str, float, int, NaN, or None
+            The original cell value when DBTable is initialized.
+
+        Returns
+        -------
+        new_value : str, float, or None
+            Value converted to the python type matching the column type.
+
+        """
+        if raw_value is None:
+            return None
+        if isinstance(raw_value, float) and math.isnan(raw_value):
+            return None
+        if str(raw_value) in ['nan', '', 'None']:
+            return None
+
+        if "VARCHAR" in self.type:
+            new_value = str(raw_value)
+        else:
+            new_value = float(raw_value)
+
+        return new_value
+
+    def infile_column(self, start=0, stop=None):
+        """
+        Return slice of column values formatted for a LOAD DATA INFILE file.
+
+        Missing values are written as \\N. String values have backslashes,
+        tabs, and newlines escaped to match the default FIELDS ESCAPED BY.
+
+        Parameters
+        ----------
+        start : int, default 0
+            Position of the first value to convert.
+        stop : int, default None
+            Position after the last value to convert. If None, convert
+            through the end of the column.
+
+        Returns
+        -------
+        new_values : list of str
+            Values converted to text for the infile.
+
+        """
+        new_values = []
+        for x in self.param_column(start, stop):
+            if x is None:
+                new_values.append("\\N")
+            elif "VARCHAR" in self.type:
+                x = x.replace("\\", "\\\\")
+                x = x.replace("\t", "\\t").replace("\n", "\\n")
+                new_values.append(x)
+            else:
+                new_values.append(repr(x))
+        return new_values
@@ -32,15 +32,16 @@ import numpy as np
 import pandas as pd
 from src.data.transfer import DBAssist
 
-def run(modifier=None):
+def run(filters=None):
     """
     Return dataframe with team identifiers and features related to historical
     performance of team's current coach.
 
     Parameters
     ----------
-    modifier : str
-        Modifier for MySQL query to pull coach data from coaches table.
+    filters : dict
+        Filters for rows to pull from coaches table. See
+        transfer.compile_filters.
 
     Returns
     -------
@@ -48,9 +49,10 @@ def run(modifier=None):
         Contains team id, season, and coach features.
 
     """
-    # import coach season data
-    dba = DBAssist()
-    df = dba.return_data('coaches')
+    # import coach season data and past tourney outcomes
+    with DBAssist.session() as dba:
+        df = dba.return_data('coaches', filters=filters)
+        tourney_results = dba.return_data('tourney_success')
 
     # handle rare cases of multiple rows for same coach, team, and season
     df = df.sort_values(['team_id', 'last_day'])
@@ -63,7 +65,6 @@ def run(modifier=None):
     coaches_end = coaches_end.drop(['first_day', 'last_day'], axis=1)
     
     # get tourney outcomes for coaches who made the tourney
-    tourney_results = dba.return_data('tourney_success')
     tourney_outcomes = pd.merge(coaches_end, tourney_results, how='inner',
                                 on=['season', 'team_id'])
 
@@ -93,9 +94,6 @@ def run(modifier=None):
     # keep identifers (team, season) and numeric features only
     coach_features = coach_features.drop(['coach_name'], axis=1)
 
-    # close database connection
-    dba.close()
-
     return coach_features
 
 
@@ -0,0 +1,213 @@
+""" kernels.
+
+A module of NumPy functions computing per-group summaries of sorted arrays,
+such as a team's results within a season. Rows of each group must be
+contiguous and in chronological order, with group bounds from group_bounds.
+
+Functions
+---------
+group_bounds
+    Return arrays of first and end row positions of sorted groups.
+
+current_streak
+    Return length of the run of events at the end of each group.
+
+longest_streak
+    Return length of the longest run of events in each group.
+
+last_n_pct
+    Return share of events in the last n rows of each group.
+
+ewm_form
+    Return exponentially weighted mean at the end of each group.
+
+run_starts
+    Return start position of the run of equal values each row belongs to.
+
+"""
+import numpy as np
+
+
+def group_bounds(*keys):
+    """
+    Return arrays of first and end row positions of sorted groups.
+
+    Parameters
+    ----------
+    keys : numpy arrays
+        One or more arrays of equal length identifying the group of each
+        row, sorted so rows of a group are contiguous.
+
+    Returns
+    -------
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+
+    """
+    n = len(keys[0])
+    if n == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for values in keys:
+        values = np.asarray(values)
+        change[1:] |= values[1:] != values[:-1]
+
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], n)
+    return starts, ends
+
+
+def run_starts(y, starts):
+    """
+    Return start position of the run of equal values each row belongs to.
+
+    Parameters
+    ----------
+    y : numpy array
+        Values of all rows.
+    starts : numpy array of int
+        Position of the first row of each group, where runs also start.
+
+    Returns
+    -------
+    run_start : numpy array of int
+        Position of the first row of each row's run.
+
+    """
+    change = np.ones(len(y), dtype=bool)
+    change[1:] = y[1:] != y[:-1]
+    change[starts] = True
+    run_start = np.maximum.accumulate(np.where(change, np.arange(len(y)), 0))
+    return run_start
+
+
+def current_streak(y, starts, ends):
+    """
+    Return length of the run of events at the end of each group.
+
+    Parameters
+    ----------
+    y : numpy array of int
+        Indicator of event, 1 or 0, for each row.
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+
+    Returns
+    -------
+    streak : numpy array of int
+        Length of final run, zero where the last row isn't an event.
+
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=int)
+
+    last = ends - 1
+    length = last - run_starts(y, starts)[last] + 1
+    return (length * y[last]).astype(int)
+
+
+def longest_streak(y, starts, ends):
+    """
+    Return length of the longest run of events in each group.
+
+    Parameters
+    ----------
+    y : numpy array of int
+        Indicator of event, 1 or 0, for each row.
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+
+    Returns
+    -------
+    streak : numpy array of int
+        Length of longest run, zero where a group has no events.
+
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=int)
+
+    # length of each run, counted only for runs of events
+    first = np.flatnonzero(run_starts(y, starts) == np.arange(len(y)))
+    length = np.diff(np.append(first, len(y))) * y[first]
+
+    # runs never cross groups, so each group starts a run
+    group_first = np.searchsorted(first, starts)
+    streak = np.maximum.reduceat(length, group_first)
+    return streak.astype(int)
+
+
+def last_n_pct(y, starts, ends, n=5):
+    """
+    Return share of events in the last n rows of each group.
+
+    Parameters
+    ----------
+    y : numpy array of int
+        Indicator of event, 1 or 0, for each row.
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+    n : int, default 5
+        Number of most recent rows.
+
+    Returns
+    -------
+    pct : numpy array of float
+        Events in last n rows divided by n, missing for groups with
+        fewer than n rows.
+
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=float)
+
+    # events before each row, differenced over the last n rows of each group
+    total = np.concatenate([[0], np.cumsum(y)])
+    first = np.maximum(ends - n, starts)
+    pct = (total[ends] - total[first]) / float(n)
+    return np.where(ends - starts >= n, pct, np.nan)
+
+
+def ewm_form(y, starts, ends, alpha=0.2):
+    """
+    Return exponentially weighted mean at the end of each group.
+
+    Weights match pandas ewm with adjust=True, so the row i games before
+    the last has weight (1 - alpha) ** i.
+
+    Parameters
+    ----------
+    y : numpy array
+        Values of all rows, such as win indicators.
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+    alpha : float, default 0.2
+        Smoothing factor, 0 < alpha <= 1.
+
+    Returns
+    -------
+    form : numpy array of float
+        Weighted mean of each group.
+
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=float)
+
+    # rows from the end of each row's group
+    lengths = ends - starts
+    age = np.repeat(ends - 1, lengths) - np.arange(len(y))
+    weight = (1.0 - alpha) ** age
+
+    total = np.add.reduceat(weight * y, starts)
+    form = total / np.add.reduceat(weight, starts)
+    return form
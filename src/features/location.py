@@ -4,6 +4,17 @@ A module for transforming and linking data with the physical location of
 events, places, or teams. Uses latittude and longitude for geographical
 coordinates.
 
+Classes
+-------
+VenueIndex
+    A spatial index of venue coordinates for nearest and radius queries.
+
+GymMatcher
+    An index of gym names for fast fuzzy matching with blocked candidates.
+
+CoordinateResolver
+    City coordinates indexed by (city, state) for vectorized lookups.
+
 Functions
 ---------
 run
@@ -15,9 +26,21 @@ home_games
 neutral_games
     Return dataframe with coordinates for games at a neutral site.
 
+event_locations
+    Return dataframe with coordinates for games from nearby event games.
+
 locate_item
     Return the geographical coordinates of an item from a dictionary.
 
+coordinate_resolver
+    Return the CoordinateResolver of this process, loading it once.
+
+set_resolver
+    Set the CoordinateResolver of this process, such as in a worker.
+
+city_table
+    Return dataframe of all cities with state names, codes and coordinates.
+
 city_coordinates
     Return dict mapping cities to geographical coordinates.
 
@@ -45,6 +68,24 @@ schedule_team_ids
 game_distances
     Return dataframe with team distance to game.
 
+coordinate_array
+    Return array of coordinates indexed by integer item identifiers.
+
+location_array
+    Return array of coordinates from a sequence of coordinate tuples.
+
+location_tuples
+    Return list of coordinate tuples from an array of coordinates.
+
+haversine_miles
+    Return great-circle distances in miles between arrays of coordinates.
+
+sphere_points
+    Return array of unit-sphere xyz points from coordinates in degrees.
+
+chord_miles
+    Return great-circle miles from straight-line unit-sphere distances.
+
 travel_distance
     Return integer distance between a pair of geographical coordinates.
 
@@ -53,21 +94,53 @@ update_teams
 
 """
 import re
+import os
+import json
+import hashlib
+import unicodedata
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from geopy.distance import great_circle
+from scipy.spatial import cKDTree
+from rapidfuzz import fuzz
+from rapidfuzz import process
 from src.data.transfer import DBAssist
+from src.data.transfer import Subquery
 from src.data import clean
+from src.constants import CACHE_DIR
+from src.constants import CACHE_ENABLED
+
+# mean earth radius used by geopy great_circle, and kilometers per mile
+EARTH_RADIUS_KM = 6371.009
+KM_PER_MILE = 1.609344
+
+# max days between an unlocated neutral game and located games of both
+# teams for them to be treated as one event
+EVENT_DAYS = 3
+
+# max miles between a located game and the known venue it is matched to
+VENUE_MILES = 1
+
+# file of gym name matches kept across runs
+GYM_CACHE_FILE = os.path.join(CACHE_DIR, 'gym_matches.json')
+
+# number of least common tokens of a gym name used to find candidates in
+# each round, and max tokens used over all rounds
+GYM_BLOCK_TOKENS = 2
+GYM_MAX_TOKENS = 4
+
+# CoordinateResolver loaded in this process, by key 'cities'
+RESOLVERS = {}
 
-def run(modifier=None):
+def run(filters=None):
     """
     Return dataframe with unique game identifers and location of games.
 
     Parameters
     ----------
-    modifier : str
-        Modifier for MySQL query to pull game data from game_info table.
+    filters : dict
+        Filters for rows to pull from game_info table. See
+        transfer.compile_filters.
 
     Returns
     -------
@@ -76,16 +149,16 @@ def run(modifier=None):
 
     """
     # import games data, contains game and team identifiers
-    dba = DBAssist()
-    df = dba.return_data('game_info', modifier=modifier)
-    th = dba.return_data('team_home')
-    # connection no longer needed, close
-    dba.close()
+    with DBAssist.session() as dba:
+        df = dba.return_data('game_info', filters=filters)
+
+    # integer game keys for joins, string game id kept for output
+    df['game_key'] = clean.game_key_from_id(df['game_id'].values)
 
     # to add data on where game was hosted
-    th = home_games(th, df['game_id'].values)
-    
-    df = pd.merge(df, th, left_on='game_id', right_on='game_id', how='left')
+    th = home_games(filters)
+
+    df = pd.merge(df, th, on='game_key', how='left')
 
     # add column indicating host is neutral or not
     df['neutral'] = np.where(df['home_id'].isnull(), 1, 0)
@@ -95,54 +168,60 @@ def run(modifier=None):
 
     # create subset of all neutral games
     dfn = df[df['neutral'] == 1].copy().drop(['game_loc'], axis=1)
-    neutral = dfn['game_id'].values
+    neutral = dfn['game_key'].values
 
     # import available locations for neutral games
-    # contains game_id and location coordinates
+    # contains game_key and location coordinates
     games = neutral_games(neutral)
 
     # right merge to neutral games
-    dfn = pd.merge(dfn, games, how='right', left_on='game_id',
-                   right_on='game_id')
+    dfn = pd.merge(dfn, games, how='right', on='game_key')
 
     # combine non-neutral and neutral games
     df = pd.concat([dfh, dfn])
 
     # split location to longitude and lattitude for new table
-    df['latitude'] = map(lambda x: round(x[0], 3), df['game_loc'].values)
-    df['longitude'] = map(lambda x: round(x[1], 3), df['game_loc'].values)
+    df['latitude'] = [round(x[0], 3) for x in df['game_loc'].values]
+    df['longitude'] = [round(x[1], 3) for x in df['game_loc'].values]
     df = df[['game_id', 'latitude', 'longitude']]
 
     return df
 
 
-def home_games(df, game_id):
+def home_games(filters=None):
     """
     Return dataframe with identifiers and coordinates for games with a 
     home team.
 
+    Games are selected in the database with a Subquery filter on
+    game_info, so no list of game identifiers is sent with the query.
+
     Parameters
     ----------
-    game_id : list or array
-        List of game identifiers to select home games from.
+    filters : dict, default None, optional
+        Filters for rows of game_info to select home games from. See
+        transfer.compile_filters.
 
     Returns
     -------
     df : DataFrame
-        Contains game id, home team id, and coordinate location of game.
+        Contains game key, home team id, and coordinate location of game.
 
     """
-    df = df[df['game_id'].isin(game_id)]
+    # import home team rows for games selected from game_info
+    games = Subquery('game_info', 'game_id', filters=filters)
+    selected = {'home': 1, 'game_id__in': games}
+    with DBAssist.session() as dba:
+        df = dba.return_data('team_home', subset=['game_id', 'team_id'],
+                             filters=selected)
 
-    # identify home team for game locations
-    df = df[df['home'] == 1]
-    df = df.drop(['date', 'home'], axis=1)
     df = df.rename(columns={'team_id': 'home_id'})
+    df['game_key'] = clean.game_key_from_id(df['game_id'].values)
 
     team_map = team_coordinates(df['home_id'].values)
     home = df['home_id'].values
-    df['game_loc'] = map(lambda x: locate_item(x, team_map), home)
-    df = df[['game_id', 'home_id', 'game_loc']]
+    df['game_loc'] = [locate_item(x, team_map) for x in home]
+    df = df[['game_key', 'home_id', 'game_loc']]
 
     return df
 
@@ -158,68 +237,246 @@ def neutral_games(neutral):
     Parameters
     ----------
     neutral : list or array
-        List of game identifiers to select games from.
+        List of integer game keys to select games from.
 
     Returns
     -------
     all : DataFrame
-        Contains game id and coordinate location of game.
+        Contains game key and coordinate location of game.
 
     """
-    # import and merge game cities and cities data, available after 2010
-    dba = DBAssist()
-    games = dba.return_data('game_cities')
-    cities = dba.return_data('cities')
-
+    # import all game location sources in one session
+    with DBAssist.session() as dba:
+        games = dba.return_data('game_cities')
+        cities = dba.return_data('cities')
+        seasons = dba.return_data('seasons')
+        tg = dba.return_data('tourney_geog', filters={'season__lt': 2010})
+        # only neutral site games from the schedule are needed
+        mod = {'season__gte': 2003, 'season__lte': 2009, 'location': 'N'}
+        sg = dba.return_data('cbb_schedule', filters=mod)
+
+    # merge game cities and cities data, available after 2010
     df = pd.merge(games, cities, how='inner', left_on='city_id',
                   right_on='city_id')
 
-    # create game id and keep relevant games
-    seasons = dba.return_data('seasons')
+    # create game key and keep relevant games
     df = clean.date_from_daynum(df, seasons)
-    df = clean.order_team_id(df, ['wteam', 'lteam'])
-    df = clean.make_game_id(df)
-    df = df[df['game_id'].isin(neutral)]
+    df = clean.order_team_ids(df, ['wteam', 'lteam'])
+    df = clean.make_game_key(df)
+    df = df[df['game_key'].isin(neutral)].copy()
 
-    # import map of city coordinates,
-    city_map = city_coordinates(full_state=False)
+    # locate coordinates of game cities, keyed by state code
+    resolver = coordinate_resolver()
+    coords = resolver.locate_many(df['city'].values, df['state'].values,
+                                  full_state=False)
+    df['game_loc'] = location_tuples(coords)
 
-    # create array of (city,state) tuples, locate coordinates
-    city_state = zip(df['city'].values, df['state'].values)
-    df['game_loc'] = map(lambda x: locate_item(x, city_map), city_state)
-
-    # import and combine tourney games prior to 2010
-    tg = dba.return_data('tourney_geog', modifier='WHERE season < 2010')
-
-    # add unique game id from teams and date
-    seasons = dba.return_data('seasons')
+    # add unique game key from teams and date to tourney games before 2010
     tg = clean.date_from_daynum(tg, seasons)
-    tg = clean.order_team_id(tg, ['wteam', 'lteam'])
-    tg = clean.make_game_id(tg)
-    tg['game_loc'] = zip(tg['latitude'].values, tg['longitude'].values)
+    tg = clean.order_team_ids(tg, ['wteam', 'lteam'])
+    tg = clean.make_game_key(tg)
+    tg['game_loc'] = list(zip(tg['latitude'].values, tg['longitude'].values))
 
-    # import and clean games with gyms from scraped schedule
-    mod = 'WHERE season >= 2003 AND season <= 2009'
-    sg = dba.return_data('cbb_schedule', modifier=mod)
+    # clean games with gyms from scraped schedule
     sg = transform_schedule(sg)
 
     # remove tourney games already obtained above
-    sg = sg[~sg['game_id'].isin(tg['game_id'].values)]
+    sg = sg[~sg['game_key'].isin(tg['game_key'].values)].copy()
 
     # create gym location map and set game locations
     gym_map = gym_schedule_coordinates(sg)
-    sg['game_loc'] = map(lambda x: locate_item(x, gym_map), sg['gym'].values)
+    sg['game_loc'] = [locate_item(x, gym_map) for x in sg['gym'].values]
 
     # combine all games, keep games with valid locations
     all = pd.concat([df, tg, sg], sort=False)
     all = all[all['game_loc'].notnull()]
-    all = all[['game_id', 'game_loc']]
-    
-    dba.close()
+    all = all[['game_key', 'game_loc']].drop_duplicates(subset='game_key')
+
+    # games without a location take the venue of a nearby event game,
+    # with venues from game cities, tourney sites and gyms
+    sites = tg[['latitude', 'longitude']].values
+    venues = np.concatenate([coords, sites,
+                             location_array(list(gym_map.values()))])
+    index = VenueIndex(venues)
+    missing = np.setdiff1d(neutral, all['game_key'].values)
+    found = event_locations(missing, all, index)
+    all = pd.concat([all, found], ignore_index=True)
 
     return all
 
 
+def event_locations(game_key, located, index, days=EVENT_DAYS,
+                    max_miles=VENUE_MILES):
+    """
+    Return dataframe with coordinates for games from nearby event games.
+
+    Neutral site games are often part of multi-day events. For each team of
+    a game without a location, the closest in time located game of that
+    team within the given number of days is matched to its nearest known
+    venue. The game takes the venue's location only when both teams' games
+    are matched to the same venue within max_miles, so a game is never
+    given the site of just one team's earlier or later game.
+
+    Parameters
+    ----------
+    game_key : array of int
+        Game keys of games without a location.
+    located : DataFrame
+        Contains 'game_key' and 'game_loc' of games with a location.
+    index : VenueIndex
+        Index of known venues, as built in neutral_games.
+    days : int, default EVENT_DAYS
+        Max days between games of one event.
+    max_miles : float, default VENUE_MILES
+        Max miles between a located game and its matched venue.
+
+    Returns
+    -------
+    df : DataFrame
+        Contains game key and coordinate location of resolved games.
+
+    """
+    empty = pd.DataFrame({'game_key': np.array([], dtype=np.int64),
+                          'game_loc': []})
+    if len(game_key) == 0 or len(located) == 0 or len(index.coords) == 0:
+        return empty
+
+    # venue of each located game, -1 where no venue is close enough
+    coords = location_array(located['game_loc'].values)
+    miles, venue = index.nearest(coords[:, 0], coords[:, 1])
+    venue = np.where(miles <= max_miles, venue, -1)
+
+    # located games once for each team, sorted by team and day
+    dates, t1, t2 = clean.decode_game_key(located['game_key'].values)
+    day = dates.astype(np.int64)
+    teams = np.concatenate([t1, t2])
+    order = np.lexsort((np.concatenate([day, day]), teams))
+    team_day = (teams[order] << 32) | np.concatenate([day, day])[order]
+    team_venue = np.concatenate([venue, venue])[order]
+
+    # venue of the closest located game in time of each team
+    dates, m1, m2 = clean.decode_game_key(game_key)
+    miss_day = dates.astype(np.int64)
+    venues = []
+    for team_id in [m1, m2]:
+        best_gap = np.full(len(game_key), days + 1)
+        best = np.full(len(game_key), -1)
+        # located games of the team just before and after the missing game
+        after = np.searchsorted(team_day, (team_id << 32) | miss_day)
+        for pos in [after - 1, after]:
+            valid = (pos >= 0) & (pos < len(team_day))
+            pos = np.clip(pos, 0, len(team_day) - 1)
+            gap = np.abs((team_day[pos] & 0xFFFFFFFF) - miss_day)
+            better = (valid & ((team_day[pos] >> 32) == team_id) &
+                      (gap < best_gap))
+            best_gap = np.where(better, gap, best_gap)
+            best = np.where(better, team_venue[pos], best)
+        venues.append(best)
+
+    # keep games where both teams were at the same known venue
+    found = (venues[0] >= 0) & (venues[0] == venues[1])
+    df = pd.DataFrame({'game_key': np.asarray(game_key)[found]})
+    df['game_loc'] = location_tuples(index.coords[venues[0][found]])
+    return df
+
+
+class VenueIndex():
+    """
+    A spatial index of venue coordinates for nearest and radius queries.
+
+    Coordinates are stored as points on the unit sphere in a KD-tree, where
+    straight-line distance increases with great-circle distance.
+
+    Attributes
+    ----------
+    coords : numpy array of float64
+        Array of shape (number of venues, 2) with lattitude and longitude.
+    tree : scipy.spatial.cKDTree
+        Tree of unit-sphere xyz points of venues.
+
+    """
+    def __init__(self, coords):
+        """
+        Initialize VenueIndex instance.
+
+        Parameters
+        ----------
+        coords : numpy array of float
+            Array of shape (number of venues, 2) with lattitude and
+            longitude. Rows with missing values or repeated coordinates are
+            dropped.
+
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        coords = coords[~np.isnan(coords).any(axis=1)]
+        self.coords = np.unique(coords, axis=0)
+        self.tree = cKDTree(sphere_points(self.coords[:, 0],
+                                          self.coords[:, 1]))
+
+    def nearest(self, lat, lng, k=1):
+        """
+        Return distances and indexes of the k nearest venues to points.
+
+        Parameters
+        ----------
+        lat, lng : array of float
+            Lattitude and longitude in degrees of the query points.
+        k : int, default 1
+            Number of venues returned for each point.
+
+        Returns
+        -------
+        miles : numpy array of float
+            Great-circle distance to each venue, shape (points,) if k is 1,
+            else (points, k). Infinite where fewer than k venues exist.
+        venue : numpy array of int
+            Row of each venue in coords, len(coords) where none.
+
+        """
+        points = sphere_points(lat, lng)
+        chord, venue = self.tree.query(points, k=k)
+        return chord_miles(chord), venue
+
+    def within(self, lat, lng, miles):
+        """
+        Return indexes of venues within a distance of each point.
+
+        Parameters
+        ----------
+        lat, lng : array of float
+            Lattitude and longitude in degrees of the query points.
+        miles : float
+            Max great-circle distance.
+
+        Returns
+        -------
+        venues : list of list of int
+            Rows in coords of the venues within miles of each point.
+
+        """
+        angle = min(miles * KM_PER_MILE / EARTH_RADIUS_KM, np.pi)
+        chord = 2 * np.sin(angle / 2)
+        venues = self.tree.query_ball_point(sphere_points(lat, lng), chord)
+        return list(venues)
+
+
+def sphere_points(lat, lng):
+    """Return array of unit-sphere xyz points from coordinates in degrees."""
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+    lng = np.radians(np.atleast_1d(np.asarray(lng, dtype=np.float64)))
+    points = np.column_stack([np.cos(lat) * np.cos(lng),
+                              np.cos(lat) * np.sin(lng),
+                              np.sin(lat)])
+    return points
+
+
+def chord_miles(chord):
+    """Return great-circle miles from straight-line unit-sphere distances."""
+    angle = 2 * np.arcsin(np.clip(chord / 2, 0, 1))
+    miles = np.where(np.isinf(chord), np.inf, angle)
+    return miles * EARTH_RADIUS_KM / KM_PER_MILE
+
+
 def locate_item(item, item_map):
     """
     Return geographical coordinates of an item from a dictionary.
@@ -245,26 +502,166 @@ def locate_item(item, item_map):
     return result
 
 
-def city_coordinates(full_state=True):
+class CoordinateResolver():
     """
-    Return a dict mapping cities to lattitude and longitude.
+    City coordinates indexed by (city, state) for vectorized lookups.
 
-    Parameters
+    Cities are loaded once into an array of coordinates. City names and
+    states, as full state names or state codes, are indexed to integer
+    codes, and each (city, state) pair is packed into an int64 key in a
+    hashed index. Each key maps to the row of its first city, as in
+    city_coordinates. Many cities are located by coding their unique names,
+    one lookup of packed keys and an array gather. Instances hold no
+    database connection and can be pickled to worker processes.
+
+    Attributes
     ----------
-    full_state : bool, default True
-        Use the full state name in the unique key for each city.
+    coords : numpy array of float64
+        Array of shape (number of cities, 2) with lattitude and longitude.
+    cities : pandas Index
+        Unique city names.
+    states : dict
+        Maps full_state, True or False, to pandas Index of unique states.
+    keys : dict
+        Maps full_state to pandas Index of unique packed (city, state) keys.
+    rows : dict
+        Maps full_state to numpy array of the coords row of each key.
+
+    """
+    def __init__(self, cities=None):
+        """
+        Initialize CoordinateResolver instance.
+
+        Parameters
+        ----------
+        cities : DataFrame, default None, optional
+            Cities from city_table. If None, cities are read from the
+            database.
+
+        """
+        if cities is None:
+            cities = city_table()
+
+        self.coords = cities[['LATITUDE', 'LONGITUDE']].values.astype(
+            np.float64)
+        city_codes, uniques = pd.factorize(cities['CITY'].values)
+        self.cities = pd.Index(uniques)
+        self.states = {}
+        self.keys = {}
+        self.rows = {}
+        for full_state, state in [(True, 'STATE_NAME'), (False, 'STATE_CODE')]:
+            state_codes, uniques = pd.factorize(cities[state].values)
+            self.states[full_state] = pd.Index(uniques)
+            keys = self.pack(city_codes, state_codes, full_state)
+
+            # first row of each key, skipping missing cities or states
+            valid = keys >= 0
+            keys, first = np.unique(keys[valid], return_index=True)
+            self.keys[full_state] = pd.Index(keys)
+            self.rows[full_state] = np.flatnonzero(valid)[first]
+
+    def pack(self, city_codes, state_codes, full_state=True):
+        """Return int64 keys of city and state codes, -1 where missing."""
+        n_states = len(self.states[full_state])
+        keys = city_codes.astype(np.int64) * n_states + state_codes
+        return np.where((city_codes < 0) | (state_codes < 0), -1, keys)
+
+    def codes(self, values, index):
+        """Return position in index of each value, -1 where unknown."""
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        found = index.get_indexer(uniques)
+        return np.where(codes >= 0, found[codes], -1)
+
+    def positions(self, cities, states, full_state=True):
+        """Return coords row of each (city, state), -1 where unknown."""
+        city_codes = self.codes(cities, self.cities)
+        state_codes = self.codes(states, self.states[full_state])
+        keys = self.pack(city_codes, state_codes, full_state)
+
+        found = self.keys[full_state].get_indexer(keys)
+        found = np.where(keys >= 0, found, -1)
+        rows = np.where(found >= 0, self.rows[full_state][found], -1)
+        return rows
+
+    def locate_many(self, cities, states, full_state=True):
+        """
+        Return coordinates of each city.
+
+        Parameters
+        ----------
+        cities : array of str
+            City names.
+        states : array of str
+            State of each city, as full names or codes.
+        full_state : bool, default True
+            States are full state names if True, else state codes.
+
+        Returns
+        -------
+        coords : numpy array of float64
+            Array of shape (number of cities, 2), missing where unknown.
+
+        """
+        rows = self.positions(cities, states, full_state=full_state)
+        coords = self.coords[np.maximum(rows, 0)]
+        coords[rows < 0] = np.nan
+        return coords
+
+    def locate(self, city_state, full_state=True):
+        """Return tuple (lattitude, longitude) of a city, or None."""
+        coords = self.locate_many([city_state[0]], [city_state[1]],
+                                  full_state=full_state)
+        return location_tuples(coords)[0]
+
+    def coordinates(self, full_state=True):
+        """Return array of coordinates of each unique (city, state)."""
+        return self.coords[self.rows[full_state]]
+
+    def city_map(self, full_state=True):
+        """Return dict mapping (city, state) tuples to coordinates."""
+        n_states = len(self.states[full_state])
+        keys = self.keys[full_state].values
+        cities = self.cities[keys // n_states]
+        states = self.states[full_state][keys % n_states]
+        coords = location_tuples(self.coordinates(full_state))
+        return dict(zip(zip(cities, states), coords))
+
+
+def coordinate_resolver():
+    """
+    Return the CoordinateResolver of this process, loading it once.
 
     Returns
     -------
-    city_dict : dict
-        Keys are tuples (city, state), values are tuples (lattitude,longitude).
+    resolver : CoordinateResolver
+        Resolver of all cities from city_table.
+
+    """
+    if 'cities' not in RESOLVERS:
+        RESOLVERS['cities'] = CoordinateResolver()
+    return RESOLVERS['cities']
+
+
+def set_resolver(resolver):
+    """Set the CoordinateResolver of this process, such as in a worker."""
+    RESOLVERS['cities'] = resolver
+
+
+def city_table():
+    """
+    Return dataframe of all cities with state names, codes and coordinates.
+
+    Returns
+    -------
+    ct : DataFrame
+        Contains 'CITY', 'STATE_NAME', 'STATE_CODE', 'LATITUDE' and
+        'LONGITUDE' of US cities and supplemental cities.
 
     """
     # import and combine city and state data
-    dba = DBAssist()
-    usc = dba.return_data('us_cities')
-    uss = dba.return_data('us_states')
-    dba.close()
+    with DBAssist.session() as dba:
+        usc = dba.return_data('us_cities')
+        uss = dba.return_data('us_states')
 
     uss = uss.rename(columns={'ID': 'ID_STATE'})
     df = pd.merge(usc, uss, left_on='ID_STATE', right_on='ID_STATE',
@@ -279,27 +676,31 @@ def city_coordinates(full_state=True):
     sc = manual_cities(state_map)
 
     # combine all cities into one set
-    ct = pd.concat([df, sc], sort=False)
+    ct = pd.concat([df, sc], sort=False, ignore_index=True)
 
     # replace strings for consistency across data sources
     ct['CITY'] = ct['CITY'].str.replace('Saint', 'St.')
 
-    # specify which state identifier to use
-    if full_state is True:
-        state = 'STATE_NAME'
-    else:
-        state = 'STATE_CODE'
+    ct = ct[['CITY', 'STATE_NAME', 'STATE_CODE', 'LATITUDE', 'LONGITUDE']]
+    return ct
 
-    # keep just the columns needed for the map
-    ct = ct[['CITY', state, 'LATITUDE', 'LONGITUDE']]
-    ct = ct.drop_duplicates(subset=['CITY', state])
 
-    # create dict with tuples as keys (city, state) and values (lat, lng)
-    ct['city_state'] = zip(ct['CITY'].values, ct[state].values)
-    ct['lat_lng'] = zip(ct['LATITUDE'].values, ct['LONGITUDE'].values)
-    ct = ct.set_index('city_state')
-    city_dict = ct['lat_lng'].to_dict()
+def city_coordinates(full_state=True):
+    """
+    Return a dict mapping cities to lattitude and longitude.
 
+    Parameters
+    ----------
+    full_state : bool, default True
+        Use the full state name in the unique key for each city.
+
+    Returns
+    -------
+    city_dict : dict
+        Keys are tuples (city, state), values are tuples (lattitude,longitude).
+
+    """
+    city_dict = coordinate_resolver().city_map(full_state=full_state)
     return city_dict
 
 
@@ -320,9 +721,8 @@ def manual_cities(state_map):
 
     """
     # import data for supplemental cities
-    dba = DBAssist()
-    df = dba.return_data('cities_manual')
-    dba.close()
+    with DBAssist.session() as dba:
+        df = dba.return_data('cities_manual')
 
     df = df.rename(columns={'city': 'CITY',
                             'state': 'STATE_CODE',
@@ -357,15 +757,13 @@ def team_coordinates(team_id):
         Keys are integer team ids, values are tuples (lattitude,longitude).
 
     """
-    # import team geography data, select teams
-    dba = DBAssist()
-    df = dba.return_data('team_geog')
-    dba.close()
+    # import team geography data for selected teams
+    filters = {'team_id__in': pd.unique(team_id)}
+    with DBAssist.session() as dba:
+        df = dba.return_data('team_geog', filters=filters)
 
-    df = df[df['team_id'].isin(team_id)]
-    
     # create map with (lattitude, longitude) tuples as values
-    df['lat_lng'] = zip(df['latitude'].values, df['longitude'].values)
+    df['lat_lng'] = list(zip(df['latitude'].values, df['longitude'].values))
     df = df.set_index('team_id')
     team_map = df['lat_lng'].to_dict()
 
@@ -390,9 +788,8 @@ def gym_schedule_coordinates(df):
 
     """
     # get dict with keys as gym names and values as (city_state) locations
-    dba = DBAssist()
-    gg = dba.return_data('game_gym')
-    dba.close()
+    with DBAssist.session() as dba:
+        gg = dba.return_data('game_gym')
 
     gym_map = gym_city_coordinates(gg)
 
@@ -405,9 +802,8 @@ def gym_schedule_coordinates(df):
     df_out = df[~in_dict].copy()
     
     #  add fuzzy-matched gym names
-    options = gym_map.keys()
-    names = df_out['gym'].values
-    df_out['fuzz'] = map(lambda x: match_gym(x, options), names)
+    matcher = GymMatcher(list(gym_map.keys()))
+    df_out['fuzz'] = matcher.match_many(df_out['gym'].values)
 
     # combine merged and fuzzy matched gym location data
     gyms = pd.concat([df_in, df_out], sort=False)
@@ -417,7 +813,7 @@ def gym_schedule_coordinates(df):
     locate = np.where(gyms['fuzz'].isnull(), gym_orig, gym_fuzz)
     
     # get coordinates for each gym in locate
-    gyms['gym_loc'] = map(lambda x: locate_item(x, gym_map), locate)
+    gyms['gym_loc'] = [locate_item(x, gym_map) for x in locate]
     
     # create and return gym: location map
     gyms = gyms.set_index('gym')
@@ -444,15 +840,224 @@ def match_gym(name, options):
         The string with the highest match score.
 
     """
-    try:
-        result = clean.fuzzy_match(name, options, cutoff=90)
-    # to catch strings with remaining unicode
-    except TypeError:
-        result = None
-
+    matcher = GymMatcher(list(options), cache_file=None)
+    result = matcher.match(name)
     return result
 
 
+class GymMatcher():
+    """
+    An index of gym names for fast fuzzy matching with blocked candidates.
+
+    Names are folded to ascii and processed as in fuzzywuzzy's full_process
+    before matching, so accented and stray unicode characters compare
+    equal to their plain forms. Each name is scored only against options
+    sharing one of its GYM_BLOCK_TOKENS least common tokens and that could
+    reach the cutoff given their lengths. If none of those meet the cutoff,
+    the next least common tokens are tried, up to GYM_MAX_TOKENS tokens.
+    Options sharing no token with a name are never scored, so typos that
+    join two words can go unmatched, and a name matched in an early round
+    is not compared with options found by later tokens. Scores are the
+    fuzz.ratio used by clean.fuzzy_match. Results are kept in a json file
+    and reused while the options and cutoff are unchanged.
+
+    Attributes
+    ----------
+    options : list of str
+        Gym names to match to.
+    processed : list of str
+        Folded and processed version of each option.
+    lengths : numpy array of int
+        Length of each processed option.
+    tokens : dict
+        Maps each token to array of positions of options containing it.
+    cutoff : int
+        Minimum similarity score required for a match.
+    cache_file : str or None
+        Path of json file of stored matches, None to not store matches.
+    cache : dict
+        Stored matches keyed by processed name.
+
+    """
+    def __init__(self, options, cutoff=90,
+                 cache_file=GYM_CACHE_FILE if CACHE_ENABLED else None):
+        """
+        Initialize GymMatcher instance.
+
+        Parameters
+        ----------
+        options : list of str
+            Gym names to match to.
+        cutoff : int, default 90
+            Minimum similarity score required for a match.
+        cache_file : str, default GYM_CACHE_FILE, optional
+            Path of json file of stored matches. If None, matches are not
+            stored.
+
+        """
+        self.options = list(options)
+        self.processed = [self.process(x) for x in self.options]
+        self.lengths = np.array([len(x) for x in self.processed])
+        self.cutoff = cutoff
+
+        postings = {}
+        for i, name in enumerate(self.processed):
+            for token in set(name.split()):
+                postings.setdefault(token, []).append(i)
+        self.tokens = {k: np.array(v) for k, v in postings.items()}
+
+        self.cache_file = cache_file
+        self.cache = self.read_cache()
+
+    def process(self, name):
+        """Return name folded to ascii and processed for fuzzy scoring."""
+        name = unicodedata.normalize('NFKD', str(name))
+        name = name.encode('ascii', 'ignore').decode('ascii')
+        name = re.sub(r'\W', ' ', name).lower()
+        return ' '.join(name.split())
+
+    def version(self):
+        """Return str identifying the options, cutoff and token limits."""
+        text = json.dumps([self.cutoff, GYM_BLOCK_TOKENS, GYM_MAX_TOKENS,
+                           self.options])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def read_cache(self):
+        """Return dict of stored matches made with the same options."""
+        if self.cache_file is None:
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                stored = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if stored.get('version') != self.version():
+            return {}
+        return stored['matches']
+
+    def write_cache(self):
+        """Save stored matches to the cache file."""
+        if self.cache_file is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        stored = {'version': self.version(), 'matches': self.cache}
+        temp_file = "{}.{}".format(self.cache_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(stored, f)
+        os.replace(temp_file, self.cache_file)
+
+    def candidates(self, name):
+        """
+        Return positions of options that could match a processed name.
+
+        Parameters
+        ----------
+        name : str
+            Processed gym name.
+
+        Returns
+        -------
+        blocks : list of numpy array of int
+            Positions in options of candidates in each round, in order.
+            Options are in at most one round.
+
+        """
+        # postings of the least common known tokens of the name
+        postings = [self.tokens[x] for x in set(name.split())
+                    if x in self.tokens]
+        postings.sort(key=len)
+        postings = postings[:GYM_MAX_TOKENS]
+
+        blocks = []
+        seen = np.array([], dtype=int)
+        for i in range(0, len(postings), GYM_BLOCK_TOKENS):
+            block = np.unique(np.concatenate(postings[i:i + GYM_BLOCK_TOKENS]))
+            block = np.setdiff1d(block, seen, assume_unique=True)
+            seen = np.union1d(seen, block)
+
+            # upper bound of ratio is 2 * min(len) / (sum of len)
+            lengths = self.lengths[block]
+            lensum = np.maximum(lengths + len(name), 1)
+            upper = np.round(100 * 2.0 * np.minimum(lengths, len(name)) /
+                             lensum)
+            blocks.append(block[upper >= self.cutoff])
+
+        return blocks
+
+    def match(self, name):
+        """
+        Return the best matching option for a gym name.
+
+        Parameters
+        ----------
+        name : str
+            Gym name to match.
+
+        Returns
+        -------
+        result : str or None
+            Best matching option, or None if no score meets the cutoff.
+
+        """
+        return self.match_many([name])[0]
+
+    def match_many(self, names):
+        """
+        Return the best matching option for each gym name.
+
+        Parameters
+        ----------
+        names : list of str
+            Gym names to match.
+
+        Returns
+        -------
+        results : list of str or None
+            Best matching option for each name, None if no score meets the
+            cutoff.
+
+        """
+        results = []
+        added = False
+        for name in names:
+            processed = self.process(name)
+            if processed not in self.cache:
+                self.cache[processed] = self.score(processed)
+                added = True
+            results.append(self.cache[processed])
+
+        if added:
+            self.write_cache()
+        return results
+
+    def score(self, name):
+        """Return best option for a processed name scored with fuzz.ratio."""
+        if len(name) == 0:
+            return None
+
+        # later rounds only if earlier candidates miss the cutoff
+        for keep in self.candidates(name):
+            result = self.best(name, keep)
+            if result is not None:
+                return result
+        return None
+
+    def best(self, name, keep):
+        """Return best option of candidates meeting the cutoff, or None."""
+        if len(keep) == 0:
+            return None
+
+        choices = [self.processed[i] for i in keep]
+        scores = process.cdist([name], choices, scorer=fuzz.ratio)[0]
+        scores = np.round(scores)
+
+        # on ties keep first option, as in clean.fuzzy_match
+        best = int(np.argmax(scores))
+        if scores[best] < self.cutoff:
+            return None
+        return self.options[keep[best]]
+
+
 def gym_city_coordinates(df):
     """
     Return a dict mapping gym names from external source of gym cities
@@ -488,22 +1093,18 @@ def gym_city_coordinates(df):
     # after cleaning some duplicates remain, remove them
     df = df[~df['gym'].duplicated()]
     df = df.set_index('gym')
-    df['city_state'] = zip(df['city'].values, df['state'].values)
 
-    # dict of coordinates for cities
-    city_map = city_coordinates(full_state=True)
-    
     # create dict mapping gyms to city coordinates
-    city_state = df['city_state'].values
-    df['game_loc'] = map(lambda x: locate_item(x, city_map), city_state)
+    coords = coordinate_resolver().locate_many(df['city'].values,
+                                               df['state'].values)
+    df['game_loc'] = location_tuples(coords)
     gym_dict = df['game_loc'].to_dict()
 
     # update dict with manual gym locations
-    dba = DBAssist()
-    gm = dba.return_data('gym_manual', modifier=None)
-    dba.close()
+    with DBAssist.session() as dba:
+        gm = dba.return_data('gym_manual')
 
-    gm['game_loc'] = zip(gm['lat'].values, gm['lng'].values)
+    gm['game_loc'] = list(zip(gm['lat'].values, gm['lng'].values))
     gm = gm.set_index('gym')['game_loc'].to_dict()
     gym_dict.update(gm)
 
@@ -512,11 +1113,11 @@ def gym_city_coordinates(df):
 
 def transform_schedule(df):
     """
-    Return dataframe with unique game identifier and gym name for games 
+    Return dataframe with unique game key and gym name for games 
     scraped from team schedules.
     
     Sequence of data transformations create the project game
-    identifier and prepare gym names for merging with gym city/state data.
+    key and prepare gym names for merging with gym city/state data.
 
     Parameters
     ----------
@@ -526,12 +1127,12 @@ def transform_schedule(df):
     Returns
     -------
     dft : DataFrame
-        Transformed data with game identifier and gym name.
+        Transformed data with game key and gym name.
 
     """    
     # only use neutral site games with gym values
     dft = df[df['location'] == 'N']
-    dft = dft[dft['gym'].notnull()]
+    dft = dft[dft['gym'].notnull()].copy()
 
     # clean gym values for better alignment with gym city data
     def clean_gym(name):
@@ -541,23 +1142,23 @@ def transform_schedule(df):
             new_name = 'josa miguel agrelot coliseum'
         return new_name
     
-    dft['gym'] = map(clean_gym, dft['gym'].values)
-    # need standard date to create game id
-    dft['date'] = map(convert_schedule_date, dft.date.values)
+    dft['gym'] = [clean_gym(x) for x in dft['gym'].values]
+    # need standard date to create game key
+    dft['date'] = [convert_schedule_date(x) for x in dft['date'].values]
     # clean up opponent names by removing team ranks
-    dft['opponent'] = map(lambda x: re.sub(r"\(\d*\)", "", x).rstrip(),
-                         dft['opponent'].values)
+    dft['opponent'] = [re.sub(r"\(\d*\)", "", x).rstrip()
+                       for x in dft['opponent'].values]
 
-    # obtain team numeric ids and game id for each game
+    # obtain team numeric ids and game key for each game
     dft = schedule_team_ids(dft)
-    df = clean.order_team_id(df, 'team_id', 'opp_id')
-    df = clean.make_game_id(df)
+    dft = clean.order_team_ids(dft, ['team_id', 'opp_id'])
+    dft = clean.make_game_key(dft)
     
     # isolate unique gym names for matching to gym locations
-    dft = dft[['game_id', 'gym']]
+    dft = dft[['game_key', 'gym']]
 
     # each game has 2 rows (1 for each team), keep one
-    dft = dft.drop_duplicates(subset='game_id')
+    dft = dft.drop_duplicates(subset='game_key')
 
     return dft
 
@@ -601,20 +1202,18 @@ def schedule_team_ids(df):
         Contains team numeric ids for both teams in the game.
 
     """
-    dba = DBAssist()
-    tk = dba.return_data('team_key')
+    with DBAssist.session() as dba:
+        tk = dba.return_data('team_key')
+        # schedule data uses names from both team_key and team_sched
+        ts = dba.return_data('team_sched')
+
     tk = tk[['team_id', 'team_ss']].copy()
     tk = tk.drop_duplicates()
 
-    # import and merge the team names from team schedule links
-    # schedule data uses names from both team_key and team_sched
-    ts = dba.return_data('team_sched')
+    # merge the team names from team schedule links
     ts['team_ss'] = ts['team_ss'].replace('Cal State Long Beach',
                                           'Long Beach State')
     
-    # connection no longer needed
-    dba.close()
-    
     # inner merge because only need ids for teams in team_sched
     tk = pd.merge(ts, tk, left_on='team_ss', right_on='team_ss', how='inner')
     tk['team_id'] = tk['team_id'].astype(int)
@@ -632,7 +1231,7 @@ def schedule_team_ids(df):
     return df
 
 
-def game_distances(df, team_map):
+def game_distances(df, team_map, dtype=np.float64, matrix=None):
     """
     Return dataframe with distance to game computed for both teams.
 
@@ -643,25 +1242,144 @@ def game_distances(df, team_map):
         numeric identifiers.
     team_map : dict
         Dict mapping team numeric identifers to geographical coordinates.
+    dtype : numpy float type, default numpy.float64
+        Float type used to compute distances. Not used when matrix is
+        given, as the matrix stores float32 distances.
+    matrix : travel.DistanceMatrix, default None, optional
+        If given, distances are read from this persisted matrix, adding
+        teams and venues not yet in it, instead of computed.
 
     Returns
     -------
     df : DataFrame
         Contains distance (in miles) to game in separate column for each team.
+        Distances are missing where a location is unknown.
 
     """
+    game = location_array(df['game_loc'].values)
 
-    # get locations for both teams in game
-    t1 = map(lambda x: locate_item(x, team_map), df['t1_team_id'].values)
-    t2 = map(lambda x: locate_item(x, team_map), df['t2_team_id'].values)
+    # both teams stacked to get distances in one call
+    team_ids = np.concatenate([df['t1_team_id'].values,
+                               df['t2_team_id'].values]).astype(np.int64)
+    game = np.concatenate([game, game])
 
-    # use locations to set travel distance for both teams
-    df['t1_dist'] = map(travel_distance, zip(df['game_loc'].values, t1))
-    df['t2_dist'] = map(travel_distance, zip(df['game_loc'].values, t2))
+    if matrix is not None:
+        matrix.add_teams(team_map)
+        miles = matrix.lookup(team_ids, game).astype(np.float64)
+    else:
+        # gather teams' coordinates from array indexed by team id
+        coords = coordinate_array(team_map)
+        known = (team_ids >= 0) & (team_ids < len(coords))
+        team = np.full((len(team_ids), 2), np.nan)
+        team[known] = coords[team_ids[known]]
+        miles = haversine_miles(game[:, 0], game[:, 1], team[:, 0],
+                                team[:, 1], dtype=dtype)
+    miles = np.trunc(miles)
+    if not np.isnan(miles).any():
+        miles = miles.astype(int)
+
+    df['t1_dist'] = miles[:len(df)]
+    df['t2_dist'] = miles[len(df):]
 
     return df
 
 
+def coordinate_array(item_map):
+    """
+    Return array of coordinates indexed by integer item identifiers.
+
+    Parameters
+    ----------
+    item_map : dict
+        Keys are non-negative integer ids, values are tuples
+        (lattitude, longitude).
+
+    Returns
+    -------
+    coords : numpy array of float64
+        Array of shape (max id + 1, 2), rows of ids not in item_map missing.
+
+    """
+    ids = np.array([int(x) for x in item_map.keys()], dtype=np.int64)
+    size = ids.max() + 1 if len(ids) > 0 else 0
+    coords = np.full((size, 2), np.nan)
+    coords[ids] = location_array(list(item_map.values()))
+    return coords
+
+
+def location_array(locations):
+    """
+    Return array of coordinates from a sequence of coordinate tuples.
+
+    Parameters
+    ----------
+    locations : list or array
+        Tuples (lattitude, longitude), or None where unknown.
+
+    Returns
+    -------
+    coords : numpy array of float64
+        Array of shape (number of locations, 2), missing where unknown.
+
+    """
+    missing = (np.nan, np.nan)
+    coords = [missing if x is None else x for x in locations]
+    return np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def location_tuples(coords):
+    """
+    Return list of coordinate tuples from an array of coordinates.
+
+    Parameters
+    ----------
+    coords : numpy array of float
+        Array of shape (number of locations, 2), missing where unknown.
+
+    Returns
+    -------
+    locations : list
+        Tuples (lattitude, longitude), or None where unknown.
+
+    """
+    known = ~np.isnan(coords).any(axis=1)
+    values = coords.tolist()
+    locations = [tuple(x) if k else None for x, k in zip(values, known)]
+    return locations
+
+
+def haversine_miles(lat1, lon1, lat2, lon2, dtype=np.float64):
+    """
+    Return great-circle distances in miles between arrays of coordinates.
+
+    Uses the same mean earth radius as geopy's great_circle.
+
+    Parameters
+    ----------
+    lat1, lon1 : array of float
+        Lattitude and longitude in degrees of the first points.
+    lat2, lon2 : array of float
+        Lattitude and longitude in degrees of the second points.
+    dtype : numpy float type, default numpy.float64
+        Float type used in the computation, numpy.float32 for less memory.
+
+    Returns
+    -------
+    miles : numpy array of float
+        Distance between each pair of points.
+
+    """
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(x, dtype=dtype))
+                              for x in (lat1, lon1, lat2, lon2)]
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    angle = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    miles = angle * dtype(EARTH_RADIUS_KM / KM_PER_MILE)
+    return miles
+
+
 def travel_distance(point_pair):
     """
     Return integer distance between a pair of geographical coordinates.
@@ -678,7 +1396,8 @@ def travel_distance(point_pair):
         The distance (in miles) between the pair of points.
 
     """
-    distance = int(great_circle(point_pair[0], point_pair[1]).miles)
+    (lat1, lon1), (lat2, lon2) = point_pair
+    distance = int(haversine_miles(lat1, lon1, lat2, lon2))
     return distance
 
 
@@ -708,17 +1427,19 @@ def update_teams(df, team_cities):
     teams_add = [x for x in team_cities if x[0] not in teams_have]
 
     if len(teams_add) > 0:
-        # import map of cities to get coordinates from
-        cm = city_coordinates()
-        data_add = []
-
         # obtain id, lattitude, longitude for each team
-        for row in teams_add:
-            lat, lng = cm[row[1]][0], cm[row[1]][1]
-            team_data = [row[0], lat, lng]
-            data_add.append(team_data)
+        cities = [x[1][0] for x in teams_add]
+        states = [x[1][1] for x in teams_add]
+        coords = coordinate_resolver().locate_many(cities, states)
+
+        missing = np.isnan(coords[:, 0])
+        if missing.any():
+            unknown = [teams_add[i][1] for i in np.flatnonzero(missing)]
+            raise KeyError("no coordinates for cities {}".format(unknown))
 
         # insert new data to table
+        team_ids = [x[0] for x in teams_add]
+        data_add = list(zip(team_ids, coords[:, 0], coords[:, 1]))
         df_add = pd.DataFrame(data_add, columns=list(df.columns))
 
     return df_add
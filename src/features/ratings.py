@@ -6,16 +6,8 @@ from src.data import clean
 def compile():
     ratings_files = clean.s3_folder_files('team_ratings')
 
-    df_list = []
-    for file in ratings_files:
-        df = clean.s3_data(file)
-        df.columns = map(str.lower, df.columns)
-        if 'season' in df.columns:
-            pass
-        else:
-            season = re.findall('\d+', file)[0]
-            df['season'] = int('20{}'.format(season))
-        df_list.append(df)
+    # files downloaded and parsed concurrently
+    df_list = clean.s3_objects_data(ratings_files, parse=ratings_season)
 
     ratings = pd.concat(df_list)
     ratings['em'] = np.where(ratings['em'].isnull(), ratings['adjem'],
@@ -25,3 +17,18 @@ def compile():
     ratings = ratings.drop(columns=['adjem', 'rankadjem'])
     
     return ratings
+
+
+def ratings_season(df, file):
+    """Return ratings from one file with lowercase columns and a season.
+
+    Files without a season column take it from the two digit year in the
+    file name.
+    """
+    df.columns = list(map(str.lower, df.columns))
+    if 'season' in df.columns:
+        pass
+    else:
+        season = re.findall(r'\d+', file)[0]
+        df['season'] = int('20{}'.format(season))
+    return df
@@ -0,0 +1,370 @@
+""" rolling.
+
+A module for computing team statistics as of a point in a season, using
+only games played before that day. Statistics are the per-game averages
+summarized at the end of each season in team.summary_by_season.
+
+Classes
+-------
+RollingStats
+    Cumulative team game stats answering point-in-time lookups.
+
+Functions
+---------
+stat_keys
+    Return int64 keys ordering rows by season, team and day.
+
+stat_sums
+    Return running sums of stats, counts of values and squared margins.
+
+run_sums
+    Return cumulative sums of rows restarting at each sorted group.
+
+"""
+import numpy as np
+import pandas as pd
+from src.features import team
+from src.features import kernels
+
+# per-game stats averaged over games, with names of averaged columns
+MEAN_STATS = team.MEAN_STATS + ['team_win']
+STAT_NAMES = [team.STAT_NAMES.get(x, x) for x in team.MEAN_STATS] + ['winpct']
+
+# bits of the sort key holding the day number and the team id
+DAY_BITS = 10
+TEAM_BITS = 20
+
+# columns identifying one game of a team, a team may play twice in a day
+GAME_COLUMNS = ['season', 'daynum', 'team_id', 'opp_id']
+
+
+class RollingStats():
+    """
+    Cumulative team game stats answering point-in-time lookups.
+
+    Game rows are indexed by keys sorted by season, team and day, where
+    games of a team on the same day share a key, with running sums of each stat over the team's games of the season up to
+    each row. Stats for a team before a given day are the running sums at
+    the team's last earlier row, found by binary search, so each lookup is
+    O(log n) and lookups for many games are one vectorized pass.
+
+    New rows that all come after the last stored day of their team's
+    season, as for each new day of games, are inserted at the end of their
+    team's rows with sums continued from the stored ones, and no stored
+    row is sorted or summed again. Other new rows rebuild the index.
+
+    Attributes
+    ----------
+    games : pandas DataFrame
+        Team game rows with season, daynum, team_id, opp_id and stat
+        columns, in the order they were added.
+    keys : numpy array of int64
+        Sorted key of each row packed from season, team_id and daynum.
+    totals : numpy array of float64
+        Sums of each stat over the team's season rows up to each row in
+        keys order, missing values counted as zero.
+    counts : numpy array of int64
+        Counts of non-missing values of each stat up to each row.
+    squares : numpy array of float64
+        Sums of squared scoring margin up to each row.
+
+    """
+    def __init__(self, team_games):
+        """
+        Initialize RollingStats instance.
+
+        Parameters
+        ----------
+        team_games : pandas DataFrame
+            Game stats with one row per team, from
+            team.split_games_to_teams.
+
+        """
+        self.games = None
+        self.update(team_games)
+
+    def update(self, team_games):
+        """
+        Add team game rows, inserting them or rebuilding the index.
+
+        Parameters
+        ----------
+        team_games : pandas DataFrame
+            Game stats with one row per team, from
+            team.split_games_to_teams.
+
+        """
+        df = team.add_computed_stats(team_games.copy())
+        df = df[GAME_COLUMNS + MEAN_STATS]
+        df = df.drop_duplicates(subset=GAME_COLUMNS, keep='last')
+        if self.games is None or len(self.keys) == 0:
+            self.rebuild(pd.concat([self.games, df], ignore_index=True))
+            return
+        if len(df) == 0:
+            return
+
+        keys = stat_keys(df['season'].values, df['team_id'].values,
+                         df['daynum'].values)
+        order = np.argsort(keys, kind='mergesort')
+        df = df.iloc[order].reset_index(drop=True)
+        keys = keys[order]
+
+        # new rows must come after the stored rows of their team season
+        group = keys >> DAY_BITS
+        pos = np.searchsorted(self.keys, keys)
+        after = np.minimum(pos, len(self.keys) - 1)
+        later = (pos == len(self.keys)) | ((self.keys[after] >> DAY_BITS) !=
+                                           group)
+        if not later.all():
+            self.rebuild(pd.concat([self.games, df], ignore_index=True))
+            return
+
+        # continue sums from the last stored row of each team season
+        totals, counts, squares = stat_sums(df)
+        before = np.maximum(pos - 1, 0)
+        same = (pos > 0) & ((self.keys[before] >> DAY_BITS) == group)
+        if same.any():
+            totals[same] += self.totals[before[same]]
+            counts[same] += self.counts[before[same]]
+            squares[same] += self.squares[before[same]]
+
+        self.games = pd.concat([self.games, df], ignore_index=True)
+        self.keys = np.insert(self.keys, pos, keys)
+        self.totals = np.insert(self.totals, pos, totals, axis=0)
+        self.counts = np.insert(self.counts, pos, counts, axis=0)
+        self.squares = np.insert(self.squares, pos, squares)
+
+    def rebuild(self, df):
+        """Replace stored rows with all rows of df and rebuild the index."""
+        df = df.drop_duplicates(subset=GAME_COLUMNS,
+                                keep='last').reset_index(drop=True)
+        keys = stat_keys(df['season'].values, df['team_id'].values,
+                         df['daynum'].values)
+        order = np.argsort(keys, kind='mergesort')
+
+        self.games = df
+        self.keys = keys[order]
+        self.totals, self.counts, self.squares = stat_sums(df.iloc[order])
+
+    def positions(self, season, team_id, daynum):
+        """
+        Return positions bounding rows of each team before each day.
+
+        Parameters
+        ----------
+        season : array of int
+            Season of each lookup.
+        team_id : array of int
+            Team numeric identifier of each lookup.
+        daynum : array of int
+            Day number of each lookup, games on this day are excluded. Days
+            past the last possible day include all games of the season.
+
+        Returns
+        -------
+        start : numpy array of int
+            Position of the team's first game of the season.
+        stop : numpy array of int
+            Position after the team's last game before daynum.
+
+        """
+        first = stat_keys(season, team_id, 0)
+
+        # day added to the key of day 0, so days past the day bits stop at
+        # the key of the next team rather than mixing into the team bits
+        daynum = np.clip(np.asarray(daynum, dtype=np.int64), 0,
+                         1 << DAY_BITS)
+        start = np.searchsorted(self.keys, first)
+        stop = np.searchsorted(self.keys, first + daynum)
+        return start, stop
+
+    def as_of_many(self, season, team_id, daynum):
+        """
+        Return stats of teams from games before the given days.
+
+        Parameters
+        ----------
+        season : array of int
+            Season of each lookup.
+        team_id : array of int
+            Team numeric identifier of each lookup.
+        daynum : array of int
+            Day number of each lookup, games on this day are excluded.
+
+        Returns
+        -------
+        df : pandas DataFrame
+            One row per lookup with count of games and average stats,
+            missing where the team has no earlier games.
+
+        """
+        start, stop = self.positions(season, team_id, daynum)
+
+        # running sums at the team's last row before the day, if any
+        played = stop > start
+        counts = self.sums_at(self.counts, stop - 1, played)
+        sums = self.sums_at(self.totals, stop - 1, played)
+        squares = self.sums_at(self.squares, stop - 1, played)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / counts
+
+        df = pd.DataFrame(means, columns=STAT_NAMES)
+        df.insert(0, 'games', stop - start)
+
+        margin = sums[:, MEAN_STATS.index('scrmarg')]
+        df['scrmargsd'] = team.margin_sd(margin, squares, stop - start)
+
+        return df
+
+    def sums_at(self, values, rows, played):
+        """Return running sums at rows, zero where the team hasn't played."""
+        shape = (len(rows),) + values.shape[1:]
+        result = np.zeros(shape, dtype=values.dtype)
+        result[played] = values[rows[played]]
+        return result
+
+    def as_of(self, season, team_id, daynum):
+        """
+        Return stats of one team from games before a given day.
+
+        Parameters
+        ----------
+        season : int
+            Season of game.
+        team_id : int
+            Team numeric identifier.
+        daynum : int
+            Day number, games on this day are excluded.
+
+        Returns
+        -------
+        stats : pandas Series
+            Count of games and average stats.
+
+        """
+        df = self.as_of_many([season], [team_id], [daynum])
+        stats = df.iloc[0]
+        return stats
+
+    def fill_games(self, df):
+        """
+        Return games with stats of both teams from their earlier games.
+
+        Parameters
+        ----------
+        df : pandas DataFrame
+            Must contain 'season', 'daynum', 't1_team_id' and 't2_team_id'
+            columns.
+
+        Returns
+        -------
+        df : pandas DataFrame
+            Input data with stats of each team added in columns prefixed
+            with 't1_' and 't2_'.
+
+        """
+        df = df.copy()
+        for prefix in ['t1_', 't2_']:
+            stats = self.as_of_many(df['season'].values,
+                                    df[prefix + 'team_id'].values,
+                                    df['daynum'].values)
+            for col in stats.columns:
+                df[prefix + col] = stats[col].values
+
+        return df
+
+
+def stat_keys(season, team_id, daynum):
+    """
+    Return int64 keys ordering rows by season, team and day.
+
+    Parameters
+    ----------
+    season : array of int
+        Season of each row.
+    team_id : array of int
+        Team numeric identifier of each row.
+    daynum : array of int or int
+        Day number of each row.
+
+    Returns
+    -------
+    keys : numpy array of int64
+        Key of each row packed from season, team_id and daynum.
+
+    """
+    season = np.asarray(season, dtype=np.int64)
+    team_id = np.asarray(team_id, dtype=np.int64)
+    daynum = np.asarray(daynum, dtype=np.int64)
+
+    # each field must fit its bits, or keys would sort out of order
+    limits = [(season, 63 - TEAM_BITS - DAY_BITS, 'seasons'),
+              (team_id, TEAM_BITS, 'team ids'),
+              (daynum, DAY_BITS, 'day numbers')]
+    for values, bits, name in limits:
+        if ((values < 0) | (values >= 1 << bits)).any():
+            msg = "{} must be in range 0 to {}".format(name, 1 << bits)
+            raise ValueError(msg)
+
+    keys = ((season << (TEAM_BITS + DAY_BITS)) | (team_id << DAY_BITS) |
+            daynum)
+    return keys
+
+
+def stat_sums(df):
+    """
+    Return running sums of stats, counts of values and squared margins.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        Team game rows with MEAN_STATS columns, sorted by season, team_id
+        and daynum.
+
+    Returns
+    -------
+    totals : numpy array of float64
+        Sums of each stat over the team's season rows up to each row,
+        missing values counted as zero.
+    counts : numpy array of int64
+        Counts of non-missing values of each stat up to each row.
+    squares : numpy array of float64
+        Sums of squared scoring margin up to each row.
+
+    """
+    starts, ends = kernels.group_bounds(df['season'].values,
+                                        df['team_id'].values)
+    values = df[MEAN_STATS].values.astype(float)
+    valid = ~np.isnan(values)
+    totals = run_sums(np.where(valid, values, 0), starts, ends)
+    counts = run_sums(valid.astype(np.int64), starts, ends)
+
+    margin = np.nan_to_num(df['scrmarg'].values.astype(float))
+    squares = run_sums(margin ** 2, starts, ends)
+    return totals, counts, squares
+
+
+def run_sums(values, starts, ends):
+    """
+    Return cumulative sums of rows restarting at each sorted group.
+
+    Parameters
+    ----------
+    values : numpy array
+        Array of values to sum down rows, with rows of each group
+        contiguous.
+    starts : numpy array of int
+        Position of the first row of each group.
+    ends : numpy array of int
+        Position after the last row of each group.
+
+    Returns
+    -------
+    totals : numpy array
+        Row i holds the sum of rows of its group up to and including i.
+
+    """
+    # sums within each group, so an infinite value stays in its group
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    totals = pd.DataFrame(values).groupby(group).cumsum()
+    return totals.to_numpy(copy=True).reshape(values.shape)
@@ -2,22 +2,176 @@ import pandas as pd
 import numpy as np
 from src.data.transfer import DBAssist
 from src.data import clean
+from src.features import kernels
+
+# per-game stats averaged in team season stats
+MEAN_STATS = ['team_score', 'opp_score', 'scrmarg', 'ftrat', 'ftmrat',
+              'ftrat_d', 'efgpct', 'efgpct_d', 'drbpct', 'orbpct',
+              'orbtomarg', 'topct', 'topct_d']
+
+# names of averaged stats in team season stats, where renamed
+STAT_NAMES = {'team_score': 'ppg', 'opp_score': 'ppg_d'}
+
+# number of most recent results kept in running season state
+RECENT_GAMES = 10
 
 
 def summary_by_season(team_games):
+    """Return dataframe of team stats with one row per team per season."""
     team_games = prep_stats_by_team(team_games)
-    team_games = team_games.sort_values(['team_id', 'date'])
+    team_games = team_games.sort_values(['season', 'team_id', 'date'],
+                                        kind='mergesort')
     team_summary = compute_summary(team_games)
     return team_summary
 
 
-def tourney_performance(modifier=None):
+def update_season_stats(team_games):
+    """Update running state and season stats of teams with new games.
+
+    Only games after the last day in each team's stored state are used, and
+    only the state and stats rows of teams in team_games are replaced.
+    """
+    group_on = ['season', 'team_id']
+    pairs = team_games[group_on].drop_duplicates()
+    if len(pairs) == 0:
+        return None
+
+    # stored state of affected teams only
+    with DBAssist.session() as dba:
+        old = []
+        for season, teams in pairs.groupby('season')['team_id']:
+            filters = {'season': season, 'team_id__in': teams.values}
+            old.append(dba.return_data('team_season_state', filters=filters))
+    old = pd.concat(old, ignore_index=True)
+
+    # drop games already counted in stored state
+    last = old[group_on + ['last_daynum']]
+    new = pd.merge(team_games, last, on=group_on, how='left')
+    new = new[~(new['daynum'] <= new['last_daynum'])]
+    new = new.drop(columns=['last_daynum'])
+
+    # nothing to update when all games were already counted
+    if len(new) == 0:
+        return None
+
+    state = combine_state(old, season_state(new))
+    summary = state_summary(state)
+
+    # replace affected rows of state and stats tables in one transaction,
+    # so a failed insert leaves the stored rows unchanged
+    with DBAssist.session() as dba:
+        with dba.transaction():
+            for season, teams in state.groupby('season')['team_id']:
+                filters = {'season': season, 'team_id__in': teams.values}
+                for table, df in [('team_season_state', state),
+                                  ('team_season_stats', summary)]:
+                    dba.delete_rows(table, filters=filters)
+                    dba.insert_rows(table, df[df['season'] == season])
+
+    return summary
+
+
+def season_state(team_games):
+    """Return running state of each team season from team game rows."""
+    group_on = ['season', 'team_id']
+    df = add_computed_stats(team_games.copy())
+    df['scrmarg_sq'] = df['scrmarg'] ** 2.0
+    df = df.sort_values(group_on + ['daynum'], kind='mergesort')
+
+    # sums and counts of each stat, in one grouped aggregation
+    named = {'games': ('daynum', 'size'),
+             'last_daynum': ('daynum', 'max'),
+             'wins': ('team_win', 'sum'),
+             'losses': ('team_loss', 'sum'),
+             'scrmarg_sq': ('scrmarg_sq', 'sum')}
+    for stat in MEAN_STATS:
+        named[stat + '_sum'] = (stat, 'sum')
+        named[stat + '_n'] = (stat, 'count')
+    state = df.groupby(group_on, sort=True).agg(**named).reset_index()
+
+    starts, ends = kernels.group_bounds(df['season'].values,
+                                        df['team_id'].values)
+    wins = df['team_win'].values
+    losses = df['team_loss'].values
+    state['wstreak'] = kernels.current_streak(wins, starts, ends)
+    state['lstreak'] = kernels.current_streak(losses, starts, ends)
+
+    # most recent results as str of '1' wins and '0' losses, oldest first
+    results = np.where(wins == 1, '1', '0')
+    first = np.maximum(ends - RECENT_GAMES, starts)
+    state['last10'] = [''.join(results[a:b]) for a, b in zip(first, ends)]
+
+    return state
+
+
+def combine_state(old, new):
+    """Return running state after adding state of later games to old."""
+    group_on = ['season', 'team_id']
+    df = pd.merge(old, new, on=group_on, how='outer', suffixes=('', '_new'))
+
+    add_cols = ['games', 'wins', 'losses', 'scrmarg_sq']
+    for stat in MEAN_STATS:
+        add_cols.extend([stat + '_sum', stat + '_n'])
+    for col in add_cols:
+        df[col] = df[col].fillna(0) + df[col + '_new'].fillna(0)
+
+    df['last_daynum'] = df[['last_daynum', 'last_daynum_new']].max(axis=1)
+
+    # streaks continue if every new game extends them
+    new_games = df['games_new'].fillna(0)
+    for col in ['wstreak', 'lstreak']:
+        new_streak = df[col + '_new'].fillna(0)
+        df[col] = np.where(new_streak == new_games,
+                           df[col].fillna(0) + new_streak, new_streak)
+
+    recent = df['last10'].fillna('') + df['last10_new'].fillna('')
+    df['last10'] = [x[-RECENT_GAMES:] for x in recent.values]
+
+    df = df[list(new.columns)]
+    int_cols = ['games', 'last_daynum', 'wins', 'losses', 'wstreak',
+                'lstreak'] + [stat + '_n' for stat in MEAN_STATS]
+    df[int_cols] = df[int_cols].astype(int)
+
+    return df
+
+
+def state_summary(state):
+    """Return dataframe of team season stats from running state."""
+    summary = state[['team_id', 'season']].copy()
+    for stat in MEAN_STATS:
+        mean = state[stat + '_sum'] / state[stat + '_n'].replace(0, np.nan)
+        summary[STAT_NAMES.get(stat, stat)] = mean.round(4)
+
+    games = state['games'].values
+    sd = margin_sd(state['scrmarg_sum'].values, state['scrmarg_sq'].values,
+                   games)
+    summary['scrmargsd'] = np.round(sd, 2)
+
+    # teams with < 5/10 games are assigned missing values
+    for n in [5, 10]:
+        wins = [x[-n:].count('1') for x in state['last10'].values]
+        pct = np.array(wins) / float(n)
+        summary['wpctlast{}'.format(n)] = np.where(games >= n, pct, np.nan)
+
+    summary['winpct'] = state['wins'] / (state['wins'] + state['losses'])
+
+    return summary
+
+
+def margin_sd(total, squares, games):
+    """Return sample std of scoring margin from sums of values and squares."""
+    games = np.asarray(games, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = (squares - total ** 2 / games) / (games - 1)
+    return np.where(games > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+
+def tourney_performance(filters=None):
     """Return dataframe with counts of team NCAA tournament wins and games."""
 
     # import results from previous tournaments
-    dba = DBAssist()
-    df = dba.return_data('ncaa_results', modifier=modifier)
-    dba.close()
+    with DBAssist.session() as dba:
+        df = dba.return_data('ncaa_results', filters=filters)
 
     # each row is one game, contains ids of both teams ('wteam', 'team')
     # create "win" indicator by separating winners and losers
@@ -41,56 +195,52 @@ def tourney_performance(modifier=None):
     return team_years
 
 
-def games_regular():
-    """Return one dataframe containing all regular season game data."""
-    
-    # initialize database assistant
-    dba = DBAssist()
+def games_regular(season=None):
+    """Return one dataframe containing regular season game data.
 
+    All seasons are returned if season is None.
+    """
+    
     # data contained in two tables with 'detailed' or 'compact' results
     # need both because 'detailed' only available >= season 2003
-    reg_dtl = dba.return_data('reg_results_dtl')
-    reg_com = dba.return_data('reg_results', modifier='WHERE season < 2003')    
-    df = pd.concat([reg_dtl, reg_com], sort=False)
-    df = df[df['season'] == 2018]
+    detailed = {} if season is None else {'season': season}
+    with DBAssist.session() as dba:
+        reg_dtl = dba.return_data('reg_results_dtl', filters=detailed)
+        compact = dict(detailed, season__lt=2003)
+        reg_com = dba.return_data('reg_results', filters=compact)
     
-    dba.close()
+    df = pd.concat([reg_dtl, reg_com], sort=False)
     
     return df
 
 
-def split_games_to_teams(df):
-    """Returns dataframe of all game stats with one row per team."""
+def split_games_to_teams(df, by_season=False):
+    """Returns dataframe of all game stats with one row per team.
+
+    If by_season is True, returns a generator of one dataframe per season.
+    """
+    if by_season is True:
+        return season_team_games(df)
+
     # lists of team-specific statistical column names for winners and losers
     winner_cols = [x for x in df.columns if x[0] == 'w']
     loser_cols = [x for x in df.columns if x[0] == 'l']
 
-    # get the original index of all original columns
-    both = [list(df.columns).index(x) for x in ['season', 'daynum']]
-    winner_index = [list(df.columns).index(x) for x in winner_cols]
-    loser_index = [list(df.columns).index(x) for x in loser_cols]
-    
-    # map of all column indices to provide as input to parse_games function
-    column_map = {'both': both, 'winner': winner_index, 'loser': loser_index}
-    # make array for faster computation
-    df_array = df.values
-
-    # all games parsed twice to create row for winners and row for losers
-    winners = list(map(lambda game: team_stats_from_game(game, column_map),
-                       df_array))
-    losers = list(map(lambda game: team_stats_from_game(game, column_map,
-                                                        winner=False),
-                      df_array))
-    games = winners + losers
-
-    # column names for new dataset to indicate the target team and opponent
-    team_cols = ['team_' + c[1:] for c in winner_cols]
-    opp_cols = ['opp_' + c[1:] for c in loser_cols]
-    new_columns = ['season', 'daynum']
-    new_columns.extend(team_cols + opp_cols)
+    # stat names with a column for both winners and losers
+    stats = [x[1:] for x in winner_cols if 'l' + x[1:] in loser_cols]
+
+    # stack winner rows above loser rows, one column at a time
+    columns = {}
+    for col in ['season', 'daynum']:
+        columns[col] = stack_columns(df[col], df[col])
+    for stat in stats:
+        columns['team_' + stat] = stack_columns(df['w' + stat],
+                                                df['l' + stat])
+    for stat in stats:
+        columns['opp_' + stat] = stack_columns(df['l' + stat],
+                                               df['w' + stat])
     
-    # apply new column names to games
-    df = pd.DataFrame(games, columns=new_columns)
+    df = pd.DataFrame(columns)
     df = df.rename(columns={'team_team': 'team_id', 'opp_team': 'opp_id'})
     
     # create win/loss indicators
@@ -103,23 +253,16 @@ def split_games_to_teams(df):
     return df
 
 
-def team_stats_from_game(game_row, column_map, winner=True):
-    """Extract stats for team and opponent depending on winner of game."""
-    
-    # use map of column indices to pull game stats
-    both = game_row[column_map['both']].tolist()
-    winner_stats = game_row[column_map['winner']].tolist() 
-    loser_stats = game_row[column_map['loser']].tolist()
-    
-    # if team was the winner sequence winner stats first
-    if winner==True:
-        team_data = both + winner_stats + loser_stats
-    else:
-        team_data = both + loser_stats + winner_stats
-
-    return team_data
+def season_team_games(df):
+    """Yields dataframe of game stats with one row per team for each season."""
+    for season, games in df.groupby('season', sort=True):
+        yield split_games_to_teams(games)
 
 
+def stack_columns(first, second):
+    """Returns series with values of second series after the first."""
+    stacked = pd.concat([first, second], ignore_index=True)
+    return stacked
 
 
 def prep_stats_by_team(df):
@@ -129,9 +272,8 @@ def prep_stats_by_team(df):
     df = add_computed_stats(df)
 
     # add date to each game
-    dba = DBAssist()
-    seasons = dba.return_data('seasons')
-    dba.close()
+    with DBAssist.session() as dba:
+        seasons = dba.return_data('seasons')
     
     df = clean.date_from_daynum(df, seasons)
     
@@ -182,84 +324,38 @@ def add_computed_stats(df):
 
 
 def compute_summary(df):
-    tgb_mean = mean_stats(df)
-    
-    gb = df.groupby('team_id')
-    tgb_sum = sum_stats(gb)
+    """Return summary stats for data sorted by season, team and date."""
+    group_on = ['season', 'team_id']
 
-    tgb_std = gb['scrmarg'].std()
-    tgb_std = tgb_std.rename('scrmargsd').round(2)
-    tgb_std = tgb_std.reset_index()
-    
-    recent_list = []
-    
-    recent_list.append(gb['team_win'].apply(streak).rename('wstreak'))
-    recent_list.append(gb['team_loss'].apply(streak).rename('lstreak'))
-
-    # need to remove teams with < 5/10 games
-    # on merge below these teams will be assigned missing values
-    game_count = gb['team_win'].count().reset_index()
-    have_five = game_count[game_count['team_win'] >=5]['team_id'].values
-    have_ten = game_count[game_count['team_win'] >=10]['team_id'].values
-    df5 = df[df['team_id'].isin(have_five)]
-    df10 = df[df['team_id'].isin(have_ten)]
-
-    gb5 = df5.groupby('team_id')
-    gb10 = df10.groupby('team_id')
+    # columns averaged over games, renamed for points scored and allowed
+    not_mean = ['team_win', 'team_loss', 'opp_id', 'date'] + group_on
+    aggmean = [x for x in df.columns if x not in not_mean]
+
+    # all grouped aggregations in one pass
+    named = {STAT_NAMES.get(x, x): (x, 'mean') for x in aggmean}
+    named['scrmargsd'] = ('scrmarg', 'std')
+    named['wins'] = ('team_win', 'sum')
+    named['losses'] = ('team_loss', 'sum')
+    summary = df.groupby(group_on, sort=True).agg(**named)
     
-    last_5 = lambda x: pct_last(x, n=5)
-    pct_last_5 = gb5['team_win'].apply(last_5).rename('wpctlast5')
+    mean_cols = [STAT_NAMES.get(x, x) for x in aggmean]
+    summary[mean_cols] = summary[mean_cols].round(4)
+    summary['scrmargsd'] = summary['scrmargsd'].round(2)
+
+    # rows of each group, in the same order as the grouped summary
+    starts, ends = kernels.group_bounds(df['season'].values,
+                                        df['team_id'].values)
+    wins = df['team_win'].values
     
-    last_10 = lambda x: pct_last(x, n=10)
-    pct_last_10 = gb10['team_win'].apply(last_10).rename('wpctlast10')
-
-    tgb_rec = pd.merge(pct_last_5, pct_last_10, left_on='team_id',
-                      right_on='team_id', how='outer')
+    # teams with < 5/10 games are assigned missing values
+    summary['wpctlast5'] = kernels.last_n_pct(wins, starts, ends, n=5)
+    summary['wpctlast10'] = kernels.last_n_pct(wins, starts, ends, n=10)
 
-    mrg1 = pd.merge(tgb_sum, tgb_mean, how='outer',
-                    left_on='team_id', right_on='team_id')
-    mrg2 = pd.merge(mrg1, tgb_std, how='outer', left_on='team_id',
-                    right_on='team_id')
-    mrg3 = pd.merge(mrg2, tgb_rec, how='outer',
-                    left_on='team_id', right_on='team_id')
+    summary['winpct'] = summary['wins'] / (summary['wins'] +
+                                           summary['losses'])
 
-    mrg3['winpct'] = mrg3['wins'] / (mrg3['wins'] + mrg3['losses'])
-    mrg3 = mrg3.drop(columns=['wins', 'losses'])
+    summary = summary.drop(columns=['wins', 'losses']).reset_index()
+    summary = summary[['team_id', 'season'] + mean_cols +
+                      ['scrmargsd', 'wpctlast5', 'wpctlast10', 'winpct']]
     
-    return mrg3
-
-
-def mean_stats(df):
-    gb = df.groupby('team_id')
-    # make list of columns for mean aggregation
-    aggmean = df.columns
-    not_mean = ['team_win', 'team_loss', 'team_id', 'opp_id', 'date']
-    aggmean = [x for x in aggmean if x not in not_mean]
-
-    tgb = df.groupby('team_id')
-    ts_mean = tgb[aggmean].mean()
-    ts_mean = ts_mean.round(4)
-    ts_mean = ts_mean.rename(columns={'team_score': 'ppg',
-                                      'opp_score': 'ppg_d'})
-    ts_mean = ts_mean.reset_index()
-    return ts_mean
-
-
-def sum_stats(gb):
-    cols_to_sum = ['team_win', 'team_loss']
-    tgb_sum = gb[cols_to_sum].sum()
-    tgb_sum.columns = ['wins', 'losses']
-    tgb_sum = tgb_sum.reset_index()
-    return tgb_sum
-
-
-def pct_last(group, n=5):
-    #Compute win percentage in last n games.
-    wins = group.iloc[-n:].sum()
-    return wins / float(n)
-
-
-def streak(y):
-    #Compute number of consecutive events.
-    streak = y * (y.groupby((y != y.shift()).cumsum()).cumcount() + 1)
-    return int(streak[-1:])
+    return summary
@@ -0,0 +1,384 @@
+""" travel
+
+A module for keeping a persisted matrix of distances between team home
+sites and game venues. The matrix is a memory-mapped float32 file, so
+distances for known team and venue pairs are array reads, and only pairs
+with a new team or venue are computed.
+
+Classes
+-------
+DistanceMatrix
+    A memory-mapped matrix of miles from each team to each venue.
+
+Functions
+---------
+build_matrix
+    Return distance matrix with all teams and known venues added.
+
+venue_locations
+    Return array of coordinates of all known game venues.
+
+venue_keys
+    Return int64 keys identifying venues by their rounded coordinates.
+
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from src.data.transfer import DBAssist
+from src.features import location
+from src.constants import CACHE_DIR
+
+# decimal places of coordinates identifying a venue
+VENUE_DECIMALS = 4
+
+# rows and columns allocated when the matrix is first created
+INITIAL_TEAMS = 512
+INITIAL_VENUES = 1024
+
+
+class DistanceMatrix():
+    """
+    A memory-mapped matrix of miles from each team to each venue.
+
+    Rows are teams and columns are venues, each assigned the next free
+    index when first added. When either runs out of space the file is
+    copied to one with double the capacity. A team whose coordinates change
+    has its row recomputed.
+
+    Attributes
+    ----------
+    matrix_dir : str
+        Directory where the matrix file and the index file are stored.
+    index_file : str
+        Path of json file with team and venue indexes and matrix shape.
+    teams : dict
+        Maps team numeric identifiers to [row, lattitude, longitude].
+    row_of : numpy array of int64
+        Row of each team indexed by team id, -1 for unknown teams.
+    venues : pandas Index
+        Venue keys from venue_keys, in column order.
+    venue_coords : list of list
+        Coordinates of each venue, in column order.
+    matrix : numpy memmap of float32
+        Distances in miles, missing for unused rows and columns.
+
+    """
+    def __init__(self, matrix_dir=os.path.join(CACHE_DIR, 'distances')):
+        """Initialize DistanceMatrix instance, loading any saved matrix."""
+        self.matrix_dir = matrix_dir
+        self.index_file = os.path.join(matrix_dir, 'index.json')
+        self.teams = {}
+        self.row_of = np.zeros(0, dtype=np.int64)
+        self.venues = pd.Index([], dtype=np.int64)
+        self.venue_coords = []
+        self.matrix = None
+        self.load()
+
+    def matrix_file(self, shape):
+        """Return path of the matrix file with the given shape."""
+        name = "matrix_{}x{}.f32".format(*shape)
+        return os.path.join(self.matrix_dir, name)
+
+    def load(self):
+        """Read the index file and map the saved matrix, if any."""
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        shape = tuple(index['shape'])
+        try:
+            self.matrix = np.memmap(self.matrix_file(shape), mode='r+',
+                                    dtype=np.float32, shape=shape)
+        except (IOError, ValueError):
+            return
+
+        self.teams = {int(k): v for k, v in index['teams'].items()}
+        self.index_teams()
+        self.venue_coords = index['venues']
+        coords = np.array(self.venue_coords, dtype=np.float64)
+        self.venues = pd.Index(venue_keys(coords.reshape(-1, 2)))
+
+    def save(self):
+        """Flush the matrix and replace the index file."""
+        os.makedirs(self.matrix_dir, exist_ok=True)
+        self.matrix.flush()
+
+        index = {'shape': list(self.matrix.shape),
+                 'teams': {str(k): v for k, v in self.teams.items()},
+                 'venues': self.venue_coords}
+        temp_file = "{}.{}".format(self.index_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_file, self.index_file)
+
+    def reserve(self, n_teams, n_venues):
+        """
+        Ensure the matrix has room for the given numbers of rows and columns.
+
+        Parameters
+        ----------
+        n_teams : int
+            Number of team rows needed.
+        n_venues : int
+            Number of venue columns needed.
+
+        """
+        if self.matrix is None:
+            shape = (0, 0)
+        else:
+            shape = self.matrix.shape
+        if n_teams <= shape[0] and n_venues <= shape[1]:
+            return
+
+        # double capacity of each dimension until it is large enough
+        rows = max(shape[0], INITIAL_TEAMS)
+        while rows < n_teams:
+            rows *= 2
+        cols = max(shape[1], INITIAL_VENUES)
+        while cols < n_venues:
+            cols *= 2
+
+        os.makedirs(self.matrix_dir, exist_ok=True)
+        matrix = np.memmap(self.matrix_file((rows, cols)), mode='w+',
+                           dtype=np.float32, shape=(rows, cols))
+        matrix[:] = np.nan
+        old = self.matrix
+        if old is not None:
+            matrix[:shape[0], :shape[1]] = old
+        self.matrix = matrix
+
+        # index points to the new file before the old file is removed
+        self.save()
+        if old is not None:
+            old_file = old.filename
+            del old
+            os.remove(old_file)
+
+    def add_teams(self, team_map):
+        """
+        Add teams or update moved teams and compute their distances.
+
+        Parameters
+        ----------
+        team_map : dict
+            Keys are integer team ids, values are tuples
+            (lattitude, longitude).
+
+        """
+        changed = []
+        n_new = 0
+        for team_id, (lat, lng) in team_map.items():
+            team_id = int(team_id)
+            entry = self.teams.get(team_id)
+            if entry is None:
+                n_new += 1
+                changed.append([team_id, float(lat), float(lng)])
+            elif entry[1:] != [float(lat), float(lng)]:
+                changed.append([team_id, float(lat), float(lng)])
+
+        if len(changed) == 0:
+            return
+
+        # room for new rows before the index lists new teams
+        self.reserve(len(self.teams) + n_new, len(self.venues))
+        entries = []
+        for team_id, lat, lng in changed:
+            entry = self.teams.get(team_id)
+            if entry is None:
+                entry = [len(self.teams), lat, lng]
+                self.teams[team_id] = entry
+            else:
+                entry[1:] = [lat, lng]
+            entries.append(entry)
+        if n_new > 0:
+            self.index_teams()
+
+        if len(self.venues) > 0:
+            rows = np.array([x[0] for x in entries])
+            team = np.array([x[1:] for x in entries])
+            venue = np.array(self.venue_coords)
+            miles = location.haversine_miles(
+                team[:, [0]], team[:, [1]], venue[:, 0], venue[:, 1])
+            self.matrix[rows, :len(venue)] = miles
+        self.save()
+
+    def index_teams(self):
+        """Set row_of from the rows of all teams."""
+        ids = np.array(list(self.teams.keys()), dtype=np.int64)
+        rows = np.array([x[0] for x in self.teams.values()], dtype=np.int64)
+        size = ids.max() + 1 if len(ids) > 0 else 0
+        self.row_of = np.full(size, -1, dtype=np.int64)
+        self.row_of[ids] = rows
+
+    def add_venues(self, locations):
+        """
+        Add venues and compute their distances, returning column indexes.
+
+        Parameters
+        ----------
+        locations : numpy array of float
+            Array of shape (number of locations, 2) with lattitude and
+            longitude, missing where unknown.
+
+        Returns
+        -------
+        cols : numpy array of int
+            Column of each location, -1 where unknown.
+
+        """
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        rounded = np.round(locations, VENUE_DECIMALS)
+        keys = venue_keys(rounded)
+        known = keys >= 0
+
+        # venues not in the matrix, in order of first appearance
+        cols = self.venues.get_indexer(keys)
+        new = (cols < 0) & known
+        new_keys, first_row = np.unique(keys[new], return_index=True)
+        order = np.argsort(first_row)
+        new_keys = new_keys[order]
+        new_coords = rounded[new][first_row[order]]
+
+        if len(new_keys) > 0:
+            # room for new columns before the index lists new venues
+            first = len(self.venues)
+            self.reserve(len(self.teams), first + len(new_keys))
+            self.venues = self.venues.append(pd.Index(new_keys))
+            self.venue_coords.extend(new_coords.tolist())
+            if len(self.teams) > 0:
+                rows = np.array([x[0] for x in self.teams.values()])
+                team = np.array([x[1:] for x in self.teams.values()])
+                miles = location.haversine_miles(
+                    team[:, [0]], team[:, [1]],
+                    new_coords[:, 0], new_coords[:, 1])
+                self.matrix[rows[:, None],
+                            np.arange(first, len(self.venues))] = miles
+            self.save()
+            cols = self.venues.get_indexer(keys)
+
+        cols = np.where(known, cols, -1)
+        return cols
+
+    def team_rows(self, team_ids):
+        """Return matrix row of each team id, -1 for unknown teams."""
+        team_ids = np.asarray(team_ids, dtype=np.int64)
+        known = (team_ids >= 0) & (team_ids < len(self.row_of))
+        rows = np.full(len(team_ids), -1, dtype=np.int64)
+        rows[known] = self.row_of[team_ids[known]]
+        return rows
+
+    def lookup(self, team_ids, locations):
+        """
+        Return miles from each team to each location, adding new venues.
+
+        Parameters
+        ----------
+        team_ids : array of int
+            Team numeric identifiers, added earlier with add_teams.
+        locations : numpy array of float
+            Array of shape (number of teams, 2) with lattitude and longitude.
+
+        Returns
+        -------
+        miles : numpy array of float32
+            Distances, missing where the team or location is unknown.
+
+        """
+        cols = self.add_venues(locations)
+        rows = self.team_rows(team_ids)
+
+        miles = np.full(len(rows), np.nan, dtype=np.float32)
+        found = (rows >= 0) & (cols >= 0)
+        if self.matrix is not None:
+            miles[found] = self.matrix[rows[found], cols[found]]
+        return miles
+
+
+def venue_keys(locations):
+    """
+    Return int64 keys identifying venues by their rounded coordinates.
+
+    Parameters
+    ----------
+    locations : numpy array of float
+        Array of shape (number of locations, 2) with lattitude and
+        longitude.
+
+    Returns
+    -------
+    keys : numpy array of int64
+        Key of each location, -1 where coordinates are missing.
+
+    """
+    scale = 10 ** VENUE_DECIMALS
+    known = ~np.isnan(locations).any(axis=1)
+    lat = np.round(np.where(known, locations[:, 0], 0) * scale)
+    lng = np.round(np.where(known, locations[:, 1], 0) * scale)
+
+    # shift to non-negative values, longitude in the low 32 bits
+    lat = (lat + 90 * scale).astype(np.int64)
+    lng = (lng + 180 * scale).astype(np.int64)
+    keys = (lat << 32) | lng
+    return np.where(known, keys, -1)
+
+
+def venue_locations():
+    """
+    Return array of coordinates of all known game venues.
+
+    Venues are the cities of games in game_cities and the sites of
+    tournament games in tourney_geog.
+
+    Returns
+    -------
+    locations : numpy array of float
+        Array of shape (number of venues, 2) with lattitude and longitude.
+
+    """
+    with DBAssist.session() as dba:
+        games = dba.return_data('game_cities', subset=['city_id'])
+        cities = dba.return_data('cities')
+        tg = dba.return_data('tourney_geog', subset=['latitude', 'longitude'])
+
+    # coordinates of each city that hosted a game
+    df = pd.merge(games.drop_duplicates(), cities, on='city_id')
+    resolver = location.coordinate_resolver()
+    cities = resolver.locate_many(df['city'].values, df['state'].values,
+                                  full_state=False)
+
+    sites = tg.drop_duplicates().values
+    locations = np.concatenate([cities, sites])
+    locations = locations[~np.isnan(locations).any(axis=1)]
+    return locations
+
+
+def build_matrix(matrix=None):
+    """
+    Return distance matrix with all teams and known venues added.
+
+    Parameters
+    ----------
+    matrix : DistanceMatrix, default None, optional
+        Matrix to add to. If None, the saved matrix is loaded.
+
+    Returns
+    -------
+    matrix : DistanceMatrix
+        Matrix with rows for all teams in team_geog.
+
+    """
+    if matrix is None:
+        matrix = DistanceMatrix()
+
+    with DBAssist.session() as dba:
+        tg = dba.return_data('team_geog')
+    team_map = dict(zip(tg['team_id'].values,
+                        zip(tg['latitude'].values, tg['longitude'].values)))
+
+    matrix.add_teams(team_map)
+    matrix.add_venues(venue_locations())
+    return matrix
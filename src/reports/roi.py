@@ -140,9 +140,8 @@ test_odds['net_won'] = (test_odds['amount_won'] - test_odds['bet_amount']).round
 
 
 def add_team_names(game_data):
-    dba = DBAssist()
-    teams = dba.return_data('teams', subset=['team_id', 'team_name'])
-    dba.close()
+    with DBAssist.session() as dba:
+        teams = dba.return_data('teams', subset=['team_id', 'team_name'])
     
     new_data = pd.merge(game_data, teams, left_on=['t1_team_id'],
                         right_on='team_id')
@@ -0,0 +1,73 @@
+""" test_clean
+
+Tests of S3 downloads in data.clean, with a stubbed S3 client in place of
+the bucket.
+
+"""
+import io
+import pytest
+from botocore.exceptions import ClientError
+from botocore.exceptions import EndpointConnectionError
+from src.data import clean
+
+# body of the csv object returned by the stubbed client
+CSV_BODY = b'season,team_id\n2019,1101\n2019,1102\n'
+
+
+class FlakyClient():
+    """S3 client stub raising the given errors before returning the object."""
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def get_object(self, **request):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'Body': io.BytesIO(CSV_BODY), 'ETag': '"abc"'}
+
+
+def client_error(status):
+    """Return ClientError with the given HTTP status code."""
+    response = {'Error': {'Code': str(status), 'Message': 'stub'},
+                'ResponseMetadata': {'HTTPStatusCode': status}}
+    return ClientError(response, 'GetObject')
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    """Return function setting the stubbed client used by clean."""
+    monkeypatch.setattr(clean, 'MIRROR', None)
+    monkeypatch.setattr(clean.time, 'sleep', lambda seconds: None)
+
+    def set_client(client):
+        monkeypatch.setattr(clean, 's3_client', lambda: client)
+        return client
+
+    return set_client
+
+
+def test_s3_object_data_retries_then_succeeds(stub_client):
+    errors = [client_error(503), EndpointConnectionError(endpoint_url='s3')]
+    client = stub_client(FlakyClient(errors))
+
+    data = clean.s3_object_data('ratings.csv', retries=3, backoff=0)
+    assert client.calls == 3
+    assert list(data.columns) == ['season', 'team_id']
+    assert data['team_id'].tolist() == [1101, 1102]
+
+
+def test_s3_object_data_raises_after_last_attempt(stub_client):
+    client = stub_client(FlakyClient([client_error(500)] * 3))
+
+    with pytest.raises(ClientError):
+        clean.s3_object_data('ratings.csv', retries=3, backoff=0)
+    assert client.calls == 3
+
+
+def test_s3_object_data_does_not_retry_client_errors(stub_client):
+    client = stub_client(FlakyClient([client_error(404)]))
+
+    with pytest.raises(ClientError):
+        clean.s3_object_data('ratings.csv', retries=3, backoff=0)
+    assert client.calls == 1
@@ -0,0 +1,111 @@
+""" test_kernels
+
+Tests of the group kernels in features.kernels, checked against plain
+Python versions run on each group's list of results.
+
+"""
+import numpy as np
+import pytest
+from src.features import kernels
+
+# results of each group, covering single games and all-win/all-loss runs
+GROUPS = [[1], [0], [1, 1, 1, 1, 1, 1], [0, 0, 0, 0, 0, 0, 0],
+          [1, 0, 1, 1, 0, 1, 1, 1], [0, 1, 1, 0, 0], [1, 1, 0],
+          [0, 1, 0, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1]]
+
+
+def current_streak(y):
+    """Return number of events at the end of a list."""
+    streak = 0
+    for value in reversed(y):
+        if value != 1:
+            break
+        streak += 1
+    return streak
+
+
+def longest_streak(y):
+    """Return length of the longest run of events in a list."""
+    longest, streak = 0, 0
+    for value in y:
+        streak = streak + 1 if value == 1 else 0
+        longest = max(longest, streak)
+    return longest
+
+
+def last_n_pct(y, n):
+    """Return share of events in the last n values, None if fewer."""
+    if len(y) < n:
+        return None
+    return sum(y[-n:]) / float(n)
+
+
+def ewm_form(y, alpha):
+    """Return mean of values weighted by (1 - alpha) ** age."""
+    weights = [(1.0 - alpha) ** i for i in range(len(y))]
+    total = sum(w * x for w, x in zip(weights, reversed(y)))
+    return total / sum(weights)
+
+
+def stacked(groups):
+    """Return values of all groups and bounds from group_bounds."""
+    y = np.array([x for group in groups for x in group], dtype=int)
+    group = np.repeat(np.arange(len(groups)), [len(x) for x in groups])
+    starts, ends = kernels.group_bounds(group)
+    return y, starts, ends
+
+
+def expected_pct(groups, n):
+    """Return expected last_n_pct with missing values as nan."""
+    pct = [last_n_pct(x, n) for x in groups]
+    return np.array([np.nan if x is None else x for x in pct])
+
+
+@pytest.mark.parametrize('groups', [GROUPS, GROUPS[:1], [GROUPS[-1]]])
+def test_streaks_match_python(groups):
+    y, starts, ends = stacked(groups)
+    current = kernels.current_streak(y, starts, ends)
+    longest = kernels.longest_streak(y, starts, ends)
+    assert current.tolist() == [current_streak(x) for x in groups]
+    assert longest.tolist() == [longest_streak(x) for x in groups]
+
+    # losing streaks from the same rows
+    losses = 1 - y
+    current = kernels.current_streak(losses, starts, ends)
+    assert current.tolist() == [current_streak([1 - v for v in x])
+                                for x in groups]
+
+
+@pytest.mark.parametrize('n', [1, 5, 10])
+def test_last_n_pct_matches_python(n):
+    y, starts, ends = stacked(GROUPS)
+    pct = kernels.last_n_pct(y, starts, ends, n=n)
+    np.testing.assert_allclose(pct, expected_pct(GROUPS, n))
+
+
+@pytest.mark.parametrize('alpha', [0.2, 0.5, 1.0])
+def test_ewm_form_matches_python(alpha):
+    y, starts, ends = stacked(GROUPS)
+    form = kernels.ewm_form(y, starts, ends, alpha=alpha)
+    expected = [ewm_form(x, alpha) for x in GROUPS]
+    np.testing.assert_allclose(form, expected)
+
+
+def test_group_bounds_of_several_keys():
+    season = np.array([2019, 2019, 2019, 2020, 2020])
+    team_id = np.array([1101, 1101, 1102, 1102, 1102])
+    starts, ends = kernels.group_bounds(season, team_id)
+    assert starts.tolist() == [0, 2, 3]
+    assert ends.tolist() == [2, 3, 5]
+
+
+def test_kernels_of_no_groups():
+    y = np.array([], dtype=int)
+    starts, ends = kernels.group_bounds(y)
+    assert len(starts) == 0 and len(ends) == 0
+
+    for kernel in [kernels.current_streak, kernels.longest_streak,
+                   kernels.last_n_pct, kernels.ewm_form]:
+        result = kernel(y, starts, ends)
+        assert isinstance(result, np.ndarray)
+        assert len(result) == 0
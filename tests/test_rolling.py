@@ -0,0 +1,166 @@
+""" test_rolling
+
+Tests of point-in-time team stats in features.rolling, checked against
+stats recomputed from each team's earlier games with a plain groupby.
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from src.features import rolling
+from src.features import team
+
+# box score columns of each team game row
+BOX_COLUMNS = ['fga', 'fta', 'ftm', 'fgm', 'fgm3', 'or', 'dr', 'to']
+
+# teams playing in the synthetic seasons
+TEAMS = [1101, 1102, 1103, 1104, 1105, 1106]
+
+
+def make_team_games(seasons=(2019, 2020), days=range(5, 60, 3), seed=0):
+    """Return team game rows of random pairs of teams on each day."""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for season in seasons:
+        for daynum in days:
+            pairs = rng.permutation(TEAMS).reshape(-1, 2)
+            for team_id, opp_id in pairs[:rng.randint(1, len(pairs) + 1)]:
+                rows.extend(game_rows(rng, season, daynum, team_id, opp_id))
+    return pd.DataFrame(rows)
+
+
+def game_rows(rng, season, daynum, team_id, opp_id):
+    """Return the two team rows of one game with random box scores."""
+    score = rng.randint(50, 90, 2)
+    while score[0] == score[1]:
+        score = rng.randint(50, 90, 2)
+    box = {col: rng.randint(5, 60, 2) for col in BOX_COLUMNS}
+
+    rows = []
+    for i, (a, b) in enumerate([(team_id, opp_id), (opp_id, team_id)]):
+        row = {'season': season, 'daynum': daynum, 'team_id': a,
+               'opp_id': b, 'team_score': score[i],
+               'opp_score': score[1 - i],
+               'team_win': int(score[i] > score[1 - i]),
+               'team_loss': int(score[i] < score[1 - i])}
+        for col in BOX_COLUMNS:
+            row['team_' + col] = box[col][i]
+            row['opp_' + col] = box[col][1 - i]
+        rows.append(row)
+    return rows
+
+
+def naive_as_of(team_games, season, team_id, daynum):
+    """Return stats of each lookup from a groupby over earlier games."""
+    df = team.add_computed_stats(team_games.copy())
+    rows = []
+    for s, t, d in zip(season, team_id, daynum):
+        games = df[(df['season'] == s) & (df['team_id'] == t) &
+                   (df['daynum'] < d)]
+        row = {'games': len(games)}
+        for stat, name in zip(rolling.MEAN_STATS, rolling.STAT_NAMES):
+            row[name] = games[stat].mean()
+        row['scrmargsd'] = games['scrmarg'].std()
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def lookups(team_games):
+    """Return season, team and day of lookups around every game day."""
+    days = np.unique(team_games['daynum'].values)
+    days = np.concatenate([[-3, 0, 1], days, days + 1, [1023, 1024, 5000]])
+    grid = [(s, t, d) for s in [2019, 2020] for t in TEAMS for d in days]
+    season, team_id, daynum = [np.array(x) for x in zip(*grid)]
+    return season, team_id, daynum
+
+
+def assert_matches_naive(stats, team_games):
+    """Assert point-in-time stats equal the naive groupby for all lookups."""
+    season, team_id, daynum = lookups(team_games)
+    result = stats.as_of_many(season, team_id, daynum)
+    expected = naive_as_of(team_games, season, team_id, daynum)
+    pd.testing.assert_frame_equal(result[expected.columns], expected,
+                                  check_dtype=False, atol=1e-9)
+
+
+def test_as_of_many_matches_naive():
+    games = make_team_games()
+    assert_matches_naive(rolling.RollingStats(games), games)
+
+
+def test_games_before_first_day_are_missing():
+    games = make_team_games()
+    stats = rolling.RollingStats(games)
+
+    first = games['daynum'].min()
+    df = stats.as_of_many([2019, 2019, 2019], [1101, 1101, 1101],
+                          [-1, 0, first])
+    assert df['games'].tolist() == [0, 0, 0]
+    assert df[rolling.STAT_NAMES].isnull().all().all()
+
+
+def test_same_day_games_both_counted():
+    games = make_team_games(seasons=[2019], days=[5, 10])
+    rng = np.random.RandomState(1)
+    extra = pd.DataFrame(game_rows(rng, 2019, 10, 1101, 1201) +
+                         game_rows(rng, 2019, 10, 1101, 1202))
+    games = pd.concat([games, extra], ignore_index=True)
+    stats = rolling.RollingStats(games)
+
+    played = ((games['team_id'] == 1101) & (games['daynum'] <= 10)).sum()
+    df = stats.as_of_many([2019, 2019], [1101, 1101], [10, 11])
+    before = ((games['team_id'] == 1101) & (games['daynum'] < 10)).sum()
+    assert df['games'].tolist() == [before, played]
+    assert_matches_naive(stats, games)
+
+
+def test_update_with_later_days_inserts(monkeypatch):
+    games = make_team_games()
+    early = games[games['daynum'] < 30]
+    late = games[games['daynum'] >= 30]
+    stats = rolling.RollingStats(early)
+
+    # later days of each team are inserted, stored rows are not rebuilt
+    def rebuild(df):
+        raise AssertionError("rebuilt index for later days")
+    monkeypatch.setattr(stats, 'rebuild', rebuild)
+
+    for daynum, day_games in late.groupby('daynum'):
+        stats.update(day_games)
+    assert_matches_naive(stats, games)
+
+
+def test_update_with_earlier_days_rebuilds():
+    games = make_team_games()
+    stats = rolling.RollingStats(games[games['daynum'] >= 30])
+    stats.update(games[games['daynum'] < 30])
+    assert_matches_naive(stats, games)
+
+    # rows added again replace the stored rows
+    stats.update(games[games['daynum'] == 38])
+    assert_matches_naive(stats, games)
+
+
+def test_stat_keys_sort_by_season_team_and_day():
+    season = np.array([2019, 2019, 2019, 2020, 2020])
+    team_id = np.array([1101, 1101, 1102, 1101, (1 << rolling.TEAM_BITS) - 1])
+    daynum = np.array([0, (1 << rolling.DAY_BITS) - 1, 0, 5, 3])
+    keys = rolling.stat_keys(season, team_id, daynum)
+    assert (np.diff(keys) > 0).all()
+
+    # each field is recovered from its bits
+    day_mask = (1 << rolling.DAY_BITS) - 1
+    team_mask = (1 << rolling.TEAM_BITS) - 1
+    assert ((keys & day_mask) == daynum).all()
+    assert (((keys >> rolling.DAY_BITS) & team_mask) == team_id).all()
+    assert ((keys >> (rolling.DAY_BITS + rolling.TEAM_BITS)) == season).all()
+
+
+@pytest.mark.parametrize('season, team_id, daynum', [
+    (2019, 1101, 1 << rolling.DAY_BITS),
+    (2019, 1101, -1),
+    (2019, 1 << rolling.TEAM_BITS, 5),
+    (-1, 1101, 5)])
+def test_stat_keys_reject_values_out_of_range(season, team_id, daynum):
+    with pytest.raises(ValueError):
+        rolling.stat_keys([season], [team_id], [daynum])
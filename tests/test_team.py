@@ -0,0 +1,152 @@
+""" test_team
+
+Tests of incremental team season stats in features.team, with an
+in-memory store in place of the database.
+
+"""
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import pytest
+from src.features import team
+
+# box score columns of each team game row
+BOX_COLUMNS = ['fga', 'fta', 'ftm', 'fgm', 'fgm3', 'or', 'dr', 'to']
+
+
+class MemoryStore():
+    """In-memory tables answering the DBAssist calls of update_season_stats."""
+    def __init__(self, tables):
+        self.tables = tables
+        self.writes = []
+        self.fail_on = None
+
+    @contextmanager
+    def transaction(self):
+        saved = dict(self.tables)
+        try:
+            yield self
+        except Exception:
+            self.tables = saved
+            raise
+
+    def return_data(self, table_name, filters=None):
+        df = self.tables[table_name]
+        keep = ((df['season'] == filters['season']) &
+                df['team_id'].isin(filters['team_id__in']))
+        return df[keep].copy()
+
+    def delete_rows(self, table_name, filters=None):
+        df = self.tables[table_name]
+        drop = ((df['season'] == filters['season']) &
+                df['team_id'].isin(filters['team_id__in']))
+        self.tables[table_name] = df[~drop]
+        self.writes.append(('delete', table_name))
+
+    def insert_rows(self, table_name, data):
+        if table_name == self.fail_on:
+            raise IOError("insert into {} failed".format(table_name))
+        df = pd.concat([self.tables[table_name], data], ignore_index=True)
+        self.tables[table_name] = df
+        self.writes.append(('insert', table_name))
+
+
+def make_team_games(n_games=6, seed=0):
+    """Return team game rows for two teams playing each other."""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for daynum in range(1, n_games + 1):
+        score = rng.randint(50, 90, 2)
+        box = {col: rng.randint(5, 60, 2) for col in BOX_COLUMNS}
+        for i, (team_id, opp_id) in enumerate([(1101, 1102), (1102, 1101)]):
+            row = {'season': 2020, 'daynum': daynum, 'team_id': team_id,
+                   'opp_id': opp_id, 'team_score': score[i],
+                   'opp_score': score[1 - i]}
+            for col in BOX_COLUMNS:
+                row['team_' + col] = box[col][i]
+                row['opp_' + col] = box[col][1 - i]
+            rows.append(row)
+
+    df = pd.DataFrame(rows)
+    df['team_win'] = np.where(df['team_score'] > df['opp_score'], 1, 0)
+    df['team_loss'] = 1 - df['team_win']
+    return df
+
+
+def empty_store(games, monkeypatch):
+    """Return MemoryStore with empty tables used in place of the database."""
+    state = team.season_state(games).iloc[:0]
+    store = MemoryStore({'team_season_state': state,
+                         'team_season_stats': team.state_summary(state)})
+
+    @contextmanager
+    def session():
+        yield store
+
+    monkeypatch.setattr(team.DBAssist, 'session', session)
+    return store
+
+
+def full_summary(games):
+    """Return season stats of all games at once, as summary_by_season does."""
+    # same columns kept as in prep_stats_by_team, with daynum as date
+    df = team.add_computed_stats(games.copy())
+    added = [x for x in df.columns if x not in games.columns and x != 'pos']
+    df = df[['season', 'team_id', 'team_score', 'opp_id', 'opp_score',
+             'team_loss', 'team_win'] + added]
+    df['date'] = games['daynum']
+    df = df.sort_values(['season', 'team_id', 'date'], kind='mergesort')
+    return team.compute_summary(df)
+
+
+def test_update_season_stats_twice(monkeypatch):
+    games = make_team_games()
+    store = empty_store(games, monkeypatch)
+
+    summary = team.update_season_stats(games)
+    assert len(summary) == 2
+    assert len(store.tables['team_season_state']) == 2
+    stored = {k: v.copy() for k, v in store.tables.items()}
+    writes = len(store.writes)
+
+    # the same batch again has no new games and writes nothing
+    assert team.update_season_stats(games) is None
+    assert len(store.writes) == writes
+    for table_name, df in stored.items():
+        pd.testing.assert_frame_equal(store.tables[table_name], df)
+
+
+def test_update_in_batches_matches_full_summary(monkeypatch):
+    games = make_team_games(n_games=14, seed=3)
+    store = empty_store(games, monkeypatch)
+
+    # fold games in over two batches split within the season
+    team.update_season_stats(games[games['daynum'] <= 6])
+    team.update_season_stats(games[games['daynum'] > 6])
+
+    stored = store.tables['team_season_stats']
+    stored = stored.sort_values('team_id').reset_index(drop=True)
+    expected = full_summary(games)
+    expected = expected.sort_values('team_id').reset_index(drop=True)
+    assert sorted(stored.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(stored[expected.columns], expected,
+                                  check_dtype=False, atol=1e-4)
+
+    # running state of the two batches equals state of all games at once
+    state = store.tables['team_season_state']
+    state = state.sort_values('team_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(state, team.season_state(games),
+                                  check_dtype=False)
+
+
+def test_failed_insert_keeps_stored_rows(monkeypatch):
+    games = make_team_games(n_games=8)
+    store = empty_store(games, monkeypatch)
+    team.update_season_stats(games[games['daynum'] <= 4])
+    stored = {k: v.copy() for k, v in store.tables.items()}
+
+    store.fail_on = 'team_season_stats'
+    with pytest.raises(IOError):
+        team.update_season_stats(games[games['daynum'] > 4])
+    for table_name, df in stored.items():
+        pd.testing.assert_frame_equal(store.tables[table_name], df)
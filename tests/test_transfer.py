@@ -0,0 +1,81 @@
+""" test_transfer
+
+Tests of the LOAD DATA LOCAL INFILE table replace in data.transfer, run
+against the local MySQL database in the config file. Tests are skipped when
+no server is reachable.
+
+"""
+import pandas as pd
+import pytest
+from src.data.transfer import DBAssist
+
+# name of the table created and dropped by each test
+TEST_TABLE = 'test_load_infile'
+
+
+@pytest.fixture
+def dba():
+    """Yield DBAssist on the local database, or skip if none is reachable."""
+    try:
+        dba = DBAssist(use_cache=False)
+    except Exception as e:
+        pytest.skip("no local MySQL server: {}".format(e))
+
+    for suffix in ['', '_stage', '_old']:
+        dba.cursor.execute("DROP TABLE IF EXISTS {}".format(TEST_TABLE +
+                                                             suffix))
+    yield dba
+    for suffix in ['', '_stage', '_old']:
+        dba.cursor.execute("DROP TABLE IF EXISTS {}".format(TEST_TABLE +
+                                                             suffix))
+    dba.close()
+
+
+def make_rows(n_rows, offset=0):
+    """Return dataframe of integer ids and float values."""
+    ids = list(range(offset, offset + n_rows))
+    return pd.DataFrame({'row_id': ids, 'value': [x / 4.0 for x in ids]})
+
+
+def stored_rows(dba):
+    """Return rows of the test table sorted by id."""
+    df = dba.return_data(TEST_TABLE)
+    return df.sort_values('row_id').reset_index(drop=True)
+
+
+def test_load_infile_creates_and_replaces(dba):
+    dba.load_infile(TEST_TABLE, make_rows(50))
+    pd.testing.assert_frame_equal(stored_rows(dba), make_rows(50),
+                                  check_dtype=False)
+
+    dba.replace_rows(TEST_TABLE, make_rows(20, offset=100), infile=True)
+    pd.testing.assert_frame_equal(stored_rows(dba), make_rows(20, offset=100),
+                                  check_dtype=False)
+    assert dba.table_exists(TEST_TABLE + '_stage') is False
+    assert dba.table_exists(TEST_TABLE + '_old') is False
+
+
+def test_load_infile_after_interrupted_swap(dba):
+    dba.load_infile(TEST_TABLE, make_rows(10))
+
+    # old table left behind by a run stopped between rename and drop
+    query = "CREATE TABLE {0}_old LIKE {0}".format(TEST_TABLE)
+    dba.cursor.execute(query)
+
+    dba.load_infile(TEST_TABLE, make_rows(5, offset=10))
+    pd.testing.assert_frame_equal(stored_rows(dba), make_rows(5, offset=10),
+                                  check_dtype=False)
+    assert dba.table_exists(TEST_TABLE + '_old') is False
+
+
+def test_failed_load_drops_stage_table(dba):
+    dba.load_infile(TEST_TABLE, make_rows(10))
+
+    # column missing from the target table makes the load fail
+    bad = make_rows(5).rename(columns={'value': 'missing'})
+    with pytest.raises(Exception):
+        dba.load_infile(TEST_TABLE, bad)
+
+    assert dba.table_exists(TEST_TABLE + '_stage') is False
+    pd.testing.assert_frame_equal(stored_rows(dba), make_rows(10),
+                                  check_dtype=False)